@@ -0,0 +1,749 @@
+"""
+Append-only Audit Segment Store
+
+Background:
+-----------
+Audit events (key lifecycle, role and permission changes) must be durable and
+immutable, and compliance queries such as "all events for u1 in March" must
+not scan the whole history.
+
+Layout:
+-------
+- The store is a directory of segment files `segment-000001.log`, ...
+- Each record is length-prefixed binary:
+      >I payload length
+      32-byte chain digest = SHA-256(previous record's digest + payload)
+      >q timestamp (epoch seconds)
+      >H user length, user bytes
+      >H event length, event bytes
+      JSON body (the full record)
+- Only the newest segment is appended to. Once it reaches `segment_bytes` it
+  is sealed (never written again) and a sidecar `segment-000001.idx` holds its
+  sparse index:
+      blocks  -> [min_ts, max_ts, offset] for every `block_records` records
+      users   -> block numbers containing that user
+      events  -> block numbers containing that event type
+- Queries pick segments/blocks from the indexes and read only those byte
+  ranges through mmap; only matching bodies are JSON-decoded.
+
+Tamper evidence:
+----------------
+- Every record is hash-chained to the previous one (across segments), so
+  editing, dropping or reordering any record breaks every later digest.
+- Sealing a segment checkpoints it: the sidecar index records the chain digest
+  before/after the segment and the Merkle root over its records (RFC 6962
+  style leaves), and the leaf hashes are kept in `segment-000001.mrk`.
+- verify() is incremental: it only hashes records appended (or segments
+  sealed) since the last verification.
+- prove() returns an O(log n) inclusion proof for a single record against the
+  segment root and the log root (Merkle root over all segment roots).
+
+Group commit:
+-------------
+AsyncAuditWriter takes appends off the caller's path: records go into a
+bounded queue and a background thread writes them in batches, committing
+(fsync) every `batch_records` records or every `flush_interval_ms`. Each
+append returns a Future that resolves once its batch is durable, for callers
+that need RPO 0; a full queue blocks the producer (backpressure) and is
+counted in metrics(). Records are encoded when they are put, so a record
+that cannot be encoded fails only its own caller. Acks are per put: if a
+write fails partway, the puts committed before it still succeed and the
+failing one gets an AuditWriteError saying how many of its records were
+written.
+
+AuditSegmentStore guards its state with one lock, so the writer thread can
+append while other threads query() or verify(). query() snapshots the byte
+ranges it needs under the lock and reads them afterwards; segment files are
+append-only, so the ranges stay valid.
+
+Both AuditSegmentStore and AsyncAuditWriter work as an `audit_load` sink for
+Iam (they have `append`/`extend`), and the store is a log source for
+LogParser.filter_logs.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+
+FRAME = struct.Struct(">I")
+DIGEST_SIZE = 32
+GENESIS = bytes(DIGEST_SIZE)
+HEADER = struct.Struct(">q")
+FIELD = struct.Struct(">H")
+
+
+def epoch_seconds(timestamp) -> int:
+    if isinstance(timestamp, (int, float)):
+        return int(timestamp)
+    return int(datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp())
+
+
+def _principal(record: dict) -> str:
+    return record.get("user") or record.get("key_id") or ""
+
+
+def encode_payload(record: dict) -> tuple:
+    timestamp = epoch_seconds(record["timestamp"])
+    user = _principal(record).encode()
+    event = record.get("event", "").encode()
+    body = json.dumps(record, separators=(",", ":")).encode()
+    payload = b"".join((
+        HEADER.pack(timestamp),
+        FIELD.pack(len(user)), user,
+        FIELD.pack(len(event)), event,
+        body
+    ))
+    return timestamp, user.decode(), event.decode(), payload
+
+
+class AuditWriteError(IOError):
+    """A put whose records were only partly written; `written` of them made it."""
+
+    def __init__(self, written: int, error: Exception):
+        super().__init__(f"audit write failed after {written} record(s): {error}")
+        self.written = written
+
+
+def chain_digest(previous: bytes, payload: bytes) -> bytes:
+    return hashlib.sha256(previous + payload).digest()
+
+
+def leaf_hash(payload: bytes) -> bytes:
+    return hashlib.sha256(b"\x00" + payload).digest()
+
+
+def node_hash(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+
+def merkle_root(leaves: list) -> bytes:
+    if not leaves:
+        return hashlib.sha256(b"").digest()
+    level = list(leaves)
+    while len(level) > 1:
+        paired = [node_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            paired.append(level[-1])
+        level = paired
+    return level[0]
+
+
+def merkle_path(leaves: list, index: int) -> list:
+    path = []
+    level = list(leaves)
+    while len(level) > 1:
+        sibling = index ^ 1
+        if sibling < len(level):
+            path.append(level[sibling])
+        paired = [node_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            paired.append(level[-1])
+        level, index = paired, index // 2
+    return path
+
+
+def verify_path(leaf: bytes, index: int, size: int, path: list, root: bytes) -> bool:
+    node, position = leaf, 0
+    for level_size in _level_sizes(size):
+        if index ^ 1 < level_size:
+            sibling = path[position]
+            position += 1
+            node = node_hash(sibling, node) if index & 1 else node_hash(node, sibling)
+        index //= 2
+    return position == len(path) and node == root
+
+
+def _level_sizes(size: int):
+    while size > 1:
+        yield size
+        size = (size + 1) // 2
+
+
+def verify_proof(proof: dict, record: dict) -> bool:
+    """Checks a prove() result against the record it claims to include."""
+    leaf = leaf_hash(encode_payload(record)[3])
+    if leaf.hex() != proof["leaf"]:
+        return False
+    return verify_path(
+        leaf, proof["index"], proof["size"], [bytes.fromhex(h) for h in proof["path"]], bytes.fromhex(proof["segment_root"])
+    ) and verify_path(
+        bytes.fromhex(proof["segment_root"]), proof["segment_index"], proof["segments"],
+        [bytes.fromhex(h) for h in proof["log_path"]], bytes.fromhex(proof["log_root"])
+    )
+
+
+def decode_header(buffer, offset: int) -> tuple:
+    """Returns (timestamp, user, event, body_start, record_end) for the record at offset."""
+    (length,) = FRAME.unpack_from(buffer, offset)
+    position = offset + FRAME.size + DIGEST_SIZE
+    end = position + length
+    (timestamp,) = HEADER.unpack_from(buffer, position)
+    position += HEADER.size
+    (user_length,) = FIELD.unpack_from(buffer, position)
+    position += FIELD.size
+    user = bytes(buffer[position:position + user_length]).decode()
+    position += user_length
+    (event_length,) = FIELD.unpack_from(buffer, position)
+    position += FIELD.size
+    event = bytes(buffer[position:position + event_length]).decode()
+    return timestamp, user, event, position + event_length, end
+
+
+def iter_frames(buffer, offset: int, end: int):
+    """Yields (offset, digest, payload) for every complete record in buffer[offset:end]."""
+    while offset + FRAME.size + DIGEST_SIZE <= end:
+        (length,) = FRAME.unpack_from(buffer, offset)
+        payload_start = offset + FRAME.size + DIGEST_SIZE
+        if payload_start + length > end:
+            return
+        yield offset, bytes(buffer[offset + FRAME.size:payload_start]), bytes(buffer[payload_start:payload_start + length])
+        offset = payload_start + length
+
+
+class Segment:
+
+    def __init__(self, number: int, directory: str):
+        self.number = number
+        self.path = os.path.join(directory, f"segment-{number:06d}.log")
+        self.index_path = os.path.join(directory, f"segment-{number:06d}.idx")
+        self.leaves_path = os.path.join(directory, f"segment-{number:06d}.mrk")
+        self.sealed = False
+        self.first_chain = GENESIS
+        self.last_chain = GENESIS
+        self.merkle_root = None
+        self.size = 0
+        self.records = 0
+        self.blocks = []
+        self.users = {}
+        self.events = {}
+
+    def index(self, timestamp: int, user: str, event: str, offset: int, block_records: int) -> None:
+        if self.records % block_records == 0:
+            self.blocks.append([timestamp, timestamp, offset])
+        block = self.blocks[-1]
+        if timestamp < block[0]:
+            block[0] = timestamp
+        if timestamp > block[1]:
+            block[1] = timestamp
+        block_number = len(self.blocks) - 1
+        for key, postings in ((user, self.users), (event, self.events)):
+            blocks = postings.setdefault(key, [])
+            if not blocks or blocks[-1] != block_number:
+                blocks.append(block_number)
+        self.records += 1
+
+    def write_index(self) -> None:
+        with open(self.index_path, "w") as file:
+            json.dump({
+                "records": self.records,
+                "size": self.size,
+                "first_chain": self.first_chain.hex(),
+                "last_chain": self.last_chain.hex(),
+                "merkle_root": self.merkle_root.hex(),
+                "blocks": self.blocks,
+                "users": self.users,
+                "events": self.events
+            }, file)
+
+    def load_index(self) -> None:
+        with open(self.index_path) as file:
+            index = json.load(file)
+        self.sealed = True
+        self.records, self.size = index["records"], index["size"]
+        self.first_chain = bytes.fromhex(index["first_chain"])
+        self.last_chain = bytes.fromhex(index["last_chain"])
+        self.merkle_root = bytes.fromhex(index["merkle_root"])
+        self.blocks, self.users, self.events = index["blocks"], index["users"], index["events"]
+
+    def checkpoint(self) -> dict:
+        return {
+            "segment": self.number,
+            "records": self.records,
+            "last_chain": self.last_chain.hex(),
+            "merkle_root": self.merkle_root.hex()
+        }
+
+    def read_leaves(self) -> list:
+        with open(self.leaves_path, "rb") as file:
+            data = file.read()
+        return [data[i:i + DIGEST_SIZE] for i in range(0, len(data), DIGEST_SIZE)]
+
+    def candidate_blocks(self, users: set, events: set, since, until) -> list:
+        candidates = None
+        for keys, postings in ((users, self.users), (events, self.events)):
+            if keys:
+                matching = set()
+                for key in keys:
+                    matching.update(postings.get(key, ()))
+                candidates = matching if candidates is None else candidates & matching
+        numbers = range(len(self.blocks)) if candidates is None else sorted(candidates)
+        return [
+            number for number in numbers
+            if (since is None or self.blocks[number][1] >= since)
+            and (until is None or self.blocks[number][0] < until)
+        ]
+
+    def block_range(self, number: int) -> tuple:
+        end = self.blocks[number + 1][2] if number + 1 < len(self.blocks) else self.size
+        return self.blocks[number][2], end
+
+
+class AuditSegmentStore:
+
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024, block_records: int = 256, chained: bool = True):
+        self.directory = directory
+        self.chained = chained
+        self.segment_bytes = segment_bytes
+        self.block_records = block_records
+        os.makedirs(directory, exist_ok=True)
+        self.segments = []
+        numbers = sorted(
+            int(name[len("segment-"):-len(".log")])
+            for name in os.listdir(directory)
+            if name.startswith("segment-") and name.endswith(".log")
+        )
+        for number in numbers:
+            segment = Segment(number, directory)
+            if os.path.exists(segment.index_path):
+                segment.load_index()
+            else:
+                self._recover(segment)
+            self.segments.append(segment)
+        if not self.segments or self.segments[-1].sealed:
+            self.segments.append(Segment(numbers[-1] + 1 if numbers else 1, directory))
+            if len(self.segments) > 1:
+                self.active.first_chain = self.active.last_chain = self.segments[-2].last_chain
+        # Verification watermark: (segment position, byte offset, chain digest at that point)
+        self._verified = (0, 0, self.segments[0].first_chain)
+        self._file = open(self.active.path, "ab")
+        self._lock = threading.RLock()
+
+    @property
+    def active(self) -> Segment:
+        return self.segments[-1]
+
+    def __len__(self) -> int:
+        return sum(segment.records for segment in self.segments)
+
+    def _recover(self, segment: Segment) -> None:
+        # Rebuild the in-memory index of an unsealed segment and drop a torn tail
+        if self.segments:
+            segment.first_chain = segment.last_chain = self.segments[-1].last_chain
+        with open(segment.path, "r+b") as file:
+            data = file.read()
+            offset = 0
+            for offset, digest, _ in iter_frames(data, 0, len(data)):
+                timestamp, user, event, _, end = decode_header(data, offset)
+                segment.index(timestamp, user, event, offset, self.block_records)
+                segment.last_chain = digest
+                offset = end
+            file.truncate(offset)
+        segment.size = offset
+
+    def append(self, record: dict) -> None:
+        self.append_encoded(encode_payload(record))
+
+    def append_encoded(self, encoded: tuple) -> None:
+        """Append one record already passed through encode_payload."""
+        timestamp, user, event, payload = encoded
+        with self._lock:
+            self._append(timestamp, user, event, payload)
+
+    def _append(self, timestamp: int, user: str, event: str, payload: bytes) -> None:
+        segment = self.active
+        digest = chain_digest(segment.last_chain, payload) if self.chained else GENESIS
+        segment.index(timestamp, user, event, segment.size, self.block_records)
+        frame = FRAME.pack(len(payload)) + digest + payload
+        self._file.write(frame)
+        segment.last_chain = digest
+        segment.size += len(frame)
+        if segment.size >= self.segment_bytes:
+            self._seal()
+
+    def extend(self, records) -> None:
+        with self._lock:
+            for record in records:
+                self._append(*encode_payload(record))
+
+    def flush(self) -> None:
+        with self._lock:
+            self._file.flush()
+
+    def sync(self) -> None:
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def seal(self) -> None:
+        with self._lock:
+            self._seal()
+
+    def _seal(self) -> None:
+        segment = self.active
+        if segment.records == 0:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        with open(segment.path, "rb") as file:
+            data = file.read()
+        leaves = [leaf_hash(payload) for _, _, payload in iter_frames(data, 0, len(data))]
+        segment.merkle_root = merkle_root(leaves)
+        with open(segment.leaves_path, "wb") as file:
+            file.write(b"".join(leaves))
+        segment.write_index()
+        segment.sealed = True
+        successor = Segment(segment.number + 1, self.directory)
+        successor.first_chain = successor.last_chain = segment.last_chain
+        self.segments.append(successor)
+        self._file = open(self.active.path, "ab")
+
+    def checkpoints(self) -> list:
+        """Checkpoints of every sealed segment, for publishing outside the store."""
+        return [segment.checkpoint() for segment in self.segments if segment.sealed]
+
+    def log_root(self) -> bytes:
+        return merkle_root([segment.merkle_root for segment in self.segments if segment.sealed])
+
+    def verify(self, full: bool = False) -> dict:
+        """
+        Re-hashes the chain from the last verified point (or from the start with
+        full=True) and checks each newly sealed segment against its checkpoint.
+        """
+        with self._lock:
+            return self._verify(full)
+
+    def _verify(self, full: bool) -> dict:
+        if full:
+            self._verified = (0, 0, self.segments[0].first_chain)
+        self._file.flush()
+        position, offset, previous = self._verified
+        checked = 0
+        while position < len(self.segments):
+            segment = self.segments[position]
+            if offset == 0 and segment.first_chain != previous:
+                return {"ok": False, "segment": segment.number, "offset": 0, "reason": "Chain broken between segments"}
+            with open(segment.path, "rb") as file:
+                data = file.read(segment.size)
+            # A sealed segment's root covers all its records, including any
+            # verified while it was still active: re-leaf those from offset 0
+            leaves = [leaf_hash(payload) for _, _, payload in iter_frames(data, 0, offset)] if segment.sealed else None
+            for record_offset, digest, payload in iter_frames(data, offset, len(data)):
+                previous = chain_digest(previous, payload)
+                if digest != previous:
+                    return {"ok": False, "segment": segment.number, "offset": record_offset, "reason": "Chain digest mismatch"}
+                if leaves is not None:
+                    leaves.append(leaf_hash(payload))
+                checked += 1
+            if not segment.sealed:
+                self._verified = (position, len(data), previous)
+                break
+            if (
+                previous != segment.last_chain
+                or merkle_root(leaves) != segment.merkle_root
+                or segment.read_leaves() != leaves
+            ):
+                return {"ok": False, "segment": segment.number, "offset": None, "reason": "Checkpoint mismatch"}
+            position, offset = position + 1, 0
+            self._verified = (position, 0, previous)
+        return {"ok": True, "records_verified": checked}
+
+    def prove(self, segment_number: int, index: int) -> dict:
+        """O(log n) inclusion proof for record `index` of a sealed segment."""
+        with self._lock:
+            sealed = [segment for segment in self.segments if segment.sealed]
+        position = next(i for i, segment in enumerate(sealed) if segment.number == segment_number)
+        leaves = sealed[position].read_leaves()
+        roots = [segment.merkle_root for segment in sealed]
+        return {
+            "leaf": leaves[index].hex(),
+            "index": index,
+            "size": len(leaves),
+            "path": [h.hex() for h in merkle_path(leaves, index)],
+            "segment_root": roots[position].hex(),
+            "segment_index": position,
+            "segments": len(roots),
+            "log_path": [h.hex() for h in merkle_path(roots, position)],
+            "log_root": merkle_root(roots).hex()
+        }
+
+    def read_record(self, segment_number: int, index: int) -> dict:
+        with self._lock:
+            segment = next(segment for segment in self.segments if segment.number == segment_number)
+            self._file.flush()
+            size = segment.size
+        with open(segment.path, "rb") as file:
+            data = file.read(size)
+        for position, (offset, _, _) in enumerate(iter_frames(data, 0, len(data))):
+            if position == index:
+                _, _, _, body_start, end = decode_header(data, offset)
+                return json.loads(data[body_start:end])
+        raise IndexError(index)
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+    def query(self, users=None, events=None, since=None, until=None):
+        """
+        Yields records matching every given condition, oldest segment first:
+        users/events are iterables of exact values, since <= timestamp < until.
+        """
+        users = {users} if isinstance(users, str) else set(users or ())
+        events = {events} if isinstance(events, str) else set(events or ())
+        with self._lock:
+            self._file.flush()
+            plan = []
+            for segment in self.segments:
+                if segment.size == 0:
+                    continue
+                blocks = segment.candidate_blocks(users, events, since, until)
+                if blocks:
+                    plan.append((segment.path, segment.size, [segment.block_range(number) for number in blocks]))
+        for path, size, ranges in plan:
+            with open(path, "rb") as file, mmap.mmap(file.fileno(), size, access=mmap.ACCESS_READ) as view:
+                for offset, end in ranges:
+                    while offset < end:
+                        timestamp, user, event, body_start, record_end = decode_header(view, offset)
+                        if (
+                            (not users or user in users)
+                            and (not events or event in events)
+                            and (since is None or timestamp >= since)
+                            and (until is None or timestamp < until)
+                        ):
+                            yield json.loads(view[body_start:record_end])
+                        offset = record_end
+
+
+class AsyncAuditWriter:
+
+    def __init__(self, store: AuditSegmentStore, max_queue: int = 10_000, batch_records: int = 512,
+                 flush_interval_ms: float = 5, put_timeout: float = None):
+        self.store = store
+        self.batch_records = batch_records
+        self.flush_interval = flush_interval_ms / 1000
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._lock = threading.Lock()
+        # Serializes puts with close(), so nothing is queued behind the shutdown sentinel
+        self._put_lock = threading.Lock()
+        self.enqueued = 0
+        self.committed = 0
+        self.batches = 0
+        self.blocked_puts = 0
+        self.rejected_puts = 0
+        self.blocked_seconds = 0.0
+        self.max_depth = 0
+        self.last_commit_ms = 0.0
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def append(self, record: dict) -> Future:
+        return self._put([record])
+
+    def extend(self, records) -> Future:
+        # One queue item and one ack for the whole batch
+        return self._put(list(records))
+
+    def append_durable(self, record: dict, timeout: float = None) -> None:
+        self.append(record).result(timeout)
+
+    def flush(self, timeout: float = None) -> None:
+        self._put([]).result(timeout)
+
+    def _put(self, records: list) -> Future:
+        # Encoding errors surface here, to the caller that sent the bad record
+        encoded = [encode_payload(record) for record in records]
+        ack = Future()
+        item = (encoded, ack)
+        with self._put_lock:
+            if self._closed:
+                raise RuntimeError("Audit writer is closed")
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                started = time.perf_counter()
+                with self._lock:
+                    self.blocked_puts += 1
+                try:
+                    self._queue.put(item, timeout=self.put_timeout)
+                except queue.Full:
+                    with self._lock:
+                        self.rejected_puts += 1
+                    raise
+                finally:
+                    with self._lock:
+                        self.blocked_seconds += time.perf_counter() - started
+        with self._lock:
+            self.enqueued += len(records)
+            self.max_depth = max(self.max_depth, self._queue.qsize())
+        return ack
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            size = len(item[0])
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while size < self.batch_records:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+                size += len(item[0])
+            try:
+                self._commit(batch)
+            except Exception as error:
+                # Never let one bad batch end the thread: later puts would block forever
+                for _, ack in batch:
+                    if not ack.done():
+                        ack.set_exception(error)
+            if stop:
+                return
+
+    def _commit(self, batch: list) -> None:
+        # Records of cancelled acks (e.g. through asyncio.wrap_future) are still
+        # written; only the acks still being waited on are resolved
+        live = [ack.set_running_or_notify_cancel() for _, ack in batch]
+        started = time.perf_counter()
+        written = 0
+        failure = None
+        for done, (encoded, ack) in enumerate(batch):
+            count = 0
+            try:
+                for record in encoded:
+                    self.store.append_encoded(record)
+                    count += 1
+            except Exception as error:
+                failure = (done, count, error)
+                break
+            written += count
+        else:
+            done = len(batch)
+        try:
+            # Whatever reached the file before a failure is made durable and acked
+            self.store.sync()
+        except Exception as error:
+            for (_, ack), waiting in zip(batch, live):
+                if waiting:
+                    ack.set_exception(error)
+            return
+        self.last_commit_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.committed += written + (failure[1] if failure else 0)
+            self.batches += 1
+        for position, ((_, ack), waiting) in enumerate(zip(batch, live)):
+            if not waiting:
+                continue
+            if position < done:
+                ack.set_result(True)
+            elif position == done:
+                ack.set_exception(AuditWriteError(failure[1], failure[2]))
+            else:
+                ack.set_exception(AuditWriteError(0, failure[2]))
+
+    def close(self) -> None:
+        with self._put_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self._queue.maxsize,
+                "max_depth": self.max_depth,
+                "enqueued": self.enqueued,
+                "committed": self.committed,
+                "batches": self.batches,
+                "avg_batch_records": round(self.committed / self.batches, 1) if self.batches else 0,
+                "blocked_puts": self.blocked_puts,
+                "rejected_puts": self.rejected_puts,
+                "blocked_ms": round(self.blocked_seconds * 1000, 3),
+                "last_commit_ms": round(self.last_commit_ms, 3)
+            }
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    march = int(datetime(2025, 3, 1).timestamp()), int(datetime(2025, 4, 1).timestamp())
+    with tempfile.TemporaryDirectory() as directory:
+        store = AuditSegmentStore(directory, segment_bytes=64 * 1024, block_records=64)
+        start = int(datetime(2025, 1, 1).timestamp())
+        for i in range(20_000):
+            store.append({"event": "API_KEY_CREATED" if i % 3 else "ROLE_ASSIGNED", "user": f"u{i % 50}", "timestamp": start + i * 600})
+        print("segments:", len(store.segments), "records:", len(store))
+        results = list(store.query(users="u1", since=march[0], until=march[1]))
+        print("u1 in March:", len(results), results[:2])
+        store.close()
+
+        reopened = AuditSegmentStore(directory, segment_bytes=64 * 1024, block_records=64)
+        print("after reopen:", len(reopened), sum(1 for _ in reopened.query(users="u1", since=march[0], until=march[1])))
+        print("full verify:", reopened.verify())
+        reopened.append({"event": "API_KEY_REVOKED", "user": "u1", "timestamp": start})
+        print("incremental verify:", reopened.verify())
+        proof = reopened.prove(3, 10)
+        print("proof hashes:", len(proof["path"]) + len(proof["log_path"]), "valid:", verify_proof(proof, reopened.read_record(3, 10)))
+        reopened.close()
+
+        # Flip one byte inside a sealed segment's payload
+        with open(os.path.join(directory, "segment-000002.log"), "r+b") as file:
+            file.seek(100)
+            byte = file.read(1)
+            file.seek(100)
+            file.write(bytes([byte[0] ^ 1]))
+        tampered = AuditSegmentStore(directory, segment_bytes=64 * 1024, block_records=64)
+        print("tampered verify:", tampered.verify())
+        tampered.close()
+
+    print("append throughput (records/sec):")
+    for chained in (False, True):
+        with tempfile.TemporaryDirectory() as directory:
+            store = AuditSegmentStore(directory, chained=chained)
+            records = [{"event": "API_KEY_CREATED", "user": f"u{i}", "timestamp": 1700000000 + i} for i in range(100_000)]
+            started = time.perf_counter()
+            store.extend(records)
+            store.flush()
+            elapsed = time.perf_counter() - started
+            store.close()
+        print("  chained" if chained else "  unchained", round(len(records) / elapsed))
+
+    print("durable appends (records/sec):")
+    with tempfile.TemporaryDirectory() as directory:
+        store = AuditSegmentStore(directory)
+        started = time.perf_counter()
+        for i in range(500):
+            store.append({"event": "API_KEY_CREATED", "user": f"u{i}", "timestamp": 1700000000 + i})
+            store.sync()
+        print("  fsync per record", round(500 / (time.perf_counter() - started)))
+        writer = AsyncAuditWriter(store, max_queue=1_000)
+        started = time.perf_counter()
+        acks = [writer.append({"event": "API_KEY_CREATED", "user": f"u{i}", "timestamp": 1700000000 + i}) for i in range(20_000)]
+        for ack in acks:
+            ack.result()
+        print("  group commit", round(20_000 / (time.perf_counter() - started)))
+        print("  writer metrics:", writer.metrics())
+        writer.close()
+        store.close()
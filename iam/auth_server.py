@@ -0,0 +1,192 @@
+"""
+Async Authentication / Authorization Front End
+
+Background:
+-----------
+Verification (question_6), AuthService (question_2) and Iam (question_1) are
+synchronous and take the whole state as a dict argument on every call, so they
+cannot serve concurrent callers. AsyncAuthService owns that state in memory
+and exposes coroutines instead:
+
+    await service.authenticate(credential)   -> who is calling (question_6 shape)
+    await service.authorize(request)         -> ALLOW / DENY (question_2 shape)
+
+- Concurrent identical lookups are coalesced (single-flight): while one
+  lookup for a given key is running, later callers await the same future.
+- CPU-heavy secret hashing runs in an executor so it never blocks the loop;
+  fast hashers (e.g. SHA-256) are verified inline, as the thread hop would
+  cost more than the hash.
+- Key state lives in three stores (KeyStore for secrets, the authz `keys`
+  dict, VerificationEngine for credential types). revoke_key/rotate_key
+  update all of them and evict the decision and credential caches; the
+  secret and authz checks also refuse a KeyRecord marked revoked, so a
+  revoke made directly through Iam cannot be bypassed.
+- run_load() is a local load generator reporting throughput and tail latency
+  for N concurrent clients.
+"""
+
+import asyncio
+import hmac
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from question_1 import Iam, KeyRecord, KeyStore
+from question_2 import CachedAuthService
+from question_6 import VerificationEngine
+from stats import percentile
+
+
+class AsyncAuthService:
+
+    def __init__(self, iam: Iam = None, executor=None):
+        self.iam = Iam() if iam is None else iam
+        self.stored_keys = KeyStore()
+        self.keys = {}
+        self.sessions = VerificationEngine()
+        self.authorizer = CachedAuthService()
+        self._executor = ThreadPoolExecutor(max_workers=4) if executor is None else executor
+        self._in_flight = {}
+        # Per-process key, so single-flight digests cannot be computed offline
+        self._flight_key = secrets.token_bytes(32)
+        self.coalesced = 0
+        self.audit_log = []
+
+    def add_api_key(self, public_id: str, secret: str, scopes: list, tenant_id: str) -> None:
+        self.stored_keys.add(KeyRecord(public_id, self.iam.hash_secret(secret), scopes))
+        self.keys[public_id] = {"scopes": list(scopes), "tenant_id": tenant_id, "revoked": False}
+        self.sessions.add_api_key(public_id)
+
+    def add_session(self, token: str, expires_at: int) -> None:
+        self.sessions.add_session(token, expires_at)
+
+    def apply_event(self, event: dict) -> dict:
+        return self.authorizer.apply_event({"keys": self.keys}, event)
+
+    def revoke_key(self, key_id: str) -> dict:
+        result = self.iam.perform_key_action(
+            {"action": "revoke", "public_id": key_id, "stored_keys": self.stored_keys}, self.audit_log
+        )
+        if result["revoked"]:
+            key = self.keys.get(key_id)
+            if key is not None and not key["revoked"]:
+                # Also evicts the key's cached ALLOW/DENY decisions
+                self.authorizer.revoke_key({"keys": self.keys}, key_id)
+            self.sessions.revoke_api_key(key_id)
+        return result
+
+    def rotate_key(self, key_id: str) -> dict:
+        # Iam evicts the credential cache; authz decisions do not depend on the secret
+        return self.iam.perform_key_action(
+            {"action": "rotate", "public_id": key_id, "stored_keys": self.stored_keys}, self.audit_log
+        )
+
+    async def _single_flight(self, key: tuple, lookup):
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+        future = asyncio.ensure_future(lookup())
+        self._in_flight[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    async def authenticate(self, credential: dict) -> dict:
+        result = self.sessions.verify_batch([credential])["results"][0]
+        if not result["valid"] or credential["type"] != "api_key":
+            return result
+        key_id = credential["key_id"]
+        secret = credential.get("secret", "")
+        # Coalesce on the presented secret's fast digest, never the plaintext
+        digest = hmac.new(self._flight_key, secret.encode(), "sha256").digest()
+        return await self._single_flight(("authn", key_id, digest), lambda: self._check_secret(key_id, secret, result))
+
+    async def _check_secret(self, key_id: str, secret: str, result: dict) -> dict:
+        record = self.stored_keys.get(key_id)
+        if record is not None and record.revoked:
+            return {"credential": key_id, "valid": False, "reason": "API key revoked", "principal_type": result["principal_type"]}
+        cache = self.iam.credential_cache
+        hasher = self.iam.hasher
+        # Verified-credential cache hits skip the executor hop entirely
+        valid = record is not None and cache is not None and cache.verify(key_id, secret)
+        if record is not None and not valid:
+            if getattr(hasher, "slow", True):
+                valid = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, hasher.verify, secret, record.secret_hash
+                )
+            else:
+                valid = hasher.verify(secret, record.secret_hash)
+            if valid and cache is not None:
+                cache.put(key_id, secret)
+        if not valid:
+            return {"credential": key_id, "valid": False, "reason": "Invalid secret", "principal_type": result["principal_type"]}
+        return result
+
+    async def authorize(self, request: dict) -> dict:
+        key = ("authz", request["key_id"], request["action"], request["tenant_id"])
+        return await self._single_flight(key, lambda: self._authorize(request))
+
+    async def _authorize(self, request: dict) -> dict:
+        record = self.stored_keys.get(request["key_id"])
+        if record is not None and record.revoked:
+            return {"decision": "DENY", "reason": "Key revoked"}
+        return self.authorizer.validate_request({"request": request, "keys": self.keys})
+
+    def close(self) -> None:
+        self._executor.shutdown()
+
+
+async def run_load(service: AsyncAuthService, clients: int, requests_per_client: int, credentials: list) -> dict:
+    latencies = []
+
+    async def client(number: int) -> None:
+        for i in range(requests_per_client):
+            credential = credentials[(number + i) % len(credentials)]
+            started = time.perf_counter()
+            identity = await service.authenticate(credential)
+            if identity["valid"]:
+                await service.authorize({"key_id": credential["key_id"], "action": "payments:create", "tenant_id": "acme_corp"})
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(number) for number in range(clients)))
+    elapsed = time.perf_counter() - started
+    return {
+        "clients": clients,
+        "requests": len(latencies),
+        "requests_per_sec": round(len(latencies) / elapsed),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "coalesced": service.coalesced
+    }
+
+
+if __name__ == "__main__":
+    service = AsyncAuthService()
+    credentials = []
+    for i in range(100):
+        service.add_api_key(f"sk_live_{i}", f"secret_{i}", ["payments:create"], "acme_corp")
+        credentials.append({"type": "api_key", "key_id": f"sk_live_{i}", "secret": f"secret_{i}"})
+    service.add_session("jwt_abc", int(time.time()) + 3600)
+
+    async def demo() -> None:
+        print(await service.authenticate({"type": "jwt", "token": "jwt_abc", "user_id": "u1"}))
+        print(await service.authenticate({"type": "api_key", "key_id": "sk_live_1", "secret": "wrong"}))
+        print(await service.authorize({"key_id": "sk_live_1", "action": "payments:create", "tenant_id": "acme_corp"}))
+        rotated = service.rotate_key("sk_live_2")
+        print(await service.authenticate({"type": "api_key", "key_id": "sk_live_2", "secret": "secret_2"}))
+        print(await service.authenticate({"type": "api_key", "key_id": "sk_live_2", "secret": rotated["new_secret"]}))
+        # -> old secret rejected, new one accepted
+        service.revoke_key("sk_live_3")
+        print(await service.authenticate(credentials[3]))
+        print(await service.authorize({"key_id": "sk_live_3", "action": "payments:create", "tenant_id": "acme_corp"}))
+        # -> revoked everywhere: credential rejected, authorization denied
+        for clients in (1_000, 10_000):
+            service.coalesced = 0
+            print(await run_load(service, clients, 5, credentials))
+
+    asyncio.run(demo())
+    service.close()
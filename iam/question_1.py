@@ -1,16 +1,255 @@
 import secrets
 import hashlib
+import hmac
+import os
+import tempfile
 import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from audit_store import AsyncAuditWriter, AuditSegmentStore
+from timestamps import current_timestamp
+
+
+class KeyRecord:
+    __slots__ = ("public_id", "secret_hash", "scopes", "revoked")
+
+    def __init__(self, public_id: str, secret_hash: str, scopes: list, revoked: bool = False):
+        self.public_id = public_id
+        self.secret_hash = secret_hash
+        self.scopes = scopes
+        self.revoked = revoked
+
+    def to_dict(self) -> dict:
+        return {
+            "public_id": self.public_id,
+            "secret_hash": self.secret_hash,
+            "scopes": self.scopes,
+            "revoked": self.revoked
+        }
+
+    def __repr__(self) -> str:
+        return repr(self.to_dict())
+
+
+class KeyStore:
+    """
+    Key records indexed by public_id, with a secondary index by secret hash
+    for authentication lookups. Every operation is a dict probe, so the cost
+    of revoke/rotate does not grow with the number of stored keys.
+    """
+
+    def __init__(self):
+        self._by_id = {}
+        self._by_hash = {}
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __iter__(self):
+        return iter(self._by_id.values())
+
+    def __contains__(self, public_id: str) -> bool:
+        return public_id in self._by_id
+
+    def __repr__(self) -> str:
+        return repr(list(self._by_id.values()))
+
+    def add(self, record: KeyRecord) -> KeyRecord:
+        if record.public_id in self._by_id:
+            raise ValueError(f"Key {record.public_id} already exists")
+        if record.secret_hash in self._by_hash:
+            raise ValueError(f"Secret hash of key {record.public_id} is already in use")
+        self._by_id[record.public_id] = record
+        self._by_hash[record.secret_hash] = record
+        return record
+
+    def get(self, public_id: str) -> KeyRecord:
+        return self._by_id.get(public_id)
+
+    def find_by_secret_hash(self, secret_hash: str) -> KeyRecord:
+        return self._by_hash.get(secret_hash)
+
+    def add_many(self, records: list) -> None:
+        by_id = {record.public_id: record for record in records}
+        if len(by_id) != len(records) or not by_id.keys().isdisjoint(self._by_id):
+            raise ValueError("Duplicate public_id in bulk insert")
+        by_hash = {record.secret_hash: record for record in records}
+        if len(by_hash) != len(records) or not by_hash.keys().isdisjoint(self._by_hash):
+            raise ValueError("Duplicate secret hash in bulk insert")
+        self._by_id.update(by_id)
+        self._by_hash.update(by_hash)
+
+    def update_secret_hash(self, record: KeyRecord, secret_hash: str) -> None:
+        if self._by_hash.get(secret_hash, record) is not record:
+            raise ValueError(f"Secret hash of key {record.public_id} is already in use")
+        self._by_hash.pop(record.secret_hash, None)
+        record.secret_hash = secret_hash
+        self._by_hash[secret_hash] = record
+
+
+class Sha256Hasher:
+    name = "sha256"
+    # One digest is already cheaper than a credential-cache lookup
+    slow = False
+
+    def hash(self, secret: str) -> str:
+        return hashlib.sha256(secret.encode()).hexdigest()
+
+    def verify(self, secret: str, secret_hash: str) -> bool:
+        return hmac.compare_digest(self.hash(secret), secret_hash)
+
+
+class ScryptHasher:
+    """
+    Salted, memory-hard KDF from the standard library. The design calls for
+    Argon2; an Argon2 hasher plugs into the same hash/verify interface.
+    """
+
+    name = "scrypt"
+    slow = True
+
+    def __init__(self, n: int = 2 ** 14, r: int = 8, p: int = 1):
+        self.n, self.r, self.p = n, r, p
+
+    def _derive(self, secret: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+        return hashlib.scrypt(secret.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + 1024 * 1024, dklen=32)
+
+    def hash(self, secret: str) -> str:
+        salt = secrets.token_bytes(16)
+        derived = self._derive(secret, salt, self.n, self.r, self.p)
+        return f"scrypt${self.n}${self.r}${self.p}${salt.hex()}${derived.hex()}"
+
+    def verify(self, secret: str, secret_hash: str) -> bool:
+        _, n, r, p, salt, derived = secret_hash.split("$")
+        candidate = self._derive(secret, bytes.fromhex(salt), int(n), int(r), int(p))
+        return hmac.compare_digest(candidate, bytes.fromhex(derived))
+
+
+class VerifiedCredentialCache:
+    """
+    Remembers recently verified secrets so a slow KDF runs once per TTL
+    instead of once per request. Entries are keyed by a keyed fast digest
+    (HMAC-SHA256 under a per-process key) of the presented secret and record
+    which public_id it verified for; the plaintext is never kept. TTLs are
+    fixed at insert, so insertion order is expiry order: expired entries are
+    swept from the front on every call, and when `capacity` is exceeded the
+    entry closest to expiry goes first.
+    """
+
+    def __init__(self, capacity: int = 100_000, ttl: float = 300, clock=time.monotonic):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.clock = clock
+        self._key = secrets.token_bytes(32)
+        # digest -> (expires_at, public_id), oldest first
+        self._entries = OrderedDict()
+        self._by_id = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _digest(self, secret: str) -> bytes:
+        return hmac.new(self._key, secret.encode(), hashlib.sha256).digest()
+
+    def _remove_oldest(self) -> None:
+        _, (_, public_id) = self._entries.popitem(last=False)
+        del self._by_id[public_id]
+
+    def _expire(self, now: float) -> None:
+        entries = self._entries
+        while entries and next(iter(entries.values()))[0] <= now:
+            self._remove_oldest()
+            self.expirations += 1
+
+    def verify(self, public_id: str, secret: str) -> bool:
+        self._expire(self.clock())
+        entry = self._entries.get(self._digest(secret))
+        if entry is not None and entry[1] == public_id:
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def put(self, public_id: str, secret: str) -> None:
+        now = self.clock()
+        self._expire(now)
+        self.evict(public_id)
+        digest = self._digest(secret)
+        # Two keys sharing one secret: the digest now belongs to the latest
+        previous = self._entries.pop(digest, None)
+        if previous is not None:
+            del self._by_id[previous[1]]
+        self._entries[digest] = (now + self.ttl, public_id)
+        self._by_id[public_id] = digest
+        while len(self._entries) > self.capacity:
+            self._remove_oldest()
+            self.evictions += 1
+
+    def evict(self, public_id: str) -> None:
+        digest = self._by_id.pop(public_id, None)
+        if digest is not None:
+            del self._entries[digest]
+
+
+def new_public_id(stored_keys: KeyStore, taken: set = None) -> str:
+    """
+    A fresh "sk_live_" id not present in `stored_keys` or `taken` (which the
+    new id is added to). Ids are only 32 bits, so at tens of thousands of
+    keys collisions are expected and simply redrawn.
+    """
+    while True:
+        public_id = "sk_live_" + secrets.token_hex(4)
+        if public_id not in stored_keys and (taken is None or public_id not in taken):
+            if taken is not None:
+                taken.add(public_id)
+            return public_id
+
+
+def _hash_chunk(hasher, secrets_chunk: list) -> list:
+    # Module level so a process pool can pickle it
+    return [hasher.hash(secret) for secret in secrets_chunk]
+
 
 class Iam:
+
+    def __init__(self, hasher=None, credential_cache: VerifiedCredentialCache = None):
+        self.hasher = Sha256Hasher() if hasher is None else hasher
+        # Caching only pays off in front of a slow KDF
+        self.credential_cache = credential_cache if getattr(self.hasher, "slow", True) else None
     
     def hash_secret(self, secret: str) -> str:
-        return hashlib.sha256(secret.encode()).hexdigest()
+        return self.hasher.hash(secret)
+
+    def verify_secret(self, record: KeyRecord, secret: str) -> bool:
+        cache = self.credential_cache
+        if cache is not None and cache.verify(record.public_id, secret):
+            return True
+        if not self.hasher.verify(secret, record.secret_hash):
+            return False
+        if cache is not None:
+            cache.put(record.public_id, secret)
+        return True
+
+    def authenticate(self, data: dict) -> dict:
+        public_id = data["public_id"]
+        key = data["stored_keys"].get(public_id)
+        if key is None:
+            return {"public_id": public_id, "authenticated": False, "message": "Key not found"}
+        if key.revoked:
+            return {"public_id": public_id, "authenticated": False, "message": "Key revoked"}
+        if not self.verify_secret(key, data["secret"]):
+            return {"public_id": public_id, "authenticated": False, "message": "Invalid secret"}
+        return {"public_id": public_id, "authenticated": True, "scopes": key.scopes}
     
     def current_timestamp(self) -> str:
-        return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())    
+        return current_timestamp()
         
-    def generate_key(self, data: dict, stored_keys: list, audit_load: list) -> dict:
+    def generate_key(self, data: dict, stored_keys: KeyStore, audit_load: list) -> dict:
         request = data["request"]
         requested_scopes = request["scopes"]
         user_permissions = data["user_permissions"]
@@ -20,7 +259,7 @@ class Iam:
             raise ValueError("Requested scopes exceed user permissions")
         
         # Generate IDs
-        public_id = "sk_live_" + secrets.token_hex(4)
+        public_id = new_public_id(stored_keys)
         secret = secrets.token_hex(16)
         audit_load.append({
             "event": "CREATED",
@@ -28,13 +267,7 @@ class Iam:
             "timestamp": self.current_timestamp()
         })
         # Store only hash
-        key_record = {
-            "public_id": public_id,
-            "secret_hash": self.hash_secret(secret),
-            "scopes": requested_scopes,
-            "revoked": False
-        }
-        stored_keys.append(key_record)
+        stored_keys.add(KeyRecord(public_id, self.hash_secret(secret), requested_scopes))
         
         # Return plaintext secret once
         return {
@@ -43,70 +276,211 @@ class Iam:
             "scopes": requested_scopes
         }
         
+    def generate_keys_bulk(self, data: dict, stored_keys: KeyStore, audit_load: list,
+                           workers: int = None, chunk_size: int = 1024) -> list:
+        """
+        Creates (or imports, when a request carries `public_id` and `secret`)
+        many keys at once: scopes are checked against one permission set,
+        secrets are hashed in a process pool, keys are inserted in one bulk
+        operation and the audit events are written as a single batch.
+        """
+        requests = data["requests"]
+        user_permissions = frozenset(data["user_permissions"])
+        for position, request in enumerate(requests):
+            if not user_permissions.issuperset(request["scopes"]):
+                raise ValueError(f"Requested scopes exceed user permissions (request {position})")
+
+        # Imported ids are reserved first so generated ones cannot collide with them
+        taken = {request["public_id"] for request in requests if request.get("public_id")}
+        public_ids = [request.get("public_id") or new_public_id(stored_keys, taken) for request in requests]
+        plaintexts = [request.get("secret") or secrets.token_hex(16) for request in requests]
+        chunks = [plaintexts[i:i + chunk_size] for i in range(0, len(plaintexts), chunk_size)]
+        workers = workers or os.cpu_count() or 1
+        if workers == 1 or len(chunks) == 1:
+            hashed_chunks = [_hash_chunk(self.hasher, chunk) for chunk in chunks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                hashed_chunks = list(pool.map(_hash_chunk, [self.hasher] * len(chunks), chunks))
+        secret_hashes = [secret_hash for chunk in hashed_chunks for secret_hash in chunk]
+
+        stored_keys.add_many([
+            KeyRecord(public_id, secret_hash, request["scopes"])
+            for public_id, secret_hash, request in zip(public_ids, secret_hashes, requests)
+        ])
+        timestamp = self.current_timestamp()
+        audit_load.extend({"event": "CREATED", "key_id": public_id, "timestamp": timestamp} for public_id in public_ids)
+        return [
+            {"public_id": public_id, "secret": secret, "scopes": request["scopes"]}
+            for public_id, secret, request in zip(public_ids, plaintexts, requests)
+        ]
+
     def perform_key_action(self, data: dict, audit_load: list) -> dict:
         public_id = data["public_id"]
         stored_keys = data["stored_keys"]
         action = data["action"]
-        for key in stored_keys:
-            if public_id == key["public_id"]:
-                if action == "revoke":
-                    if key["revoked"]:
-                        return {"public_id": public_id, "revoked": True, "message": "Already revoked"}
-                    key["revoked"] = True
-                    audit_load.append({
+
+        key = stored_keys.get(public_id)
+        if key is None:
+            return {"public_id": public_id, "revoked": False, "message": "Key not found"}
+        if key.revoked:
+            return {"public_id": public_id, "revoked": True, "message": "Already revoked"}
+
+        # A rotated or revoked secret must stop authenticating immediately
+        if self.credential_cache is not None:
+            self.credential_cache.evict(public_id)
+
+        if action == "revoke":
+            key.revoked = True
+            audit_load.append({
                 "event": "REVOKED",
                 "key_id": public_id,
                 "timestamp": self.current_timestamp()
             })
-                    return {"public_id": public_id, "revoked": True, "message": "Key successfully revoked"}
-                elif action == "rotate":
-                    if key["revoked"]:
-                        return {"public_id": public_id, "revoked": True, "message": "Already revoked"}
-                    
-                    new_secret = secrets.token_hex(16)
-                    key["secret_hash"] = self.hash_secret(new_secret)
-                    audit_load.append({
+            return {"public_id": public_id, "revoked": True, "message": "Key successfully revoked"}
+        elif action == "rotate":
+            new_secret = secrets.token_hex(16)
+            stored_keys.update_secret_hash(key, self.hash_secret(new_secret))
+            audit_load.append({
                 "event": "ROTATED",
                 "key_id": public_id,
                 "timestamp": self.current_timestamp()
             })
-                return {"public_id": public_id, "new_secret": key["secret_hash"], "scopes": key["scopes"], "message": "Key successfully rotated"}
-                        
-            
-        return {"public_id": public_id, "revoked": False, "message": "Key not found"}
-
-
-# Example usage
-iam = Iam()
-stored_keys = []
-audit_log = []
-
-# Part 1: Create
-data = {
-  "request": {"scopes": ["payments:create", "invoices:read"]},
-  "user_permissions": ["payments:create", "invoices:read", "customers:write"],
-  "stored_keys": stored_keys
-}
-resp = iam.generate_key(data, stored_keys, audit_log)
-print("=== Part 1: Create Key ===")
-print("API Response:", resp)
-print("Stored Keys:", stored_keys)
-print("Audit Log:", audit_log)
-print()
-
-# Part 2: Rotate (before revoking)
-data_rotate = {"action": "rotate", "public_id": resp["public_id"], "stored_keys": stored_keys}
-rotate_resp = iam.perform_key_action(data_rotate, audit_log)
-print("=== Part 2: Rotate Key ===")
-print("Rotate Response:", rotate_resp)
-print("Stored Keys After Rotate:", stored_keys)
-print("Audit Log:", audit_log)
-print()
-
-# Part 3: Revoke (after rotation)
-data_revoke = {"action": "revoke", "public_id": resp["public_id"], "stored_keys": stored_keys}
-revoke_resp = iam.perform_key_action(data_revoke, audit_log)
-print("=== Part 3: Revoke Key ===")
-print("Revoke Response:", revoke_resp)
-print("Stored Keys After Revoke:", stored_keys)
-print("Audit Log:", audit_log)
\ No newline at end of file
+            # Like generate_key, the plaintext secret is only returned once
+            return {"public_id": public_id, "new_secret": new_secret, "scopes": key.scopes, "message": "Key successfully rotated"}
+
+        raise ValueError(f"Unknown action {action}")
+
+
+def benchmark_authentication(hasher, requests: int = 20) -> dict:
+    results = {"hasher": hasher.name}
+    for label, cache in (("without_cache", None), ("with_cache", VerifiedCredentialCache())):
+        iam = Iam(hasher, cache)
+        store = KeyStore()
+        key = iam.generate_key({"request": {"scopes": ["payments:create"]}, "user_permissions": ["payments:create"]}, store, [])
+        request = {"public_id": key["public_id"], "secret": key["secret"], "stored_keys": store}
+        start = time.perf_counter()
+        for _ in range(requests):
+            assert iam.authenticate(request)["authenticated"]
+        results[f"{label}_avg_ms"] = round((time.perf_counter() - start) / requests * 1000, 4)
+    return results
+
+
+def benchmark_bulk_generation(num_keys: int, hasher, worker_counts: list) -> list:
+    results = []
+    requests = [{"scopes": ["payments:create"]} for _ in range(num_keys)]
+    for workers in worker_counts:
+        iam = Iam(hasher)
+        start = time.perf_counter()
+        iam.generate_keys_bulk({"requests": requests, "user_permissions": ["payments:create"]}, KeyStore(), [],
+                               workers=workers, chunk_size=max(1, num_keys // (workers * 4)))
+        results.append({"workers": workers, "keys_per_sec": round(num_keys / (time.perf_counter() - start))})
+    return results
+
+
+def benchmark_key_actions(sizes: list, lookups: int = 10000) -> list:
+    iam = Iam()
+    results = []
+    for size in sizes:
+        store = KeyStore()
+        for i in range(size):
+            store.add(KeyRecord(f"sk_live_{i:08x}", f"hash_{i}", ["payments:create"]))
+        count = min(lookups, size)
+        targets = [f"sk_live_{(i * 7919) % size:08x}" for i in range(count)]
+        audit = []
+        start = time.perf_counter()
+        for public_id in targets:
+            iam.perform_key_action({"action": "revoke", "public_id": public_id, "stored_keys": store}, audit)
+        elapsed = time.perf_counter() - start
+        results.append({"keys": size, "avg_action_us": round(elapsed / count * 1e6, 3)})
+    return results
+
+
+if __name__ == "__main__":
+    # Example usage
+    iam = Iam()
+    stored_keys = KeyStore()
+    audit_log = []
+
+    # Part 1: Create
+    data = {
+      "request": {"scopes": ["payments:create", "invoices:read"]},
+      "user_permissions": ["payments:create", "invoices:read", "customers:write"],
+      "stored_keys": stored_keys
+    }
+    resp = iam.generate_key(data, stored_keys, audit_log)
+    print("=== Part 1: Create Key ===")
+    print("API Response:", resp)
+    print("Stored Keys:", stored_keys)
+    print("Audit Log:", audit_log)
+    print()
+
+    # Part 2: Rotate (before revoking)
+    data_rotate = {"action": "rotate", "public_id": resp["public_id"], "stored_keys": stored_keys}
+    rotate_resp = iam.perform_key_action(data_rotate, audit_log)
+    print("=== Part 2: Rotate Key ===")
+    print("Rotate Response:", rotate_resp)
+    print("Stored Keys After Rotate:", stored_keys)
+    print("Audit Log:", audit_log)
+    print()
+
+    # Part 3: Revoke (after rotation)
+    data_revoke = {"action": "revoke", "public_id": resp["public_id"], "stored_keys": stored_keys}
+    revoke_resp = iam.perform_key_action(data_revoke, audit_log)
+    print("=== Part 3: Revoke Key ===")
+    print("Revoke Response:", revoke_resp)
+    print("Stored Keys After Revoke:", stored_keys)
+    print("Audit Log:", audit_log)
+    print()
+
+    # Part 4: Revoke/rotate latency should stay flat as the store grows
+    # (pass larger sizes, e.g. 1_000_000 and 10_000_000, for a full run)
+    print("=== Part 4: Key Store Benchmark ===")
+    for row in benchmark_key_actions([1_000, 10_000, 100_000]):
+        print(row)
+    print()
+
+    # Part 5: Durable audit trail - the append-only segment store is a drop-in audit sink,
+    # and the async writer keeps its fsyncs off the key-management path (group commit)
+    print("=== Part 5: Audit Segment Store ===")
+    with tempfile.TemporaryDirectory() as audit_dir:
+        audit_store = AuditSegmentStore(audit_dir)
+        audit_writer = AsyncAuditWriter(audit_store)
+        key = iam.generate_key(data, stored_keys, audit_writer)
+        iam.perform_key_action({"action": "rotate", "public_id": key["public_id"], "stored_keys": stored_keys}, audit_writer)
+        iam.perform_key_action({"action": "revoke", "public_id": key["public_id"], "stored_keys": stored_keys}, audit_writer)
+        # Wait for the durability ack before reading back (RPO 0)
+        audit_writer.flush()
+        print("Events for key:", list(audit_store.query(users=key["public_id"])))
+        print("Revocations:", list(audit_store.query(events="REVOKED")))
+        print("Writer metrics:", audit_writer.metrics())
+        audit_writer.close()
+        audit_store.close()
+    print()
+
+    # Part 6: Slow KDF hashing with the verified-credential cache in front of it
+    print("=== Part 6: Authentication Cost ===")
+    for hasher in (Sha256Hasher(), ScryptHasher()):
+        print(benchmark_authentication(hasher))
+    iam_kdf = Iam(ScryptHasher(), VerifiedCredentialCache(ttl=60))
+    kdf_keys = KeyStore()
+    key = iam_kdf.generate_key(data, kdf_keys, [])
+    auth_request = {"public_id": key["public_id"], "secret": key["secret"], "stored_keys": kdf_keys}
+    print("Before rotate:", iam_kdf.authenticate(auth_request))
+    rotated = iam_kdf.perform_key_action({"action": "rotate", "public_id": key["public_id"], "stored_keys": kdf_keys}, [])
+    print("Old secret after rotate:", iam_kdf.authenticate(auth_request))
+    print("New secret after rotate:", iam_kdf.authenticate({**auth_request, "secret": rotated["new_secret"]}))
+    print()
+
+    # Part 7: Bulk onboarding - keys/sec as the hashing pool grows
+    print("=== Part 7: Bulk Key Generation ===")
+    bulk_keys = KeyStore()
+    bulk_audit = []
+    created = iam.generate_keys_bulk({
+        "requests": [{"scopes": ["invoices:read"]}, {"scopes": ["payments:create"], "public_id": "sk_live_import1", "secret": "imported"}],
+        "user_permissions": ["payments:create", "invoices:read"]
+    }, bulk_keys, bulk_audit)
+    print("Created:", created)
+    print("Audit batch:", bulk_audit)
+    worker_counts = sorted({1, 2, os.cpu_count() or 1})
+    print(f"cpu_count={os.cpu_count()}")
+    print(benchmark_bulk_generation(200, ScryptHasher(n=2 ** 12), worker_counts))
@@ -31,15 +31,255 @@ Inputs:
 - keys: dictionary of key metadata (scopes, tenant_id, revoked flag)
 - events: dictionary describing permission changes (REVOKE or GRANT)
 
+Scopes are compiled into an integer bitmask per key (`scope_mask`) through a
+shared PermissionRegistry, so the scope check is a single AND instead of a
+list search. The `scopes` list is kept alongside it for readability.
+
+For gateways that batch checks, validate_requests_bulk decides many requests
+at once from columnar inputs over an array-backed KeyTable and returns a
+compact decision array plus reason codes; reason strings are only built when
+asked for.
+
+CachedAuthService puts a bounded L1 decision cache (LRU + per-entry TTL, with
+shorter-lived negative caching for DENY) in front of validate_request and
+evicts the affected entries as soon as apply_event updates a key.
+
+PermissionEventConsumer consumes sequence-numbered events from a queue
+(InMemoryEventQueue stands in for Kafka) in micro-batches, dropping stale or
+duplicate redeliveries per key so reordering cannot corrupt the final state.
+
+SnapshotAuthService keeps the key state as an immutable, versioned
+AuthSnapshot for thread-pool deployments: readers take the current snapshot
+reference without a lock, while the (serialized) writer copies only the one
+shard a change touches and publishes the next version with a single reference
+assignment.
+
 Outputs:
 --------
 - validate_request returns a decision: ALLOW or DENY with reason.
 - apply_event updates key scopes and returns status: updated or ignored with reason.
 """
 
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+REASON_ALLOWED = 0
+REASON_KEY_NOT_FOUND = 1
+REASON_TENANT_MISMATCH = 2
+REASON_KEY_REVOKED = 3
+REASON_NOT_IN_SCOPES = 4
+
+
+class PermissionRegistry:
+    """
+    Interns every `resource:action` string to a bit position, so a key's scopes
+    can be held as a single integer mask and checked with one AND.
+    """
+
+    def __init__(self):
+        self._bits = {}
+        self._names = []
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def bit(self, permission: str) -> int:
+        bit = self._bits.get(permission)
+        if bit is None:
+            bit = 1 << len(self._names)
+            self._bits[permission] = bit
+            self._names.append(permission)
+        return bit
+
+    def lookup(self, permission: str) -> int:
+        # Hot path: unknown permissions map to 0 instead of being interned
+        return self._bits.get(permission, 0)
+
+    def position(self, permission: str) -> int:
+        return self.lookup(permission).bit_length() - 1
+
+    def name(self, position: int) -> str:
+        return self._names[position]
+
+    def mask(self, permissions: list) -> int:
+        mask = 0
+        for permission in permissions:
+            mask |= self.bit(permission)
+        return mask
+
+    def names(self, mask: int) -> list:
+        return [name for position, name in enumerate(self._names) if mask >> position & 1]
+
+
+# Key dicts cache their compiled `scope_mask`, so every service sharing those
+# dicts must share the bit assignments too
+DEFAULT_REGISTRY = PermissionRegistry()
+
+
+class KeyTable:
+    """
+    Column-oriented copy of the `keys` dict: one row per key, with the tenant
+    (interned to an int), revoked flag and scope mask held in parallel arrays.
+
+    Actions and tenants a batch names that the table does not know get
+    negative ids (-1, -2, ...) so reasons can still quote them. For the bulk
+    check, each row's tenant and the code it yields per action (revoked,
+    allowed, not in scopes) are also kept as lookup columns, built lazily per
+    action and patched on upsert. Each ends in one sentinel entry, so row -1
+    (key not found) lands on it and fails the tenant check.
+    """
+
+    def __init__(self, registry: PermissionRegistry):
+        self.registry = registry
+        self.rows = {}
+        self.key_ids = []
+        self.tenants = {}
+        self.tenant_names = []
+        self.tenant_of = array("i")
+        self.revoked = bytearray()
+        self.masks = []
+        self.unknown = {}
+        self.unknown_names = []
+        self.key_tenants = [None]
+        self._action_codes = {}
+
+    def tenant_id(self, tenant: str) -> int:
+        return self.tenants.get(tenant, -1)
+
+    def unknown_id(self, name: str) -> int:
+        unknown_id = self.unknown.get(name)
+        if unknown_id is None:
+            unknown_id = self.unknown[name] = -1 - len(self.unknown_names)
+            self.unknown_names.append(name)
+        return unknown_id
+
+    def unknown_name(self, unknown_id: int) -> str:
+        return self.unknown_names[-1 - unknown_id]
+
+    def _row_code(self, row: int, action: int) -> int:
+        if self.revoked[row]:
+            return REASON_KEY_REVOKED
+        return REASON_ALLOWED if action >= 0 and self.masks[row] >> action & 1 else REASON_NOT_IN_SCOPES
+
+    def action_codes(self, action: int) -> bytearray:
+        # Unknown actions all share one column
+        action = max(action, -1)
+        codes = self._action_codes.get(action)
+        if codes is None:
+            codes = bytearray(self._row_code(row, action) for row in range(len(self.key_ids)))
+            codes.append(REASON_KEY_NOT_FOUND)
+            self._action_codes[action] = codes
+        return codes
+
+    def _intern_tenant(self, tenant: str) -> int:
+        tenant_id = self.tenants.get(tenant)
+        if tenant_id is None:
+            tenant_id = self.tenants[tenant] = len(self.tenant_names)
+            self.tenant_names.append(tenant)
+        return tenant_id
+
+    def load(self, keys: dict) -> "KeyTable":
+        for key_id, key_info in keys.items():
+            self.upsert(key_id, key_info)
+        return self
+
+    def upsert(self, key_id: str, key_info: dict) -> None:
+        mask = key_info.get("scope_mask")
+        if mask is None:
+            mask = self.registry.mask(key_info["scopes"])
+        tenant = self._intern_tenant(key_info["tenant_id"])
+        row = self.rows.get(key_id)
+        if row is None:
+            self.rows[key_id] = len(self.key_ids)
+            self.key_ids.append(key_id)
+            self.tenant_of.append(tenant)
+            self.revoked.append(bool(key_info["revoked"]))
+            self.masks.append(mask)
+            # New rows go just before the sentinels
+            self.key_tenants.insert(-1, tenant)
+            for action, codes in self._action_codes.items():
+                codes.insert(-1, self._row_code(len(self.key_ids) - 1, action))
+        else:
+            self.tenant_of[row] = tenant
+            self.revoked[row] = bool(key_info["revoked"])
+            self.masks[row] = mask
+            self.key_tenants[row] = tenant
+            for action, codes in self._action_codes.items():
+                codes[row] = self._row_code(row, action)
+
+    def encode_requests(self, requests: list) -> tuple:
+        rows, tenants, position, unknown_id = self.rows, self.tenants, self.registry.position, self.unknown_id
+        key_rows = array("i", [rows.get(request["key_id"], -1) for request in requests])
+        action_ids = array("i", [
+            action_id if action_id >= 0 else unknown_id(request["action"])
+            for request in requests
+            for action_id in (position(request["action"]),)
+        ])
+        tenant_ids = array("i", [
+            tenants.get(request["tenant_id"]) if request["tenant_id"] in tenants else unknown_id(request["tenant_id"])
+            for request in requests
+        ])
+        return key_rows, action_ids, tenant_ids
+
+
+class BulkDecisions:
+
+    def __init__(self, table: KeyTable, codes: bytes, key_rows, action_ids, tenant_ids):
+        self.table = table
+        self.codes = codes
+        # 1 = ALLOW, 0 = DENY
+        self.decisions = codes.translate(_ALLOW_IF_ZERO)
+        self._inputs = (key_rows, action_ids, tenant_ids)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def decision(self, index: int) -> str:
+        return "ALLOW" if self.decisions[index] else "DENY"
+
+    def reason(self, index: int) -> str:
+        key_rows, action_ids, tenant_ids = self._inputs
+        table, code = self.table, self.codes[index]
+        action_id = action_ids[index]
+        action = table.registry.name(action_id) if action_id >= 0 else table.unknown_name(action_id)
+        if code == REASON_KEY_NOT_FOUND:
+            return "Key not found"
+        if code == REASON_TENANT_MISMATCH:
+            tenant_id = tenant_ids[index]
+            requested = table.tenant_names[tenant_id] if tenant_id >= 0 else table.unknown_name(tenant_id)
+            owner = table.tenant_names[table.tenant_of[key_rows[index]]]
+            return f"Tenant mismatch: key belongs to {owner} but request is for {requested}"
+        if code == REASON_KEY_REVOKED:
+            return "Key revoked"
+        if code == REASON_NOT_IN_SCOPES:
+            return f"Action {action} not in scopes granted to key"
+        return f"Action {action} is in key scopes"
+
+    def to_dicts(self) -> list:
+        return [{"decision": self.decision(i), "reason": self.reason(i)} for i in range(len(self))]
+
+
+_ALLOW_IF_ZERO = bytes([1] + [0] * 255)
+
 
 class AuthService:
-    
+
+    def __init__(self, registry: PermissionRegistry = None):
+        self.registry = DEFAULT_REGISTRY if registry is None else registry
+
+    def scope_mask(self, key: dict) -> int:
+        mask = key.get("scope_mask")
+        if mask is None:
+            mask = key["scope_mask"] = self.registry.mask(key["scopes"])
+        return mask
+
+    def _refresh_table(self, data: dict, key_id: str, key: dict) -> None:
+        table = data.get("key_table")
+        if table is not None:
+            table.upsert(key_id, key)
+
     def apply_event(self, data: dict, events: dict) -> dict:
         keys = data["keys"]
         event_key_id = events["key_id"]
@@ -49,21 +289,29 @@ class AuthService:
         if event_key_id in keys:
             key = keys[event_key_id]
             revoked = key["revoked"]
-            scopes = key["scopes"]
             if revoked:
                 return  {"status": "ignored", "message" :"key already revoled"}
+            mask = self.scope_mask(key)
+            # Only a GRANT interns a new permission; checks use the non-interning lookup
+            bit = self.registry.lookup(permission)
             if event == "REVOKE":
-                if permission in scopes:
-                    keys[event_key_id]["scopes"].remove(permission)
+                if mask & bit:
+                    key["scope_mask"] = mask & ~bit
+                    key["scopes"].remove(permission)
+                    self._refresh_table(data, event_key_id, key)
                     return {"status": "updated", "reason": f"Revoked {permission}"}
                 else:
                     return {"status": "ignored", "reason": f"Permission {permission} as not there"}
             elif event == "GRANT": 
-                if permission not in scopes:
-                    keys[event_key_id]["scopes"].append(permission)
+                if not mask & bit:
+                    key["scope_mask"] = mask | self.registry.bit(permission)
+                    key["scopes"].append(permission)
+                    self._refresh_table(data, event_key_id, key)
                     return {"status": "updated", "reason": f"Added {permission}"}
                 else:
                     return {"status": "ignored", "reason": f"Permission {permission} already there"}
+            return {"status": "ignored", "reason": f"Unknown event {event}"}
+        return {"status": "ignored", "reason": "Key not found"}
                           
     def validate_request(self, data: dict) -> dict:
         request = data["request"]
@@ -77,7 +325,6 @@ class AuthService:
             return {"decision": "DENY", "reason": "Key not found"}
         
         key_info = keys[key_id]
-        scopes = key_info["scopes"]
         revoked = key_info["revoked"]
         tenant_id_in_key = key_info["tenant_id"]
         
@@ -90,7 +337,7 @@ class AuthService:
         if revoked:
             return {"decision": "DENY", "reason": "Key revoked"}
         
-        if action not in scopes:
+        if not self.scope_mask(key_info) & self.registry.lookup(action):
             return {
                 "decision": "DENY",
                 "reason": f"Action {action} not in scopes granted to key"
@@ -98,73 +345,644 @@ class AuthService:
         
         return {"decision": "ALLOW", "reason": f"Action {action} is in key scopes"}
 
+    def build_key_table(self, keys: dict) -> KeyTable:
+        return KeyTable(self.registry).load(keys)
+
+    def validate_requests_bulk(self, table: KeyTable, key_rows, action_ids, tenant_ids) -> BulkDecisions:
+        # Same checks and order as validate_request. Revoked/scope codes are
+        # precomputed per action, so each request costs two column lookups;
+        # row -1 hits the sentinels (tenant None, code "key not found").
+        key_tenants = table.key_tenants
+        columns = {action: table.action_codes(action) for action in set(action_ids)}
+        codes = bytes([
+            columns[action][row] if key_tenants[row] == tenant
+            else REASON_TENANT_MISMATCH if row >= 0
+            else REASON_KEY_NOT_FOUND
+            for row, action, tenant in zip(key_rows, action_ids, tenant_ids)
+        ])
+        return BulkDecisions(table, codes, key_rows, action_ids, tenant_ids)
+
+
+class DecisionCache:
+    """
+    Bounded local decision cache: LRU eviction at `capacity`, per-entry TTL,
+    and a separate (usually shorter) TTL for cached DENY decisions.
+    """
+
+    def __init__(self, capacity: int = 10_000, ttl: float = 300, negative_ttl: float = 30, clock=time.monotonic):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._by_key = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, cache_key: tuple) -> dict:
+        entry = self._entries.get(cache_key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, decision = entry
+        if expires_at <= self.clock():
+            self._remove(cache_key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(cache_key)
+        self.hits += 1
+        return decision
+
+    def put(self, cache_key: tuple, decision: dict) -> None:
+        ttl = self.ttl if decision["decision"] == "ALLOW" else self.negative_ttl
+        if ttl <= 0:
+            return
+        if cache_key in self._entries:
+            self._entries.move_to_end(cache_key)
+        else:
+            self._by_key.setdefault(cache_key[0], set()).add(cache_key)
+        self._entries[cache_key] = (self.clock() + ttl, decision)
+        while len(self._entries) > self.capacity:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate(self, key_id: str, action: str = None) -> int:
+        cache_keys = self._by_key.get(key_id)
+        if not cache_keys:
+            return 0
+        stale = [cache_key for cache_key in cache_keys if action is None or cache_key[1] == action]
+        for cache_key in stale:
+            self._remove(cache_key)
+        self.invalidations += len(stale)
+        return len(stale)
+
+    def _remove(self, cache_key: tuple) -> None:
+        del self._entries[cache_key]
+        cache_keys = self._by_key[cache_key[0]]
+        cache_keys.discard(cache_key)
+        if not cache_keys:
+            del self._by_key[cache_key[0]]
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations
+        }
+
+
+class CachedAuthService(AuthService):
+
+    def __init__(self, cache: DecisionCache = None, registry: PermissionRegistry = None):
+        super().__init__(registry)
+        self.cache = DecisionCache() if cache is None else cache
+
+    def validate_request(self, data: dict) -> dict:
+        request = data["request"]
+        cache_key = (request["key_id"], request["action"], request["tenant_id"])
+        decision = self.cache.get(cache_key)
+        if decision is None:
+            decision = super().validate_request(data)
+            self.cache.put(cache_key, decision)
+        return decision
+
+    def apply_event(self, data: dict, events: dict) -> dict:
+        result = super().apply_event(data, events)
+        if result and result["status"] == "updated":
+            # GRANT can turn a cached DENY into ALLOW and REVOKE the reverse
+            self.cache.invalidate(events["key_id"], events["permission"])
+        return result
+
+    def revoke_key(self, data: dict, key_id: str) -> None:
+        data["keys"][key_id]["revoked"] = True
+        self._refresh_table(data, key_id, data["keys"][key_id])
+        self.cache.invalidate(key_id)
+
+
+class InMemoryEventQueue:
+    """Local stand-in for the Kafka topic: an append-only log read by offset."""
+
+    def __init__(self):
+        self._log = []
+        self._lock = threading.Lock()
+
+    @property
+    def end_offset(self) -> int:
+        return len(self._log)
+
+    def publish(self, event: dict) -> int:
+        with self._lock:
+            self._log.append(event)
+            return len(self._log) - 1
+
+    def poll(self, offset: int, max_records: int) -> list:
+        with self._lock:
+            return self._log[offset:offset + max_records]
+
+
+class PermissionEventConsumer:
+    """
+    Applies GRANT/REVOKE events in micro-batches. Every event carries a per-key
+    sequence number (`seq`); anything at or below the last applied sequence
+    for that key is a duplicate or stale redelivery and is dropped in O(1), so
+    GRANT(1), REVOKE(2), GRANT(1 again) ends with the permission revoked.
+    Each touched key gets one scope_mask/scopes update (and one cache or key
+    table refresh) per batch, however many events it received. Sequence
+    numbers and counters are staged per batch and only merged once the batch
+    is applied, so a batch that fails is redelivered whole. An event missing
+    a field (or with the wrong type) is skipped and counted as malformed.
+    """
+
+    def __init__(self, service: AuthService, data: dict, events: InMemoryEventQueue, batch_size: int = 500):
+        self.service = service
+        self.data = data
+        self.events = events
+        self.batch_size = batch_size
+        self.committed_offset = 0
+        self._last_seq = {}
+        self.applied = 0
+        self.dropped_duplicate = 0
+        self.dropped_stale = 0
+        self.ignored = 0
+        self.malformed = 0
+        self.batches = 0
+        self.last_batch_ms = 0.0
+
+    @staticmethod
+    def _well_formed(event) -> bool:
+        return (
+            isinstance(event, dict)
+            and isinstance(event.get("key_id"), str)
+            and isinstance(event.get("seq"), int)
+            and isinstance(event.get("event"), str)
+            and isinstance(event.get("permission"), str)
+        )
+
+    def poll_once(self) -> int:
+        batch = self.events.poll(self.committed_offset, self.batch_size)
+        if not batch:
+            return 0
+        started = time.perf_counter()
+        keys, registry, last_seq = self.data["keys"], self.service.registry, self._last_seq
+        pending = {}
+        staged_seq = {}
+        counts = {"applied": 0, "dropped_duplicate": 0, "dropped_stale": 0, "ignored": 0, "malformed": 0}
+        for event in batch:
+            if not self._well_formed(event):
+                counts["malformed"] += 1
+                continue
+            key_id, seq = event["key_id"], event["seq"]
+            key = keys.get(key_id)
+            if key is None or key["revoked"] or event["event"] not in ("GRANT", "REVOKE"):
+                counts["ignored"] += 1
+                continue
+            previous = staged_seq.get(key_id, last_seq.get(key_id, -1))
+            if seq <= previous:
+                counts["dropped_duplicate" if seq == previous else "dropped_stale"] += 1
+                continue
+            staged_seq[key_id] = seq
+            mask = pending.get(key_id)
+            if mask is None:
+                mask = self.service.scope_mask(key)
+            if event["event"] == "GRANT":
+                pending[key_id] = mask | registry.bit(event["permission"])
+            else:
+                pending[key_id] = mask & ~registry.lookup(event["permission"])
+            counts["applied"] += 1
+
+        cache = getattr(self.service, "cache", None)
+        for key_id, mask in pending.items():
+            key = keys[key_id]
+            previous = key["scope_mask"]
+            if mask != previous:
+                key["scope_mask"] = mask
+                # Edit the caller's list in place: existing order is kept and
+                # the cost follows the bits that changed, not the registry size
+                scopes = key["scopes"]
+                for changed, update in ((previous & ~mask, scopes.remove), (mask & ~previous, scopes.append)):
+                    while changed:
+                        low = changed & -changed
+                        update(registry.name(low.bit_length() - 1))
+                        changed ^= low
+                self.service._refresh_table(self.data, key_id, key)
+                if cache is not None:
+                    cache.invalidate(key_id)
+        last_seq.update(staged_seq)
+        for name, count in counts.items():
+            setattr(self, name, getattr(self, name) + count)
+        self.committed_offset += len(batch)
+        self.batches += 1
+        self.last_batch_ms = (time.perf_counter() - started) * 1000
+        return len(batch)
+
+    def drain(self) -> int:
+        total = 0
+        while True:
+            consumed = self.poll_once()
+            if not consumed:
+                return total
+            total += consumed
+
+    def metrics(self) -> dict:
+        return {
+            "committed_offset": self.committed_offset,
+            "end_offset": self.events.end_offset,
+            "lag": self.events.end_offset - self.committed_offset,
+            "applied": self.applied,
+            "dropped_duplicate": self.dropped_duplicate,
+            "dropped_stale": self.dropped_stale,
+            "ignored": self.ignored,
+            "malformed": self.malformed,
+            "batches": self.batches,
+            "last_batch_ms": round(self.last_batch_ms, 3)
+        }
+
+
+class KeyState:
+    """Immutable per-key authorization state; changes produce a new instance."""
+
+    __slots__ = ("tenant_id", "revoked", "scope_mask")
+
+    def __init__(self, tenant_id: str, revoked: bool, scope_mask: int):
+        self.tenant_id = tenant_id
+        self.revoked = revoked
+        self.scope_mask = scope_mask
+
+    def replace(self, **changes) -> "KeyState":
+        return KeyState(
+            changes.get("tenant_id", self.tenant_id),
+            changes.get("revoked", self.revoked),
+            changes.get("scope_mask", self.scope_mask)
+        )
+
+
+class AuthSnapshot:
+    """
+    One version of the key state, split over a fixed number of shard dicts.
+    A snapshot is never modified once published: with_keys copies the shard
+    tuple and only the shards holding changed keys, and shares the rest.
+    """
+
+    __slots__ = ("version", "shards")
+
+    def __init__(self, version: int, shards: tuple):
+        self.version = version
+        self.shards = shards
+
+    @classmethod
+    def build(cls, states: dict, num_shards: int = 256) -> "AuthSnapshot":
+        shards = [{} for _ in range(num_shards)]
+        for key_id, state in states.items():
+            shards[hash(key_id) % num_shards][key_id] = state
+        return cls(0, tuple(shards))
+
+    def get(self, key_id: str) -> KeyState:
+        return self.shards[hash(key_id) % len(self.shards)].get(key_id)
+
+    def with_keys(self, changes: dict) -> "AuthSnapshot":
+        shards = list(self.shards)
+        copied = set()
+        for key_id, state in changes.items():
+            index = hash(key_id) % len(shards)
+            if index not in copied:
+                shards[index] = dict(shards[index])
+                copied.add(index)
+            shards[index][key_id] = state
+        return AuthSnapshot(self.version + 1, tuple(shards))
+
+
+class SnapshotAuthService:
+    """
+    Lock-free reads over copy-on-write state. validate_request reads
+    self._snapshot once and works on that version only, so a check never sees
+    a half-applied event. Writers serialize on a lock, build the next version
+    and publish it by rebinding self._snapshot, which is atomic.
+    """
+
+    def __init__(self, keys: dict, registry: PermissionRegistry = None, num_shards: int = 256):
+        self.registry = DEFAULT_REGISTRY if registry is None else registry
+        states = {
+            key_id: KeyState(key["tenant_id"], key["revoked"], self.registry.mask(key["scopes"]))
+            for key_id, key in keys.items()
+        }
+        self._snapshot = AuthSnapshot.build(states, num_shards)
+        self._write_lock = threading.Lock()
+
+    @property
+    def snapshot(self) -> AuthSnapshot:
+        return self._snapshot
+
+    def scopes(self, key_id: str) -> list:
+        state = self._snapshot.get(key_id)
+        return None if state is None else self.registry.names(state.scope_mask)
+
+    def validate_request(self, request: dict) -> dict:
+        state = self._snapshot.get(request["key_id"])
+        action = request["action"]
+        tenant_id = request["tenant_id"]
+        if state is None:
+            return {"decision": "DENY", "reason": "Key not found"}
+        if state.tenant_id != tenant_id:
+            return {
+                "decision": "DENY",
+                "reason": f"Tenant mismatch: key belongs to {state.tenant_id} but request is for {tenant_id}"
+            }
+        if state.revoked:
+            return {"decision": "DENY", "reason": "Key revoked"}
+        if not state.scope_mask & self.registry.lookup(action):
+            return {"decision": "DENY", "reason": f"Action {action} not in scopes granted to key"}
+        return {"decision": "ALLOW", "reason": f"Action {action} is in key scopes"}
+
+    def apply_event(self, event: dict) -> dict:
+        return self.apply_events([event])[0]
+
+    def apply_events(self, events: list) -> list:
+        """Apply a batch of events and publish them as one new version."""
+        with self._write_lock:
+            snapshot = self._snapshot
+            changes = {}
+            results = []
+            for event in events:
+                key_id, permission = event["key_id"], event["permission"]
+                state = changes.get(key_id) or snapshot.get(key_id)
+                if state is None:
+                    results.append({"status": "ignored", "reason": "Key not found"})
+                    continue
+                if state.revoked:
+                    results.append({"status": "ignored", "message": "key already revoled"})
+                    continue
+                bit = self.registry.lookup(permission)
+                if event["event"] == "REVOKE":
+                    if not state.scope_mask & bit:
+                        results.append({"status": "ignored", "reason": f"Permission {permission} as not there"})
+                        continue
+                    changes[key_id] = state.replace(scope_mask=state.scope_mask & ~bit)
+                    results.append({"status": "updated", "reason": f"Revoked {permission}"})
+                elif event["event"] == "GRANT":
+                    if state.scope_mask & bit:
+                        results.append({"status": "ignored", "reason": f"Permission {permission} already there"})
+                        continue
+                    changes[key_id] = state.replace(scope_mask=state.scope_mask | self.registry.bit(permission))
+                    results.append({"status": "updated", "reason": f"Added {permission}"})
+                else:
+                    results.append({"status": "ignored", "reason": f"Unknown event {event['event']}"})
+            if changes:
+                self._snapshot = snapshot.with_keys(changes)
+            return results
+
+    def revoke_key(self, key_id: str) -> None:
+        with self._write_lock:
+            state = self._snapshot.get(key_id)
+            if state is not None and not state.revoked:
+                self._snapshot = self._snapshot.with_keys({key_id: state.replace(revoked=True)})
+
+
+def benchmark_concurrent_reads(num_keys: int = 10_000, readers: int = 4, duration: float = 1.0,
+                               events_per_sec: int = 10) -> dict:
+    actions = ["payments:create", "invoices:read", "customers:write", "refunds:create"]
+    keys = {
+        f"sk_live_{i}": {"scopes": actions[: 1 + i % 3], "tenant_id": f"tenant_{i % 100}", "revoked": False}
+        for i in range(num_keys)
+    }
+    requests = [
+        {"key_id": f"sk_live_{i}", "action": actions[i % 4], "tenant_id": f"tenant_{i % 100}"}
+        for i in range(num_keys)
+    ]
+
+    def run(with_writer: bool) -> dict:
+        service = SnapshotAuthService(keys)
+        stop = threading.Event()
+        counts = [0] * readers
+
+        def reader(slot: int) -> None:
+            validate = service.validate_request
+            chunk = requests[slot::readers][:1000]
+            done = 0
+            while not stop.is_set():
+                for request in chunk:
+                    validate(request)
+                done += len(chunk)
+            counts[slot] = done
+
+        def writer() -> None:
+            i = 0
+            while not stop.wait(1 / events_per_sec):
+                service.apply_event({
+                    "event": "GRANT" if i % 2 == 0 else "REVOKE",
+                    "key_id": f"sk_live_{i % num_keys}",
+                    "permission": "refunds:create"
+                })
+                i += 1
+
+        threads = [threading.Thread(target=reader, args=(slot,)) for slot in range(readers)]
+        if with_writer:
+            threads.append(threading.Thread(target=writer))
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return {"reads_per_sec": round(sum(counts) / duration), "version": service.snapshot.version}
+
+    idle = run(False)
+    loaded = run(True)
+    return {
+        "readers": readers,
+        "reads_per_sec_no_writes": idle["reads_per_sec"],
+        "reads_per_sec_with_writes": loaded["reads_per_sec"],
+        "versions_published": loaded["version"],
+        "ratio": round(loaded["reads_per_sec"] / idle["reads_per_sec"], 2)
+    }
+
+
+def benchmark_bulk_validation(num_keys: int = 10_000, num_requests: int = 200_000) -> dict:
+    """
+    Compare validate_request in a loop with validate_requests_bulk.
+
+    "speedup" times a warm bulk call on already-encoded columns: around 8x
+    on CPython 3.11 (6-10x across runs), short of the 10x target.
+    "end_to_end_speedup" also counts encode_requests and the first
+    (column-building) batch, which is what a caller holding request dicts
+    pays. Encoding dominates there and the gain drops to 1.2-3x, so the bulk
+    path only pays off when callers keep requests in encoded columns.
+    """
+    service = AuthService()
+    actions = ["payments:create", "invoices:read", "customers:write", "refunds:create"]
+    keys = {
+        f"sk_live_{i}": {"scopes": actions[: 1 + i % 3], "tenant_id": f"tenant_{i % 100}", "revoked": i % 50 == 0}
+        for i in range(num_keys)
+    }
+    requests = [
+        {"key_id": f"sk_live_{i % (num_keys + 10)}", "action": actions[i % 4], "tenant_id": f"tenant_{i % (num_keys + 10) % 100}"}
+        for i in range(num_requests)
+    ]
+    start = time.perf_counter()
+    for request in requests:
+        service.validate_request({"request": request, "keys": keys})
+    per_request = time.perf_counter() - start
+
+    table = service.build_key_table(keys)
+    # The first batch on a fresh table also builds the per-action code columns
+    start = time.perf_counter()
+    columns = table.encode_requests(requests)
+    encoded = time.perf_counter()
+    service.validate_requests_bulk(table, *columns)
+    end_to_end = time.perf_counter() - start
+    first = time.perf_counter() - encoded
+    start = time.perf_counter()
+    result = service.validate_requests_bulk(table, *columns)
+    bulk = time.perf_counter() - start
+    return {
+        "requests": num_requests,
+        "per_request_checks_per_sec": round(num_requests / per_request),
+        "first_bulk_checks_per_sec": round(num_requests / first),
+        "bulk_checks_per_sec": round(num_requests / bulk),
+        "end_to_end_checks_per_sec": round(num_requests / end_to_end),
+        "speedup": round(per_request / bulk, 1),
+        "end_to_end_speedup": round(per_request / end_to_end, 1),
+        "allowed": sum(result.decisions)
+    }
+
                  
 
-auth_service = AuthService()
+if __name__ == "__main__":
+    auth_service = AuthService()
 
-# Base state: one active key
-data = {
-  "request": {"key_id": "sk_live_abc", "action": "payments:create", "tenant_id": "acme_corp"},
-  "keys": {
-    "sk_live_abc": {
-      "scopes": ["payments:create", "invoices:read"],
-      "tenant_id": "acme_corp",
-      "revoked": False
+    # Base state: one active key
+    data = {
+      "request": {"key_id": "sk_live_abc", "action": "payments:create", "tenant_id": "acme_corp"},
+      "keys": {
+        "sk_live_abc": {
+          "scopes": ["payments:create", "invoices:read"],
+          "tenant_id": "acme_corp",
+          "revoked": False
+        }
+      }
     }
-  }
-}
-
-print("=== Initial Allow ===")
-print(auth_service.validate_request(data))
-# -> ALLOW
-
-print("\n=== Action Not in Scopes ===")
-req = {"request": {"key_id": "sk_live_abc", "action": "customers:write", "tenant_id": "acme_corp"}, "keys": data["keys"]}
-print(auth_service.validate_request(req))
-# -> DENY (action not in scopes)
-
-print("\n=== Tenant Mismatch ===")
-req = {"request": {"key_id": "sk_live_abc", "action": "payments:create", "tenant_id": "beta_inc"}, "keys": data["keys"]}
-print(auth_service.validate_request(req))
-# -> DENY (tenant mismatch)
-
-print("\n=== Revoke Key ===")
-data["keys"]["sk_live_abc"]["revoked"] = True
-print(auth_service.validate_request(data))
-# -> DENY (key revoked)
-
-# Reset revoked state for event testing
-data["keys"]["sk_live_abc"]["revoked"] = False
-
-print("\n=== Apply REVOKE Event (payments:create) ===")
-event1 = {"event": "REVOKE", "key_id": "sk_live_abc", "permission": "payments:create"}
-print(auth_service.apply_event(data, event1))
-
-print("\n=== Check After REVOKE Event ===")
-print(auth_service.validate_request(data))
-# -> DENY
-
-print("\n=== Apply REVOKE Event Again (idempotency) ===")
-print(auth_service.apply_event(data, event1))
-# -> ignored (was not there)
-
-print("\n=== Apply GRANT Event (customers:write) ===")
-event2 = {"event": "GRANT", "key_id": "sk_live_abc", "permission": "customers:write"}
-print(auth_service.apply_event(data, event2))
-# -> updated (added customers:write)
-
-print("\n=== Check After GRANT Event ===")
-req = {"request": {"key_id": "sk_live_abc", "action": "customers:write", "tenant_id": "acme_corp"}, "keys": data["keys"]}
-print(auth_service.validate_request(req))
-# -> ALLOW
-
-print("\n=== Apply GRANT Event Again (idempotency) ===")
-print(auth_service.apply_event(data, event2))
-# -> ignored (already present)
-
-print("\n=== Apply Event for Nonexistent Key ===")
-event3 = {"event": "GRANT", "key_id": "sk_live_xyz", "permission": "payments:create"}
-print(auth_service.apply_event(data, event3))
-# -> ignored (key not found)
-
-             
\ No newline at end of file
+
+    print("=== Initial Allow ===")
+    print(auth_service.validate_request(data))
+    # -> ALLOW
+
+    print("\n=== Action Not in Scopes ===")
+    req = {"request": {"key_id": "sk_live_abc", "action": "customers:write", "tenant_id": "acme_corp"}, "keys": data["keys"]}
+    print(auth_service.validate_request(req))
+    # -> DENY (action not in scopes)
+
+    print("\n=== Tenant Mismatch ===")
+    req = {"request": {"key_id": "sk_live_abc", "action": "payments:create", "tenant_id": "beta_inc"}, "keys": data["keys"]}
+    print(auth_service.validate_request(req))
+    # -> DENY (tenant mismatch)
+
+    print("\n=== Revoke Key ===")
+    data["keys"]["sk_live_abc"]["revoked"] = True
+    print(auth_service.validate_request(data))
+    # -> DENY (key revoked)
+
+    # Reset revoked state for event testing
+    data["keys"]["sk_live_abc"]["revoked"] = False
+
+    print("\n=== Apply REVOKE Event (payments:create) ===")
+    event1 = {"event": "REVOKE", "key_id": "sk_live_abc", "permission": "payments:create"}
+    print(auth_service.apply_event(data, event1))
+
+    print("\n=== Check After REVOKE Event ===")
+    print(auth_service.validate_request(data))
+    # -> DENY
+
+    print("\n=== Apply REVOKE Event Again (idempotency) ===")
+    print(auth_service.apply_event(data, event1))
+    # -> ignored (was not there)
+
+    print("\n=== Apply GRANT Event (customers:write) ===")
+    event2 = {"event": "GRANT", "key_id": "sk_live_abc", "permission": "customers:write"}
+    print(auth_service.apply_event(data, event2))
+    # -> updated (added customers:write)
+
+    print("\n=== Check After GRANT Event ===")
+    req = {"request": {"key_id": "sk_live_abc", "action": "customers:write", "tenant_id": "acme_corp"}, "keys": data["keys"]}
+    print(auth_service.validate_request(req))
+    # -> ALLOW
+
+    print("\n=== Apply GRANT Event Again (idempotency) ===")
+    print(auth_service.apply_event(data, event2))
+    # -> ignored (already present)
+
+    print("\n=== Apply Event for Nonexistent Key ===")
+    event3 = {"event": "GRANT", "key_id": "sk_live_xyz", "permission": "payments:create"}
+    print(auth_service.apply_event(data, event3))
+    # -> ignored (key not found)
+
+    print("\n=== Cached Decisions ===")
+    cached_service = CachedAuthService(DecisionCache(capacity=2, ttl=300, negative_ttl=5))
+    allow_req = {"request": {"key_id": "sk_live_abc", "action": "customers:write", "tenant_id": "acme_corp"}, "keys": data["keys"]}
+    deny_req = {"request": {"key_id": "sk_live_abc", "action": "payments:create", "tenant_id": "acme_corp"}, "keys": data["keys"]}
+    print(cached_service.validate_request(allow_req))
+    print(cached_service.validate_request(allow_req))
+    # -> ALLOW (second call is a hit)
+    print(cached_service.validate_request(deny_req))
+    # -> DENY (negatively cached)
+    print(cached_service.apply_event(data, {"event": "GRANT", "key_id": "sk_live_abc", "permission": "payments:create"}))
+    print(cached_service.validate_request(deny_req))
+    # -> ALLOW (GRANT evicted the cached DENY)
+    print(cached_service.cache.metrics())
+
+    print("\n=== Bulk Validation ===")
+    table = auth_service.build_key_table(data["keys"])
+    requests = [
+        {"key_id": "sk_live_abc", "action": "customers:write", "tenant_id": "acme_corp"},
+        {"key_id": "sk_live_abc", "action": "payments:create", "tenant_id": "acme_corp"},
+        {"key_id": "sk_live_abc", "action": "customers:write", "tenant_id": "beta_inc"},
+        {"key_id": "sk_live_xyz", "action": "customers:write", "tenant_id": "acme_corp"}
+    ]
+    bulk = auth_service.validate_requests_bulk(table, *table.encode_requests(requests))
+    print(list(bulk.decisions), list(bulk.codes))
+    print(bulk.to_dicts())
+    # -> ALLOW, ALLOW (payments:create was granted above), DENY (tenant mismatch), DENY (key not found)
+
+    print("\n=== Bulk Validation Benchmark ===")
+    print(benchmark_bulk_validation())
+
+    print("\n=== Sequenced Event Consumer ===")
+    queue = InMemoryEventQueue()
+    consumer = PermissionEventConsumer(cached_service, data, queue, batch_size=2)
+    grant = {"event": "GRANT", "key_id": "sk_live_abc", "permission": "refunds:create", "seq": 1}
+    queue.publish(grant)
+    queue.publish({"event": "REVOKE", "key_id": "sk_live_abc", "permission": "refunds:create", "seq": 2})
+    queue.publish(grant)
+    # -> redelivered GRANT(1) is stale and dropped
+    queue.publish({"event": "GRANT", "key_id": "sk_live_xyz", "permission": "payments:create", "seq": 1})
+    print("lag before:", consumer.metrics()["lag"])
+    consumer.drain()
+    print(data["keys"]["sk_live_abc"]["scopes"])
+    print(consumer.metrics())
+
+    print("\n=== Copy-on-Write Snapshots ===")
+    snapshot_service = SnapshotAuthService({
+        "sk_live_abc": {"scopes": ["payments:create"], "tenant_id": "acme_corp", "revoked": False}
+    })
+    before = snapshot_service.snapshot
+    print(snapshot_service.apply_event({"event": "GRANT", "key_id": "sk_live_abc", "permission": "refunds:create"}))
+    print(snapshot_service.validate_request({"key_id": "sk_live_abc", "action": "refunds:create", "tenant_id": "acme_corp"}))
+    # -> ALLOW on the new version; the old version is unchanged
+    print(before.version, before.get("sk_live_abc").scope_mask, snapshot_service.snapshot.version)
+
+    print("\n=== Concurrent Read Benchmark ===")
+    print(benchmark_concurrent_reads())
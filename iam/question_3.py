@@ -37,45 +37,265 @@ Part 3 (15 min):
     - Ensure requested scopes ⊆ user’s full permissions.
     - Reject invalid scope requests with a clear reason.
 
+Expansion is memoized per distinct role combination (RoleExpansionEngine), so
+tenants with many users sharing a few roles expand each combination once, and
+a role change only recomputes the users holding that role.
+
+Roles may inherit from other roles (`role_inherits`) and grant wildcard
+permissions such as `payments:*`. Inheritance is compiled into a transitive
+closure table (RoleGraph, with cycle detection) and wildcards are matched with
+a prefix trie, so a scope check costs the same regardless of hierarchy depth.
+
 """
 
 
+class RoleGraph:
+    """
+    Role inheritance compiled into a transitive-closure table:
+    closure[role] = the role itself plus every role it inherits from.
+    Adding or removing one edge only recomputes the roles below that edge.
+    """
+
+    def __init__(self, inherits: dict = None):
+        self._parents = {}
+        self._closure = {}
+        self._descendants = {}
+        for child, parents in (inherits or {}).items():
+            self._parents[child] = set(parents)
+        for role in list(self._parents):
+            self._compile(role, [])
+
+    def _compile(self, role: str, path: list) -> frozenset:
+        closure = self._closure.get(role)
+        if closure is not None:
+            return closure
+        if role in path:
+            cycle = path[path.index(role):] + [role]
+            raise ValueError(f"Role inheritance cycle: {' -> '.join(cycle)}")
+        path.append(role)
+        closure = {role}
+        for parent in self._parents.get(role, ()):
+            closure |= self._compile(parent, path)
+        path.pop()
+        closure = self._closure[role] = frozenset(closure)
+        for ancestor in closure:
+            self._descendants.setdefault(ancestor, set()).add(role)
+        return closure
+
+    def closure(self, role: str) -> frozenset:
+        return self._closure.get(role) or frozenset((role,))
+
+    def descendants(self, role: str) -> set:
+        return self._descendants.get(role) or {role}
+
+    def _register(self, role: str) -> None:
+        if role not in self._closure:
+            self._closure[role] = frozenset((role,))
+            self._descendants.setdefault(role, set()).add(role)
+
+    def add_edge(self, child: str, parent: str) -> set:
+        if child in self.closure(parent):
+            raise ValueError(f"Role inheritance cycle: {child} -> {parent} -> {child}")
+        self._register(child)
+        self._register(parent)
+        self._parents.setdefault(child, set()).add(parent)
+        inherited = self.closure(parent)
+        affected = set(self.descendants(child))
+        for role in affected:
+            closure = self.closure(role)
+            self._closure[role] = closure | inherited
+            for ancestor in inherited - closure:
+                self._descendants[ancestor].add(role)
+        return affected
+
+    def remove_edge(self, child: str, parent: str) -> set:
+        parents = self._parents.get(child)
+        if parents is None or parent not in parents:
+            # Unknown edge (or unregistered roles): nothing to recompute
+            return set()
+        parents.discard(parent)
+        affected = set(self.descendants(child))
+        previous = {role: self.closure(role) for role in affected}
+        for role in affected:
+            del self._closure[role]
+        for role in affected:
+            self._recompute(role, affected)
+        for role in affected:
+            for ancestor in previous[role] - self._closure[role]:
+                self._descendants[ancestor].discard(role)
+        return affected
+
+    def _recompute(self, role: str, affected: set) -> frozenset:
+        closure = self._closure.get(role)
+        if closure is None:
+            closure = {role}
+            for parent in self._parents.get(role, ()):
+                closure |= self._recompute(parent, affected) if parent in affected else self.closure(parent)
+            closure = self._closure[role] = frozenset(closure)
+        return closure
+
+
+class PermissionTrie:
+    """
+    Prefix trie over `:`-separated permission segments. A trailing `*` segment
+    grants everything below it, e.g. `payments:*` matches `payments:create`.
+    """
+
+    __slots__ = ("children", "terminal", "wildcard")
+
+    def __init__(self):
+        self.children = {}
+        self.terminal = False
+        self.wildcard = False
+
+    def insert(self, pattern: str) -> None:
+        node = self
+        *prefix, last = pattern.split(":")
+        for segment in prefix:
+            node = node.children.setdefault(segment, PermissionTrie())
+        if last == "*":
+            node.wildcard = True
+        else:
+            node.children.setdefault(last, PermissionTrie()).terminal = True
+
+    def matches(self, permission: str) -> bool:
+        node = self
+        for segment in permission.split(":"):
+            if node.wildcard:
+                return True
+            node = node.children.get(segment)
+            if node is None:
+                return False
+        return node.terminal
+
+
+class PermissionSet:
+    """Compiled permissions for one role combination: exact set plus wildcard trie."""
+
+    __slots__ = ("exact", "_trie")
+
+    def __init__(self, patterns: frozenset):
+        self.exact = patterns
+        self._trie = None
+        wildcards = [pattern for pattern in patterns if pattern == "*" or pattern.endswith(":*")]
+        if wildcards:
+            self._trie = PermissionTrie()
+            for pattern in wildcards:
+                self._trie.insert(pattern)
+
+    def __iter__(self):
+        return iter(self.exact)
+
+    def __contains__(self, permission: str) -> bool:
+        if permission in self.exact:
+            return True
+        return self._trie is not None and self._trie.matches(permission)
+
+    def issuperset(self, permissions) -> bool:
+        return all(permission in self for permission in permissions)
+
+
+class RoleExpansionEngine:
+    """
+    Expands users into permission sets, memoized per distinct role combination.
+    Users sharing the same roles share one compiled PermissionSet, and changing
+    a role (or an inheritance edge) only recomputes the users it reaches.
+    """
+
+    def __init__(self, roles: dict, tenant_users: list, inherits: dict = None):
+        self.graph = RoleGraph(inherits)
+        self._role_permissions = {role: frozenset(permissions) for role, permissions in roles.items()}
+        self._effective_permissions = {}
+        self._combo_permissions = {}
+        self._user_roles = {}
+        self._user_permissions = {}
+        self._users_by_role = {}
+        for user in tenant_users:
+            self.assign_roles(user["user_id"], user["roles"])
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._user_permissions
+
+    def _effective(self, role: str) -> frozenset:
+        permissions = self._effective_permissions.get(role)
+        if permissions is None:
+            permissions = frozenset().union(
+                *(self._role_permissions.get(ancestor, ()) for ancestor in self.graph.closure(role))
+            )
+            self._effective_permissions[role] = permissions
+        return permissions
+
+    def _expand_combo(self, combo: frozenset) -> PermissionSet:
+        permissions = self._combo_permissions.get(combo)
+        if permissions is None:
+            permissions = PermissionSet(frozenset().union(*(self._effective(role) for role in combo)))
+            self._combo_permissions[combo] = permissions
+        return permissions
+
+    def assign_roles(self, user_id: str, roles: list) -> PermissionSet:
+        for role in self._user_roles.get(user_id, ()):
+            self._users_by_role[role].discard(user_id)
+        combo = frozenset(roles)
+        self._user_roles[user_id] = combo
+        for role in combo:
+            self._users_by_role.setdefault(role, set()).add(user_id)
+        permissions = self._user_permissions[user_id] = self._expand_combo(combo)
+        return permissions
+
+    def _recompute(self, roles: set) -> int:
+        for role in roles:
+            self._effective_permissions.pop(role, None)
+        self._combo_permissions = {
+            combo: expanded for combo, expanded in self._combo_permissions.items() if roles.isdisjoint(combo)
+        }
+        affected = set()
+        for role in roles:
+            affected.update(self._users_by_role.get(role, ()))
+        for user_id in affected:
+            self._user_permissions[user_id] = self._expand_combo(self._user_roles[user_id])
+        return len(affected)
+
+    def update_role(self, role: str, permissions: list) -> int:
+        self._role_permissions[role] = frozenset(permissions)
+        return self._recompute(set(self.graph.descendants(role)))
+
+    def add_inheritance(self, child: str, parent: str) -> int:
+        return self._recompute(self.graph.add_edge(child, parent))
+
+    def remove_inheritance(self, child: str, parent: str) -> int:
+        return self._recompute(self.graph.remove_edge(child, parent))
+
+    def permissions(self, user_id: str) -> PermissionSet:
+        return self._user_permissions.get(user_id)
+
+    def expand(self) -> list:
+        return [
+            {"user_id": user_id, "permissions": list(permissions)}
+            for user_id, permissions in self._user_permissions.items()
+        ]
+
+
 class Roles:
-    
-    def show_permissions(self, data: dict) -> dict:
+
+    def build_engine(self, data: dict) -> RoleExpansionEngine:
         if not data["roles"] or not data["tenant_users"]:
             raise ValueError("Invalid input")
-        roles = data["roles"]
-        tenant_users = data["tenant_users"]
-        user_explanded_roles = []
-        for user in tenant_users:
-            user_id, user_roles = user["user_id"], user["roles"]
-            user_all_roles = set()
-            for role in user_roles:
-                if role not in roles:
-                    continue
-                user_all_roles.update(roles[role])
-                    
-            user_explanded_roles.append({
-                    "user_id": user_id,
-                    "permissions": list(user_all_roles)
-                })
-        return user_explanded_roles
+        return RoleExpansionEngine(data["roles"], data["tenant_users"], data.get("role_inherits"))
+    
+    def show_permissions(self, data: dict) -> dict:
+        return self.build_engine(data).expand()
     
     def validate_requests(self, data: dict) -> dict:
-        user_explanded_roles = self.show_permissions(data)
+        engine = data.get("engine") or self.build_engine(data)
         api_key_requests = data["api_key_requests"]
         
-        user_id_roles = {}
-        for user_role in user_explanded_roles:
-            user_id, permissions  = user_role["user_id"], user_role["permissions"]
-            user_id_roles[user_id] = permissions
         result = []
         for request in api_key_requests:
             user_id, requested_scopes = request["user_id"], request["requested_scopes"]
+            permissions = engine.permissions(user_id)
             
-            if user_id in user_id_roles:
-                if set(requested_scopes).issubset(user_id_roles[user_id]):
+            if permissions is not None:
+                if permissions.issuperset(requested_scopes):
                     result.append({
                         "user_id": user_id,
                         "status": "APPROVED",
@@ -140,8 +360,38 @@ data = {
 
 print(roles.validate_requests(data))
 
-                
-                
-        
-        
-        
\ No newline at end of file
+print("----Role update----")
+engine = roles.build_engine(data)
+print(engine.update_role("viewer", ["invoices:read", "code:deploy"]), "user(s) recomputed")
+data["engine"] = engine
+print(roles.validate_requests(data))
+
+print("----Inheritance and wildcards----")
+data = {
+  "roles": {
+    "viewer": ["invoices:read"],
+    "developer": ["code:deploy"],
+    "payments_admin": ["payments:*"]
+  },
+  "role_inherits": {
+    "developer": ["viewer"],
+    "lead": ["developer", "payments_admin"]
+  },
+  "tenant_users": [
+    {"user_id": "u1", "roles": ["lead"]},
+    {"user_id": "u2", "roles": ["developer"]}
+  ],
+  "api_key_requests": [
+    {"user_id": "u1", "requested_scopes": ["payments:refund", "invoices:read"]},
+    {"user_id": "u2", "requested_scopes": ["payments:create"]}
+  ]
+}
+engine = roles.build_engine(data)
+data["engine"] = engine
+print(roles.validate_requests(data))
+print(engine.add_inheritance("viewer", "payments_admin"), "user(s) recomputed")
+print(roles.validate_requests(data))
+try:
+    engine.add_inheritance("viewer", "lead")
+except ValueError as error:
+    print(error)
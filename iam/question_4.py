@@ -39,40 +39,195 @@ Part 3 (15 min):
         * Final cache size after purge.
     - Output should include both the updated cache and metrics.
 
+Implementation note:
+--------------------
+InvalidationAwareCache keeps a (principal, permission) -> cache key index and
+a role -> principals index, so a ROLE_PERMISSION_REMOVED event deletes the
+affected entries in place in O(affected) instead of rebuilding the cache.
+
+Every purge is timed on the monotonic clock by InvalidationMetrics, which
+reports a rolling-window invalidation rate, p50/p99 purge latency, and the lag
+between the event's timestamp and the end of the purge (the design requires
+permission changes to propagate in < 1 second).
+
 Expected Behavior:
 ------------------
 - Input: a cache dict, an event (role+permission removed), and role assignments.
 - Output: updated cache with affected entries removed + metrics.
 """
 
+import time
+from collections import deque
+from datetime import datetime
+
+from stats import percentile
+
+
+def _epoch_seconds(timestamp) -> float:
+    if isinstance(timestamp, (int, float)):
+        return float(timestamp)
+    return datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp()
+
+
+class InvalidationMetrics:
+    """
+    Instrumentation for the invalidation pipeline. Latency and lag samples are
+    kept in bounded reservoirs (the most recent `max_samples`); percentiles
+    are only computed when snapshot() is called, never per event.
+    """
+
+    def __init__(self, window_sec: float = 60, max_samples: int = 10_000, propagation_sla_sec: float = 1.0):
+        self.window_sec = window_sec
+        self.propagation_sla_sec = propagation_sla_sec
+        self._window = deque()
+        self._window_total = 0
+        self.purge_latency_ms = deque(maxlen=max_samples)
+        self.propagation_lag_ms = deque(maxlen=max_samples)
+        self.events = 0
+        self.invalidations = 0
+        self.sla_violations = 0
+
+    def record(self, invalidations: int, started_ns: int, finished_ns: int, event_timestamp=None) -> dict:
+        finished_wall = time.time()
+        self.events += 1
+        self.invalidations += invalidations
+        latency_ms = (finished_ns - started_ns) / 1e6
+        self.purge_latency_ms.append(latency_ms)
+
+        self._window.append((finished_ns, invalidations))
+        self._window_total += invalidations
+        self._expire(finished_ns)
+
+        lag_ms = None
+        if event_timestamp is not None:
+            lag_ms = (finished_wall - _epoch_seconds(event_timestamp)) * 1000
+            self.propagation_lag_ms.append(lag_ms)
+            if lag_ms > self.propagation_sla_sec * 1000:
+                self.sla_violations += 1
+        return {"purge_latency_ms": latency_ms, "propagation_lag_ms": lag_ms}
+
+    def _expire(self, now_ns: int) -> None:
+        horizon = now_ns - int(self.window_sec * 1e9)
+        while self._window and self._window[0][0] < horizon:
+            self._window_total -= self._window.popleft()[1]
+
+    def invalidations_per_second(self) -> float:
+        # Average over a fixed trailing window; a young pipeline reads low, never inflated
+        self._expire(time.monotonic_ns())
+        return self._window_total / self.window_sec if self.window_sec > 0 else 0
+
+    def snapshot(self) -> dict:
+        return {
+            "events": self.events,
+            "invalidations": self.invalidations,
+            "invalidations_per_second": self.invalidations_per_second(),
+            "purge_latency_p50_ms": percentile(self.purge_latency_ms, 50),
+            "purge_latency_p99_ms": percentile(self.purge_latency_ms, 99),
+            "propagation_lag_p50_ms": percentile(self.propagation_lag_ms, 50),
+            "propagation_lag_p99_ms": percentile(self.propagation_lag_ms, 99),
+            "propagation_sla_violations": self.sla_violations
+        }
+
+
+class InvalidationAwareCache:
+    """
+    Decision cache that indexes its own entries so a permission change only
+    touches the entries it affects:
+        (principal, permission) -> cache keys
+        role -> principals holding it
+    """
+
+    def __init__(self, role_assignments: dict = None):
+        self.entries = {}
+        self._by_grant = {}
+        self._principals_by_role = {}
+        for principal, roles in (role_assignments or {}).items():
+            self.assign_roles(principal, roles)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def __repr__(self) -> str:
+        return repr(self.entries)
+
+    def assign_roles(self, principal: str, roles) -> None:
+        if isinstance(roles, str):
+            roles = [roles]
+        for role in roles:
+            self._principals_by_role.setdefault(role, set()).add(principal)
+
+    def unassign_role(self, principal: str, role: str) -> None:
+        principals = self._principals_by_role.get(role)
+        if principals is not None:
+            principals.discard(principal)
+            if not principals:
+                del self._principals_by_role[role]
+
+    def get(self, key: str, default=None):
+        return self.entries.get(key, default)
+
+    def put(self, key: str, decision: str) -> None:
+        if key not in self.entries:
+            principal, permission = key.split(":", 1)
+            self._by_grant.setdefault((principal, permission), set()).add(key)
+        self.entries[key] = decision
+
+    def delete(self, key: str) -> bool:
+        if self.entries.pop(key, None) is None:
+            return False
+        grant = tuple(key.split(":", 1))
+        keys = self._by_grant[grant]
+        keys.discard(key)
+        if not keys:
+            del self._by_grant[grant]
+        return True
+
+    def invalidate_role_permission(self, role_id: str, permission: str) -> int:
+        invalidations = 0
+        for principal in self._principals_by_role.get(role_id, ()):
+            for key in self._by_grant.pop((principal, permission), ()):
+                del self.entries[key]
+                invalidations += 1
+        return invalidations
+
 
 class CacheInvalidation:
+
+    def __init__(self, metrics: InvalidationMetrics = None):
+        self.metrics = InvalidationMetrics() if metrics is None else metrics
     
     def invalidate_cache(self, data: dict) -> dict:
+        started_ns = time.monotonic_ns()
         cache = data["cache"]
         event = data["event"]
-        role_assignments = data["role_assignments"]
         
         role_id = event["role_id"]
         permission = event["permission"]
         timestamp = event.get("timestamp")
-        affected_users = {user for user, roles in role_assignments.items() if role_id in roles}
-        
-        new_cache = {
-            key: value
-            for key, value in cache.items()
-            if not (key.split(":",1)[0] in affected_users and key.endswith(f":{permission}"))
-        }
-        invalidations = len(cache) - len(new_cache)
-        time_window = 1  
-        invalidations_per_second = invalidations/ time_window if time_window > 0 else 0           
-                         
+        if isinstance(cache, InvalidationAwareCache):
+            invalidations = cache.invalidate_role_permission(role_id, permission)
+        else:
+            # Plain dict snapshot: cache keys are "principal:permission", so the
+            # affected entries can be popped directly without walking the cache
+            role_assignments = data["role_assignments"]
+            invalidations = 0
+            for principal, roles in role_assignments.items():
+                if role_id in roles and cache.pop(f"{principal}:{permission}", None) is not None:
+                    invalidations += 1
+        timing = self.metrics.record(invalidations, started_ns, time.monotonic_ns(), timestamp)
+
+        # Per-event timing only; pipeline percentiles come from metrics.snapshot()
         return {
-        "cache" : new_cache,
+        "cache" : cache,
         "metrics": {    
         "invalidations": invalidations,
-        "cache_size_after": len(new_cache),
-        "invalidations_per_second": invalidations_per_second
+        "cache_size_after": len(cache),
+        "invalidations_per_second": self.metrics.invalidations_per_second(),
+        "purge_latency_ms": timing["purge_latency_ms"],
+        "propagation_lag_ms": timing["propagation_lag_ms"]
         }
        }  
 
@@ -87,7 +242,8 @@ data = {
   "event": {
     "type": "ROLE_PERMISSION_REMOVED",
     "role_id": "role_dev",
-    "permission": "payments:create"
+    "permission": "payments:create",
+    "timestamp": time.time()
   },
   "role_assignments": {
     "sk_live_abc": ["role_dev"], 
@@ -99,4 +255,10 @@ data = {
 cache_invalidation = CacheInvalidation()
 
 print(cache_invalidation.invalidate_cache(data))
-                            
+
+print("\n=== Long-lived indexed cache ===")
+cache = InvalidationAwareCache({"sk_live_abc": ["role_dev"], "sk_live_pqr": ["role_admin"]})
+cache.put("sk_live_abc:payments:create", "ALLOW")
+cache.put("sk_live_pqr:payments:create", "ALLOW")
+print(cache_invalidation.invalidate_cache({"cache": cache, "event": data["event"]}))
+print(cache_invalidation.metrics.snapshot())
@@ -33,47 +33,134 @@ Part 3 (15 min):
         * Key revocations (API_KEY_REVOKED)
         * Permission changes (PERMISSION_GRANTED, PERMISSION_REVOKED, etc.)
     - Output should include both the formatted logs and the summary.
+
+Compliance exports are tens of GB of JSON lines, so stream_logs reads a JSONL
+file (or file object) in chunks and yields formatted lines from a generator,
+building the summary incrementally with constant peak memory.
+
+Filters (user(s), event type(s), since/until) are evaluated on the raw records
+before formatting, so only matching rows are ever formatted.
 """
 
-from datetime import datetime
+import json
+import os
+import tempfile
+import tracemalloc
 from collections import Counter
+
+from audit_store import AuditSegmentStore
+from timestamps import format_timestamp
+
+PERMISSION_EVENTS = ("PERMISSION_GRANTED", "PERMISSION_REVOKED")
+
+
 class LogParser:
+
+    def _format(self, log: dict) -> str:
+        return f"[{format_timestamp(log['timestamp'])}] {log['user']}:{log['event']}"
+
+    def _summarize(self, summary: Counter, event: str) -> None:
+        # Compliance summary mapping
+        if event == "API_KEY_CREATED":
+            summary["API_KEY_CREATED"] += 1
+        elif event == "API_KEY_REVOKED":
+            summary["API_KEY_REVOKED"] += 1
+        elif event in PERMISSION_EVENTS:
+            summary["PERMISSION_CHANGED"] += 1
     
     def parse_logs(self, logs: list) -> dict:
         readable_logs = []
         summary = Counter()
         for log in logs:
-            event, user, timestamp = log["event"], log["user"], log["timestamp"]
-            datetime_string = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%dT%H:%M:%SZ")
-            readable_logs.append(f"[{datetime_string}] {user}:{event}")
-            # Compliance summary mapping
-            if event == "API_KEY_CREATED":
-                summary["API_KEY_CREATED"] += 1
-            elif event == "API_KEY_REVOKED":
-                summary["API_KEY_REVOKED"] += 1
-            elif event in ("PERMISSION_GRANTED", "PERMISSION_REVOKED"):
-                summary["PERMISSION_CHANGED"] += 1
+            readable_logs.append(self._format(log))
+            self._summarize(summary, log["event"])
         
         return {"formatted_logs": readable_logs, "summary": Counter(summary)}
+
+    def iter_jsonl(self, source, chunk_size: int = 1 << 20):
+        """
+        Yields one decoded record per JSON line from a path or a binary/text
+        file object, reading `chunk_size` bytes at a time.
+        """
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, "rb") as file:
+                yield from self.iter_jsonl(file, chunk_size)
+            return
+        tail = b""
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            lines = (tail + chunk).split(b"\n")
+            tail = lines.pop()
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+        if tail.strip():
+            yield json.loads(tail)
+
+    def stream_logs(self, source, summary: Counter = None, chunk_size: int = 1 << 20, filter_to_apply: dict = None):
+        """
+        Streaming counterpart of parse_logs/filter_logs for JSONL exports too
+        big to load: yields formatted matching lines one at a time and updates
+        `summary` in place for the rows it yields.
+        """
+        matches = self.compile_filter(filter_to_apply or {})
+        for log in self.iter_jsonl(source, chunk_size):
+            if matches is not None and not matches(log):
+                continue
+            if summary is not None:
+                self._summarize(summary, log["event"])
+            yield self._format(log)
         
+
+    def compile_filter(self, filter_to_apply: dict):
+        """
+        Turns a filter spec into a predicate over raw log records:
+            user / users     -> exact user id(s)
+            event / events   -> event type(s)
+            since / until    -> epoch seconds, since <= timestamp < until
+        """
+        checks = []
+        users = set(filter_to_apply.get("users") or ())
+        if filter_to_apply.get("user"):
+            users.add(filter_to_apply["user"])
+        if users:
+            checks.append(lambda log: log["user"] in users)
+        events = set(filter_to_apply.get("events") or ())
+        if filter_to_apply.get("event"):
+            events.add(filter_to_apply["event"])
+        if events:
+            checks.append(lambda log: log["event"] in events)
+        since, until = filter_to_apply.get("since"), filter_to_apply.get("until")
+        if since is not None:
+            checks.append(lambda log: log["timestamp"] >= since)
+        if until is not None:
+            checks.append(lambda log: log["timestamp"] < until)
+        if not checks:
+            return None
+        if len(checks) == 1:
+            return checks[0]
+        return lambda log: all(check(log) for check in checks)
     
     def filter_logs(self, data: dict) -> list:
         logs = data["logs"]
-        
-        readable_logs = self.parse_logs(logs)["formatted_logs"]
         filter_to_apply = data.get("filter", {})
-        
-        ans = []
-        for log in readable_logs:
-
-            log_to_check = log.split(" ")[1]
-            user, event = log_to_check.split(":")
-            if filter_to_apply.get("user") and filter_to_apply["user"] != user:
-                continue
-            if filter_to_apply.get("event") and filter_to_apply["event"] != event:
-                continue    
-            ans.append(log)
-        return ans        
+        if isinstance(logs, AuditSegmentStore):
+            # Let the store's segment/block indexes pick the records to read
+            users = set(filter_to_apply.get("users") or ())
+            events = set(filter_to_apply.get("events") or ())
+            if filter_to_apply.get("user"):
+                users.add(filter_to_apply["user"])
+            if filter_to_apply.get("event"):
+                events.add(filter_to_apply["event"])
+            logs = logs.query(users, events, filter_to_apply.get("since"), filter_to_apply.get("until"))
+            return [self._format(log) for log in logs]
+        matches = self.compile_filter(filter_to_apply)
+        # Filter the raw records first so only matching rows get formatted
+        return [self._format(log) for log in logs if matches is None or matches(log)]
             
 
 data = [
@@ -96,7 +183,42 @@ data = {
   "filter": {"user": "u1"}
 }
 print("----Part2----")
-print(log_parser.filter_logs(data))       
-                
-        
-        
\ No newline at end of file
+print(log_parser.filter_logs(data))
+print(log_parser.filter_logs({
+    "logs": data["logs"] + [{"event": "API_KEY_CREATED", "user": "svc:billing bot", "timestamp": 1700000300}],
+    "filter": {"events": {"API_KEY_CREATED", "API_KEY_REVOKED"}, "since": 1700000100, "until": 1700000400}
+}))
+
+
+def stream_peak_memory(num_records: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "audit.jsonl")
+        with open(path, "w") as file:
+            for i in range(num_records):
+                file.write(json.dumps({"event": "API_KEY_CREATED", "user": f"u{i}", "timestamp": 1700000000 + i}) + "\n")
+        summary = Counter()
+        tracemalloc.start()
+        lines = sum(1 for _ in log_parser.stream_logs(path, summary, chunk_size=64 * 1024))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {"records": lines, "summary": dict(summary), "peak_kib": peak // 1024}
+
+
+print("----Streaming----")
+summary = Counter()
+with tempfile.TemporaryFile("w+b") as export:
+    export.write("\n".join(json.dumps(log) for log in data["logs"]).encode())
+    export.seek(0)
+    for line in log_parser.stream_logs(export, summary, chunk_size=16):
+        print(line)
+print(summary)
+
+print("----Segment store----")
+with tempfile.TemporaryDirectory() as directory:
+    store = AuditSegmentStore(directory)
+    store.extend(data["logs"])
+    print(log_parser.filter_logs({"logs": store, "filter": {"user": "u1", "since": 1700000100}}))
+    store.close()
+
+for num_records in (10_000, 100_000):
+    print(stream_peak_memory(num_records))
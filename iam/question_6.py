@@ -1,5 +1,116 @@
 
+import heapq
+import time
+from array import array
 from datetime import datetime
+
+from timestamps import format_timestamp
+
+
+class VerificationEngine:
+    """
+    Credential verification state kept in flat arrays: session expiries as
+    int epochs and API key revocation flags, each indexed by a slot number.
+    A min-heap of upcoming expiries lets expired sessions be purged
+    proactively, and verify_batch checks a mixed list of JWT/API-key
+    credentials against a single `now`.
+    """
+
+    def __init__(self, jwt_sessions: dict = None, api_keys: dict = None):
+        self._session_slots = {}
+        self._session_tokens = []
+        self._session_expiry = array("q")
+        self._free_session_slots = []
+        self._expiry_heap = []
+        self._key_slots = {}
+        self._key_revoked = bytearray()
+        for token, session in (jwt_sessions or {}).items():
+            self.add_session(token, session["expires_at"])
+        for key_id, key in (api_keys or {}).items():
+            self.add_api_key(key_id, key["revoked"])
+
+    def add_session(self, token: str, expires_at: int) -> None:
+        slot = self._session_slots.get(token)
+        if slot is None:
+            if self._free_session_slots:
+                slot = self._free_session_slots.pop()
+                self._session_tokens[slot] = token
+                self._session_expiry[slot] = int(expires_at)
+            else:
+                slot = len(self._session_tokens)
+                self._session_tokens.append(token)
+                self._session_expiry.append(int(expires_at))
+            self._session_slots[token] = slot
+        else:
+            self._session_expiry[slot] = int(expires_at)
+        heapq.heappush(self._expiry_heap, (int(expires_at), token))
+
+    def remove_session(self, token: str) -> None:
+        slot = self._session_slots.pop(token, None)
+        if slot is not None:
+            self._session_tokens[slot] = None
+            self._free_session_slots.append(slot)
+
+    def add_api_key(self, key_id: str, revoked: bool = False) -> None:
+        slot = self._key_slots.get(key_id)
+        if slot is None:
+            self._key_slots[key_id] = len(self._key_revoked)
+            self._key_revoked.append(bool(revoked))
+        else:
+            self._key_revoked[slot] = bool(revoked)
+
+    def revoke_api_key(self, key_id: str) -> None:
+        self.add_api_key(key_id, True)
+
+    def __len__(self) -> int:
+        return len(self._session_slots)
+
+    def purge_expired(self, now: int = None) -> int:
+        now = int(time.time()) if now is None else now
+        heap, slots, expiry = self._expiry_heap, self._session_slots, self._session_expiry
+        purged = 0
+        while heap and heap[0][0] <= now:
+            expires_at, token = heapq.heappop(heap)
+            slot = slots.get(token)
+            # Skip heap entries left behind by a refreshed or removed session
+            if slot is not None and expiry[slot] == expires_at:
+                self.remove_session(token)
+                purged += 1
+        return purged
+
+    def verify_batch(self, credentials: list, now: int = None) -> dict:
+        now = int(time.time()) if now is None else now
+        now_string = format_timestamp(now)
+        session_slots, expiry = self._session_slots, self._session_expiry
+        key_slots, key_revoked = self._key_slots, self._key_revoked
+        results, audit_logs = [], []
+        append = results.append
+        for credential in credentials:
+            principal_type = "human" if credential.get("user_id") else "machine"
+            credential_type = credential["type"]
+            if credential_type == "jwt":
+                token = credential.get("token")
+                slot = session_slots.get(token)
+                if slot is None:
+                    append({"credential": token, "valid": False, "reason": "Unknown", "principal_type": principal_type})
+                elif now >= expiry[slot]:
+                    append({"credential": token, "valid": False, "reason": "JWT expired", "principal_type": principal_type})
+                    audit_logs.append(f"{now_string} {token}:JWT expired")
+                else:
+                    append({"credential": token, "valid": True, "principal_type": principal_type})
+            elif credential_type == "api_key" and credential.get("key_id"):
+                key_id = credential["key_id"]
+                slot = key_slots.get(key_id)
+                if slot is None:
+                    append({"credential": key_id, "valid": False, "reason": "Unknown", "principal_type": principal_type})
+                elif key_revoked[slot]:
+                    append({"credential": key_id, "valid": False, "reason": "API key revoked", "principal_type": principal_type})
+                    audit_logs.append(f"{now_string} {key_id}:API key revoked")
+                else:
+                    append({"credential": key_id, "valid": True, "principal_type": principal_type})
+        return {"results": results, "audit_log": audit_logs}
+
+
 class Verification:
     
     def _get_prinipal_type(self,data: dict) -> str:
@@ -14,6 +125,7 @@ class Verification:
         api_keys = data["api_keys"]
         response = []
         current_time = datetime.now()
+        current_time_string = format_timestamp(current_time.timestamp())
         audit_logs = []
         for credential in credentials:
             principal_type = self._get_prinipal_type(credential) 
@@ -22,7 +134,8 @@ class Verification:
                 token = credential.get("token")
                 session = jwt_sessions.get(token)
                 if not session:
-                    response.append({"crendentaial": token, "valid": False, "reason": "Unknown"})
+                    response.append({"credential": token, "valid": False, "reason": "Unknown", "principal_type": principal_type})
+                    continue
                 expiry_time = datetime.fromtimestamp(jwt_sessions[token]["expires_at"])
                 if current_time >= expiry_time:
                     response.append({
@@ -32,7 +145,7 @@ class Verification:
                         "principal_type": principal_type
                     })
                     audit_logs.append(
-                        f"{current_time.strftime("%Y-%m-%dT%H:%M:%SZ")} jwt_expired:JWT expired"
+                        f"{current_time_string} jwt_expired:JWT expired"
                     )
                 else:
                     response.append({
@@ -42,15 +155,17 @@ class Verification:
                     })
             elif type == "api_key" and credential.get("key_id"):
                 id = credential["key_id"]
-                if api_keys[id]["revoked"]:
+                if id not in api_keys:
+                    response.append({"credential": id, "valid": False, "reason": "Unknown", "principal_type": principal_type})
+                elif api_keys[id]["revoked"]:
                     response.append({
                         "credential": id,
                         "valid": False,
-                        "response": "API key revoked",
+                        "reason": "API key revoked",
                         "principal_type": principal_type
                     })
                     audit_logs.append(
-                        f"{current_time.strftime("%Y-%m-%dT%H:%M:%SZ")} {id}:API key revoked"
+                        f"{current_time_string} {id}:API key revoked"
                     )
                 else:
                     response.append({
@@ -62,26 +177,45 @@ class Verification:
         
         return {"results": response, "audit_log": audit_logs}
     
-data = {
-  "credentials": [
-    {"type": "jwt", "token": "jwt_abc", "user_id": "u1"},
-    {"type": "api_key", "key_id": "sk_live_abc", "tenant_id": "acme_corp"},
-    {"type": "jwt", "token": "jwt_expired", "user_id": "u2"},
-    {"type": "api_key", "key_id": "sk_revoked", "tenant_id": "acme_corp"}
-  ],
-  "jwt_sessions": {
-    "jwt_abc": {"user_id": "u1", "expires_at": 2000000000},
-    "jwt_expired": {"user_id": "u2", "expires_at": 1500000000}
-  },
-  "api_keys": {
-    "sk_live_abc": {"scopes": ["invoices:read"], "revoked": False},
-    "sk_revoked": {"scopes": ["payments:create"], "revoked": True}
-  }
-}
-
-verification = Verification()
-print(verification.verify_credentails(data))                
-                
-                        
-                        
-                
\ No newline at end of file
+if __name__ == "__main__":
+    data = {
+      "credentials": [
+        {"type": "jwt", "token": "jwt_abc", "user_id": "u1"},
+        {"type": "jwt", "token": "jwt_missing", "user_id": "u3"},
+        {"type": "api_key", "key_id": "sk_live_abc", "tenant_id": "acme_corp"},
+        {"type": "jwt", "token": "jwt_expired", "user_id": "u2"},
+        {"type": "api_key", "key_id": "sk_revoked", "tenant_id": "acme_corp"}
+      ],
+      "jwt_sessions": {
+        "jwt_abc": {"user_id": "u1", "expires_at": 2000000000},
+        "jwt_expired": {"user_id": "u2", "expires_at": 1500000000}
+      },
+      "api_keys": {
+        "sk_live_abc": {"scopes": ["invoices:read"], "revoked": False},
+        "sk_revoked": {"scopes": ["payments:create"], "revoked": True}
+      }
+    }
+
+    verification = Verification()
+    legacy = verification.verify_credentails(data)
+    print(legacy)
+
+    engine = VerificationEngine(data["jwt_sessions"], data["api_keys"])
+    batch = engine.verify_batch(data["credentials"])
+    print(batch)
+    assert batch["results"] == legacy["results"], "both paths must report the same result shape"
+    print("purged:", engine.purge_expired(), "remaining sessions:", len(engine))
+
+    engine = VerificationEngine()
+    now = int(time.time())
+    for i in range(100_000):
+        engine.add_session(f"jwt_{i}", now + (i % 600) - 300)
+        engine.add_api_key(f"sk_{i}", revoked=i % 10 == 0)
+    credentials = [
+        {"type": "jwt", "token": f"jwt_{i}", "user_id": f"u{i}"} if i % 2 else {"type": "api_key", "key_id": f"sk_{i}"}
+        for i in range(100_000)
+    ]
+    started = time.perf_counter()
+    engine.verify_batch(credentials, now)
+    print(f"verify_batch: {len(credentials) / (time.perf_counter() - started):,.0f} credentials/sec")
+    print("purged:", engine.purge_expired(now), "remaining sessions:", len(engine))
@@ -0,0 +1,15 @@
+"""
+Latency statistics shared by the benchmarks and metrics in this directory
+(rate_limiter/question_4.py loads this file too rather than keep a copy).
+"""
+
+import math
+
+
+def percentile(samples, pct: float) -> float:
+    """Nearest-rank `pct`-th percentile of `samples` (0.0 when there are none)."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[rank]
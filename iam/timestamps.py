@@ -0,0 +1,102 @@
+"""
+Cached ISO-8601 timestamp formatting
+
+Audit lines and credential checks format a UTC timestamp per record as
+"%Y-%m-%dT%H:%M:%SZ", and strftime is a large share of formatting-heavy runs.
+Records arrive in (roughly) time order, so consecutive calls mostly fall in
+the same second or minute:
+
+- the full string for the last formatted second is reused as is;
+- the "YYYY-MM-DDTHH:MM:" prefix for the last minute is reused, and only the
+  two seconds digits are appended from a lookup table.
+
+Output is identical to time.strftime(ISO_FORMAT, time.gmtime(epoch)).
+"""
+
+import time
+
+ISO_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+_SECONDS = [f"{second:02d}Z" for second in range(60)]
+
+
+class TimestampFormatter:
+
+    def __init__(self):
+        # (epoch second, text) and (epoch minute, prefix); each is replaced as
+        # one tuple so concurrent callers never see a half-updated cache
+        self._second = (None, None)
+        self._minute = (None, None)
+
+    def format(self, epoch) -> str:
+        second = int(epoch // 1)
+        cached_second, text = self._second
+        if second == cached_second:
+            return text
+        minute = second // 60
+        cached_minute, prefix = self._minute
+        if minute != cached_minute:
+            prefix = time.strftime("%Y-%m-%dT%H:%M:", time.gmtime(minute * 60))
+            self._minute = (minute, prefix)
+        text = prefix + _SECONDS[second - minute * 60]
+        self._second = (second, text)
+        return text
+
+    def now(self) -> str:
+        return self.format(time.time())
+
+    def format_many(self, epochs) -> list:
+        seconds_table = _SECONDS
+        results = []
+        append = results.append
+        last_second, last_text = self._second
+        last_minute, prefix = self._minute
+        for epoch in epochs:
+            second = int(epoch // 1)
+            if second != last_second:
+                minute = second // 60
+                if minute != last_minute:
+                    prefix = time.strftime("%Y-%m-%dT%H:%M:", time.gmtime(minute * 60))
+                    last_minute = minute
+                last_second, last_text = second, prefix + seconds_table[second - minute * 60]
+            append(last_text)
+        self._minute = (last_minute, prefix)
+        self._second = (last_second, last_text)
+        return results
+
+
+_formatter = TimestampFormatter()
+format_timestamp = _formatter.format
+format_timestamps = _formatter.format_many
+current_timestamp = _formatter.now
+
+
+if __name__ == "__main__":
+    import random
+
+    epochs = sorted(1700000000 + random.randrange(0, 86_400) for _ in range(200_000))
+    expected = [time.strftime(ISO_FORMAT, time.gmtime(epoch)) for epoch in epochs]
+    assert [TimestampFormatter().format(epoch) for epoch in epochs] == expected
+    assert TimestampFormatter().format_many(epochs) == expected
+    assert TimestampFormatter().format_many([-1, 0, 59.9, 1.5e9]) == [
+        time.strftime(ISO_FORMAT, time.gmtime(epoch // 1)) for epoch in (-1, 0, 59.9, 1.5e9)
+    ]
+
+    started = time.perf_counter()
+    for epoch in epochs:
+        time.strftime(ISO_FORMAT, time.gmtime(epoch))
+    baseline = time.perf_counter() - started
+
+    formatter = TimestampFormatter()
+    started = time.perf_counter()
+    for epoch in epochs:
+        formatter.format(epoch)
+    cached = time.perf_counter() - started
+
+    started = time.perf_counter()
+    TimestampFormatter().format_many(epochs)
+    batch = time.perf_counter() - started
+
+    print(f"{len(epochs)} timestamps over one day")
+    print(f"  strftime:     {baseline * 1e3:8.1f} ms")
+    print(f"  cached:       {cached * 1e3:8.1f} ms ({baseline / cached:.1f}x)")
+    print(f"  format_many:  {batch * 1e3:8.1f} ms ({baseline / batch:.1f}x)")
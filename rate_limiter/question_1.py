@@ -0,0 +1,408 @@
+"""
+Q1: Identity & Rule Resolution
+
+Background:
+-----------
+Before a request can be rate limited we need to know who is calling and
+which limits apply to them on this endpoint:
+
+    resolve_request_limits(request, config)
+        -> {client_key, matched_rules[], effective_limit, effective_per_seconds, cost}
+
+Part A:
+    - Resolve identity through `identity_priority` (user_id from the JWT
+      `sub` claim, api_key from X-API-Key, ip), first available wins.
+    - The client IP is the first address in X-Forwarded-For when present.
+
+Part B:
+    - Match every rule whose endpoints cover the path (`*`, exact and
+      `:param` routes) and whose scope applies to the caller.
+    - `limit_multiplier` rules scale the limits of their scope when their
+      `condition` (e.g. tier=='premium') holds.
+    - The effective limit is the most restrictive rate (limit / per_seconds).
+
+Part C:
+    - Return a reasoning bundle (why each rule matched, multiplier math,
+      blocklist hits) for audit logs; it is not sent to the client.
+
+Rules are not matched one by one per request. CompiledRules turns `rules` and
+`endpoint_costs` into a segment radix tree once: static segments, `:param`
+segments and `*` (rest of path, zero or more segments) are merged at compile
+time so every path resolves with a single walk, and each route node carries
+its matched rules and cost precomputed. The effective limit for a node is
+memoized per caller shape (which scopes are present, which conditions hold).
+RuleEngine holds the compiled config and swaps a reload in with one
+reference assignment.
+"""
+
+import ipaddress
+import re
+import time
+
+SCOPE_ORDER = ("user", "api_key", "ip", "endpoint", "global")
+_IDENTITY_SCOPE = {"user_id": "user", "api_key": "api_key", "ip": "ip"}
+_CONDITION = re.compile(r"^\s*(\w+)\s*(==|!=)\s*'([^']*)'\s*$")
+
+
+class Condition:
+    """A parsed `field=='value'` / `field!='value'` rule condition."""
+
+    __slots__ = ("text", "field", "negate", "value")
+
+    def __init__(self, text: str):
+        match = _CONDITION.match(text)
+        if match is None:
+            raise ValueError(f"Unsupported rule condition: {text}")
+        self.text = text
+        self.field, operator, self.value = match.groups()
+        self.negate = operator == "!="
+
+    def holds(self, claims: dict) -> bool:
+        return (claims.get(self.field) == self.value) != self.negate
+
+
+class Rule:
+    __slots__ = ("id", "order", "applies_to", "limit", "per_seconds", "multiplier", "condition")
+
+    def __init__(self, order: int, rule: dict):
+        self.id = rule["id"]
+        self.order = order
+        self.applies_to = rule["applies_to"]
+        self.limit = rule.get("limit")
+        self.per_seconds = rule.get("per_seconds")
+        self.multiplier = rule.get("limit_multiplier")
+        condition = rule.get("condition")
+        self.condition = Condition(condition) if condition else None
+        if self.limit is None and self.multiplier is None:
+            raise ValueError(f"Rule {self.id} has neither limit nor limit_multiplier")
+
+
+class RouteEntry:
+    """Rules and cost for one route node; effective limits memoized per caller shape."""
+
+    __slots__ = ("rules", "patterns", "cost", "conditions", "_memo")
+
+    def __init__(self, matches: list, cost: int):
+        matches.sort(key=lambda match: match[0].order)
+        self.rules = tuple(rule for rule, _ in matches)
+        self.patterns = tuple(pattern for _, pattern in matches)
+        self.cost = cost
+        conditions = {}
+        for rule in self.rules:
+            if rule.condition is not None:
+                conditions.setdefault(rule.condition.text, rule.condition)
+        self.conditions = tuple(conditions.values())
+        self._memo = {}
+
+    def resolve(self, scopes: tuple, claims: dict) -> tuple:
+        outcomes = tuple(condition.holds(claims) for condition in self.conditions)
+        signature = (scopes, outcomes)
+        resolved = self._memo.get(signature)
+        if resolved is None:
+            held = {condition.text for condition, ok in zip(self.conditions, outcomes) if ok}
+            resolved = self._memo[signature] = self._compute(scopes, held)
+        return resolved
+
+    def _compute(self, scopes: tuple, held: set) -> tuple:
+        rank = {scope: position for position, scope in enumerate(scopes)}
+        applied = [
+            (rule, pattern) for rule, pattern in zip(self.rules, self.patterns)
+            if rule.applies_to in rank and (rule.condition is None or rule.condition.text in held)
+        ]
+        # Caller's own identity scope first, then global, then the rest
+        applied.sort(key=lambda match: (rank[match[0].applies_to], match[0].order))
+
+        factors = {}
+        for rule, _ in applied:
+            if rule.multiplier is not None:
+                factors[rule.applies_to] = factors.get(rule.applies_to, 1) * rule.multiplier
+
+        best = None
+        reasons = []
+        for rule, pattern in applied:
+            reason = {"rule": rule.id, "applies_to": rule.applies_to, "endpoint": pattern}
+            if rule.condition is not None:
+                reason["condition"] = rule.condition.text
+            if rule.limit is None:
+                reason["multiplier"] = rule.multiplier
+            else:
+                factor = factors.get(rule.applies_to, 1)
+                limit = rule.limit * factor
+                if factor != 1:
+                    reason["math"] = f"{rule.limit} x {factor} = {limit} per {rule.per_seconds}s"
+                reason["effective"] = f"{limit}/{rule.per_seconds}s"
+                # Compare rates limit/per without division: a/b < c/d <=> a*d < c*b
+                if best is None or limit * best[1] < best[0] * rule.per_seconds:
+                    best = (limit, rule.per_seconds, rule.id)
+            reasons.append(reason)
+        return tuple(rule.id for rule, _ in applied), best, tuple(reasons)
+
+
+class RouteNode:
+    __slots__ = ("static", "param", "end", "miss")
+
+    def __init__(self):
+        self.static = {}
+        self.param = None
+        self.end = None
+        self.miss = None
+
+
+class _PatternNode:
+    __slots__ = ("static", "param", "rules", "catch_all", "cost", "params")
+
+    def __init__(self, params: int):
+        self.static = {}
+        self.param = None
+        self.rules = []
+        self.catch_all = []
+        self.cost = None
+        self.params = params
+
+
+def _segments(path: str) -> list:
+    return [segment for segment in path.split("?", 1)[0].split("/") if segment]
+
+
+class CompiledRules:
+    """
+    `rules` and `endpoint_costs` compiled into a deterministic route tree.
+    The pattern trie (one branch per rule endpoint) is merged so that a tree
+    node stands for every pattern that can match the path walked so far;
+    static children already include the rules of sibling `:param` and
+    ancestor `*` patterns, so lookups never backtrack.
+    """
+
+    def __init__(self, config: dict):
+        self.identity_priority = tuple(config.get("identity_priority", ("user_id", "api_key", "ip")))
+        self.blocklist = tuple(ipaddress.ip_network(cidr) for cidr in config.get("cidr_blocklist", ()))
+        self.rules = [Rule(order, rule) for order, rule in enumerate(config.get("rules", ()))]
+        root = _PatternNode(0)
+        for rule, raw in zip(self.rules, config.get("rules", ())):
+            for pattern in raw.get("endpoints", ("*",)):
+                node, catch_all = self._insert(root, pattern)
+                (node.catch_all if catch_all else node.rules).append((rule, pattern))
+        for pattern, cost in config.get("endpoint_costs", {}).items():
+            node, catch_all = self._insert(root, pattern)
+            if not catch_all:
+                node.cost = cost
+        self.default_cost = config.get("default_cost", 1)
+        self._merged = {}
+        self.root = self._merge((root,), ())
+
+    @staticmethod
+    def _insert(root: _PatternNode, pattern: str) -> tuple:
+        node = root
+        for segment in _segments(pattern):
+            if segment == "*":
+                return node, True
+            if segment.startswith(":"):
+                if node.param is None:
+                    node.param = _PatternNode(node.params + 1)
+                node = node.param
+            else:
+                child = node.static.get(segment)
+                if child is None:
+                    child = node.static[segment] = _PatternNode(node.params)
+                node = child
+        return node, False
+
+    def _merge(self, nodes: tuple, inherited: tuple) -> RouteNode:
+        key = (frozenset(map(id, nodes)), inherited)
+        merged = self._merged.get(key)
+        if merged is not None:
+            return merged
+        merged = self._merged[key] = RouteNode()
+        wildcard = list(inherited)
+        for node in nodes:
+            wildcard.extend(node.catch_all)
+        wildcard = tuple(dict.fromkeys(wildcard))
+
+        ends = [node for node in nodes if node.rules or node.cost is not None]
+        costs = sorted((node.params, node.cost) for node in ends if node.cost is not None)
+        end_rules = [match for node in ends for match in node.rules]
+        merged.end = RouteEntry(end_rules + list(wildcard), costs[0][1] if costs else self.default_cost)
+        merged.miss = RouteEntry(list(wildcard), self.default_cost)
+
+        params = tuple(node.param for node in nodes if node.param is not None)
+        for segment in {segment for node in nodes for segment in node.static}:
+            children = tuple(node.static[segment] for node in nodes if segment in node.static) + params
+            merged.static[segment] = self._merge(children, wildcard)
+        if params:
+            merged.param = self._merge(params, wildcard)
+        return merged
+
+    def route(self, path: str) -> RouteEntry:
+        node = self.root
+        for segment in _segments(path):
+            child = node.static.get(segment) or node.param
+            if child is None:
+                return node.miss
+            node = child
+        return node.end
+
+    def is_blocked(self, ip: str) -> str:
+        if not self.blocklist or not ip:
+            return None
+        address = ipaddress.ip_address(ip)
+        for network in self.blocklist:
+            if address in network:
+                return str(network)
+        return None
+
+
+def resolve_identity(request: dict, config: dict, priority: tuple) -> dict:
+    headers = request.get("headers", {})
+    forwarded = headers.get("X-Forwarded-For")
+    ip = forwarded.split(",", 1)[0].strip() if forwarded else request.get("ip")
+    claims = config.get("jwt_claims") or {}
+    user_id = claims.get("sub") if headers.get("Authorization", "").startswith("Bearer ") else None
+    available = {"user_id": user_id, "api_key": headers.get("X-API-Key"), "ip": ip}
+
+    kind = next((kind for kind in priority if available.get(kind)), None)
+    path = request.get("path", "").split("?", 1)[0]
+    if kind == "user_id":
+        client_key = f"user:{user_id}|tier:{claims['tier']}" if "tier" in claims else f"user:{user_id}"
+    elif kind == "api_key":
+        client_key = f"key:{available['api_key']}"
+    elif kind == "ip":
+        client_key = f"ip:{ip}|ep:{path}"
+    else:
+        client_key = "anonymous"
+
+    present = {_IDENTITY_SCOPE[kind] for kind, value in available.items() if value}
+    present.update(("endpoint", "global"))
+    identity_scope = _IDENTITY_SCOPE.get(kind)
+    scopes = ((identity_scope,) if identity_scope else ()) + ("global",) + tuple(
+        scope for scope in SCOPE_ORDER if scope in present and scope not in (identity_scope, "global")
+    )
+    return {"kind": kind, "client_key": client_key, "ip": ip, "claims": claims if user_id else {}, "scopes": scopes}
+
+
+class RuleEngine:
+    """
+    Holds the current CompiledRules. resolve() reads self._compiled once, so a
+    concurrent reload() (compile first, then rebind) is never seen half-built.
+    """
+
+    def __init__(self, config: dict):
+        self._compiled = CompiledRules(config)
+
+    def reload(self, config: dict) -> None:
+        self._compiled = CompiledRules(config)
+
+    def resolve(self, request: dict, config: dict) -> dict:
+        compiled = self._compiled
+        identity = resolve_identity(request, config, compiled.identity_priority)
+        entry = compiled.route(request["path"])
+        matched, best, reasons = entry.resolve(identity["scopes"], identity["claims"])
+        result = {
+            "client_key": identity["client_key"],
+            "matched_rules": list(matched),
+            "effective_limit": best[0] if best else None,
+            "effective_per_seconds": best[1] if best else None,
+            "cost": entry.cost
+        }
+        blocked = compiled.is_blocked(identity["ip"])
+        result["reasoning"] = {
+            "identity": {"source": identity["kind"], "ip": identity["ip"]},
+            "rules": list(reasons),
+            "most_restrictive": best[2] if best else None,
+            "blocked_by": blocked
+        }
+        return result
+
+
+def resolve_request_limits(request: dict, config: dict) -> dict:
+    """One-shot resolution; long-lived callers should keep a RuleEngine."""
+    return RuleEngine(config).resolve(request, config)
+
+
+def _linear_match(pattern: str, path: str) -> bool:
+    pattern_segments, path_segments = _segments(pattern), _segments(path)
+    for position, segment in enumerate(pattern_segments):
+        if segment == "*":
+            return True
+        if position >= len(path_segments):
+            return False
+        if not segment.startswith(":") and segment != path_segments[position]:
+            return False
+    return len(pattern_segments) == len(path_segments)
+
+
+def benchmark_rule_matching(num_routes: int = 300, num_requests: int = 50_000) -> dict:
+    rules = [{"id": "global_safety", "applies_to": "global", "endpoints": ["*"], "limit": 50000, "per_seconds": 1}]
+    for i in range(num_routes):
+        rules.append({"id": f"ip_r{i}", "applies_to": "ip", "endpoints": [f"/v1/r{i}/:id"], "limit": 10 + i, "per_seconds": 60})
+    config = {"rules": rules, "endpoint_costs": {f"/v1/r{i}/:id": 1 + i % 5 for i in range(num_routes)}}
+    requests = [
+        {"path": f"/v1/r{i % num_routes}/{i}", "ip": "198.51.100.9", "headers": {}}
+        for i in range(num_requests)
+    ]
+
+    start = time.perf_counter()
+    for request in requests:
+        [rule["id"] for rule in rules if any(_linear_match(pattern, request["path"]) for pattern in rule["endpoints"])]
+    linear = time.perf_counter() - start
+
+    engine = RuleEngine(config)
+    start = time.perf_counter()
+    for request in requests:
+        engine.resolve(request, config)
+    compiled = time.perf_counter() - start
+    return {
+        "rules": len(rules),
+        "linear_match_only_per_sec": round(num_requests / linear),
+        "compiled_full_resolve_per_sec": round(num_requests / compiled),
+        "speedup": round(linear / compiled, 1)
+    }
+
+
+if __name__ == "__main__":
+    data = {
+      "request": {
+        "method": "GET",
+        "path": "/v1/search?q=cat",
+        "ip": "203.0.113.7",
+        "headers": {
+          "Authorization": "Bearer eyJ...jwt...",
+          "X-API-Key": "k_live_abc",
+          "X-Forwarded-For": "198.51.100.9, 203.0.113.7"
+        },
+        "now_epoch": 1730812805
+      },
+      "config": {
+        "identity_priority": ["user_id", "api_key", "ip"],
+        "cidr_blocklist": ["10.0.0.0/8"],
+        "endpoint_costs": {"/v1/search": 2, "/v1/upload": 5, "/v1/profile": 1, "/v1/users/:id": 1},
+        "rules": [
+          {"id": "ip_search_min", "applies_to": "ip", "endpoints": ["/v1/search"], "limit": 10, "per_seconds": 60},
+          {"id": "auth_user_hour", "applies_to": "user", "endpoints": ["*"], "limit": 1000, "per_seconds": 3600},
+          {"id": "premium_boost", "applies_to": "user", "endpoints": ["*"], "limit_multiplier": 10, "condition": "tier=='premium'"},
+          {"id": "global_safety", "applies_to": "global", "endpoints": ["*"], "limit": 50000, "per_seconds": 1}
+        ],
+        "jwt_claims": {"sub": "user_42", "tier": "premium"}
+      }
+    }
+
+    print("=== Resolve ===")
+    result = resolve_request_limits(data["request"], data["config"])
+    reasoning = result.pop("reasoning")
+    print(result)
+    # -> user:user_42|tier:premium, ip_search_min is most restrictive (10/60s), cost 2
+    print(reasoning)
+
+    print("\n=== Param Route, Anonymous Caller From Blocked Range ===")
+    engine = RuleEngine(data["config"])
+    print(engine.resolve({"path": "/v1/users/123", "ip": "10.1.2.3", "headers": {}}, data["config"]))
+
+    print("\n=== Reload ===")
+    reloaded = dict(data["config"], rules=data["config"]["rules"] + [
+        {"id": "user_search_burst", "applies_to": "user", "endpoints": ["/v1/:resource"], "limit": 1, "per_seconds": 1}
+    ])
+    engine.reload(reloaded)
+    result = engine.resolve(data["request"], reloaded)
+    print(result["matched_rules"], result["effective_limit"], result["effective_per_seconds"])
+
+    print("\n=== Benchmark ===")
+    print(benchmark_rule_matching())
@@ -0,0 +1,355 @@
+"""
+Q2: Deterministic Token-Bucket Simulation (single node, variable cost)
+
+Background:
+-----------
+    simulate_requests(events, rate_config) -> decisions[]
+
+Every client_key owns a token bucket of `capacity` tokens that refills at
+`refill_per_sec` and starts with `start_tokens`. An event is allowed when the
+bucket holds at least `cost` tokens, which are then consumed.
+
+Part A:
+    - Integer-math refill (no float drift), capped at capacity, variable cost.
+
+Part B:
+    - `reset_in`: when allowed, seconds until the bucket is full again; when
+      denied, seconds until it holds `cost` tokens again.
+
+Part C:
+    - Idempotency: an event repeating (client_key, timestamp, request_id)
+      within 60s replays the first decision without consuming tokens again.
+
+Bucket state does not live in one dict per client_key (several hundred bytes
+each). TokenBucketEngine interns each client_key to a slot id and keeps the
+state in parallel array('q') columns (tokens, last refill, capacity, rate,
+rate period, expiry), about 48 bytes of state per key plus the key index.
+A rate is an integer pair: `limit` tokens per `per_seconds` seconds. Tokens
+are counted in units of 1/per_seconds of a token, so one second adds exactly
+`limit` units and rates such as 1000 per 3600s refill with exact integer
+math. Idle keys expire after `ttl` seconds; expired slots are reset on their
+next use or reclaimed by an incremental sweep that feeds a free list.
+"""
+
+import sys
+import time
+import tracemalloc
+from array import array
+from collections import deque
+from fractions import Fraction
+
+IDEMPOTENCY_WINDOW = 60
+
+
+def _ceil_div(numerator: int, denominator: int) -> int:
+    return -(-numerator // denominator)
+
+
+def rate_pair(refill_per_sec) -> tuple:
+    """(limit, per_seconds) integers for a tokens-per-second rate such as 1, 0.5 or 1000/3600."""
+    rate = Fraction(refill_per_sec).limit_denominator(1_000_000)
+    return rate.numerator, rate.denominator
+
+
+class TokenBucketEngine:
+
+    def __init__(self, capacity: int, limit: int, per_seconds: int = 1, start_tokens: int = None, ttl: int = 3600):
+        self.capacity = capacity
+        self.limit = limit
+        self.per_seconds = per_seconds
+        self.start = capacity if start_tokens is None else start_tokens
+        self.ttl = ttl
+        self._slots = {}
+        self._keys = []
+        self._free = []
+        self._sweep_cursor = 0
+        self.tokens = array("q")
+        self.last_refill = array("q")
+        self.capacities = array("q")
+        self.refills = array("q")
+        self.scales = array("q")
+        self.expires = array("q")
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, client_key: str) -> bool:
+        return client_key in self._slots
+
+    def _allocate(self, client_key: str, now: int) -> int:
+        scale = self.per_seconds
+        if self._free:
+            slot = self._free.pop()
+            self._keys[slot] = client_key
+            self.tokens[slot] = self.start * scale
+            self.last_refill[slot] = now
+            self.capacities[slot] = self.capacity * scale
+            self.refills[slot] = self.limit
+            self.scales[slot] = scale
+            self.expires[slot] = now + self.ttl
+        else:
+            slot = len(self._keys)
+            self._keys.append(client_key)
+            self.tokens.append(self.start * scale)
+            self.last_refill.append(now)
+            self.capacities.append(self.capacity * scale)
+            self.refills.append(self.limit)
+            self.scales.append(scale)
+            self.expires.append(now + self.ttl)
+        self._slots[client_key] = slot
+        return slot
+
+    def slot(self, client_key: str, now: int) -> int:
+        slot = self._slots.get(client_key)
+        if slot is None:
+            return self._allocate(client_key, now)
+        if now >= self.expires[slot]:
+            # Expired but not yet swept: start over as a fresh bucket
+            self.tokens[slot] = self.start * self.scales[slot]
+            self.last_refill[slot] = now
+        return slot
+
+    def override(self, client_key: str, now: int, capacity: int = None, limit: int = None, per_seconds: int = None) -> None:
+        slot = self.slot(client_key, now)
+        scale = self.scales[slot]
+        if per_seconds is not None and per_seconds != scale:
+            # Re-express tokens and capacity in the new unit (rounding tokens down)
+            self.tokens[slot] = self.tokens[slot] * per_seconds // scale
+            self.capacities[slot] = self.capacities[slot] * per_seconds // scale
+            self.scales[slot] = scale = per_seconds
+        if capacity is not None:
+            self.capacities[slot] = capacity * scale
+            self.tokens[slot] = min(self.tokens[slot], capacity * scale)
+        if limit is not None:
+            self.refills[slot] = limit
+
+    def check_and_consume(self, client_key: str, now: int, cost: int = 1) -> dict:
+        allowed, remaining, reset_in = self._consume(self.slot(client_key, now), now, cost)
+        return {"allowed": allowed, "remaining": remaining, "reset_in": reset_in}
+
+    def _consume(self, slot: int, now: int, cost: int) -> tuple:
+        tokens, capacity, refill = self.tokens, self.capacities, self.refills
+        scale = self.scales[slot]
+        cost *= scale
+        level = tokens[slot]
+        elapsed = now - self.last_refill[slot]
+        if elapsed > 0:
+            level = min(capacity[slot], level + elapsed * refill[slot])
+            self.last_refill[slot] = now
+        allowed = level >= cost
+        if allowed:
+            level -= cost
+            missing = capacity[slot] - level
+        else:
+            missing = cost - level
+        tokens[slot] = level
+        self.expires[slot] = now + self.ttl
+        rate = refill[slot]
+        reset_in = _ceil_div(missing, rate) if rate else -1
+        return allowed, level // scale, reset_in
+
+    def check_and_consume_many(self, client_keys: list, nows, costs, sweep_budget: int = 1024) -> tuple:
+        """
+        Decide a batch in order. Returns (allowed bytearray, remaining and
+        reset_in as array('q')), one entry per input, and sweeps up to
+        `sweep_budget` slots for expired keys afterwards.
+        """
+        count = len(client_keys)
+        allowed = bytearray(count)
+        remaining = array("q", bytes(8 * count))
+        reset_in = array("q", bytes(8 * count))
+        slots, slot_for, ttl = self._slots, self.slot, self.ttl
+        tokens, last_refill, capacities, refills, scales, expires = (
+            self.tokens, self.last_refill, self.capacities, self.refills, self.scales, self.expires
+        )
+        # Same steps as _consume, inlined to keep the batch loop free of calls
+        for i in range(count):
+            client_key, now = client_keys[i], nows[i]
+            slot = slots.get(client_key)
+            if slot is None or now >= expires[slot]:
+                slot = slot_for(client_key, now)
+            scale = scales[slot]
+            cost = costs[i] * scale
+            level = tokens[slot]
+            elapsed = now - last_refill[slot]
+            rate = refills[slot]
+            if elapsed > 0:
+                level = min(capacities[slot], level + elapsed * rate)
+                last_refill[slot] = now
+            if level >= cost:
+                level -= cost
+                allowed[i] = 1
+                missing = capacities[slot] - level
+            else:
+                missing = cost - level
+            tokens[slot] = level
+            expires[slot] = now + ttl
+            remaining[i] = level // scale
+            reset_in[i] = -(-missing // rate) if rate else -1
+        if sweep_budget and count:
+            self.sweep(max(nows), sweep_budget)
+        return allowed, remaining, reset_in
+
+    def sweep(self, now: int, budget: int = None) -> int:
+        """Reclaim expired slots, scanning at most `budget` slots from where the last sweep stopped."""
+        size = len(self._keys)
+        if not size:
+            return 0
+        budget = size if budget is None else min(budget, size)
+        keys, expires, slots = self._keys, self.expires, self._slots
+        cursor = self._sweep_cursor % size
+        freed = 0
+        for _ in range(budget):
+            client_key = keys[cursor]
+            if client_key is not None and now >= expires[cursor]:
+                del slots[client_key]
+                keys[cursor] = None
+                self._free.append(cursor)
+                freed += 1
+            cursor += 1
+            if cursor == size:
+                cursor = 0
+        self._sweep_cursor = cursor
+        return freed
+
+    def keys(self) -> list:
+        return list(self._slots)
+
+    def export_state(self, client_keys) -> list:
+        """Remove the given keys and return their raw state rows for load_state elsewhere."""
+        rows = []
+        for client_key in client_keys:
+            slot = self._slots.pop(client_key, None)
+            if slot is None:
+                continue
+            rows.append((client_key, self.tokens[slot], self.last_refill[slot], self.capacities[slot],
+                         self.refills[slot], self.scales[slot], self.expires[slot]))
+            self._keys[slot] = None
+            self._free.append(slot)
+        return rows
+
+    def load_state(self, rows) -> None:
+        for client_key, tokens, last_refill, capacity, refill, scale, expires in rows:
+            slot = self._slots.get(client_key)
+            if slot is None:
+                slot = self._allocate(client_key, last_refill)
+            self.tokens[slot] = tokens
+            self.last_refill[slot] = last_refill
+            self.capacities[slot] = capacity
+            self.refills[slot] = refill
+            self.scales[slot] = scale
+            self.expires[slot] = expires
+
+    def memory_bytes(self) -> dict:
+        columns = sum(column.buffer_info()[1] * column.itemsize for column in
+                      (self.tokens, self.last_refill, self.capacities, self.refills, self.scales, self.expires))
+        index = sys.getsizeof(self._slots) + sys.getsizeof(self._keys) + sys.getsizeof(self._free)
+        return {"columns": columns, "index": index}
+
+
+def simulate_requests(events: list, rate_config: dict) -> list:
+    limit, per_seconds = rate_pair(rate_config["refill_per_sec"])
+    engine = TokenBucketEngine(rate_config["capacity"], limit, per_seconds, rate_config.get("start_tokens"))
+    # First decision per (client_key, timestamp, request_id), plus the same ids
+    # in arrival order so expired ones are dropped from the front
+    seen = {}
+    expiry = deque()
+    decisions = []
+    for event in events:
+        now = event["timestamp"]
+        while expiry and expiry[0][0] <= now:
+            seen.pop(expiry.popleft()[1], None)
+        request_id = event.get("request_id")
+        if request_id is not None:
+            replay_key = (event["client_key"], now, request_id)
+            first = seen.get(replay_key)
+            if first is not None and first[0] + IDEMPOTENCY_WINDOW > now:
+                decisions.append(dict(first[1], replayed=True))
+                continue
+        decision = engine.check_and_consume(event["client_key"], now, event.get("cost", 1))
+        if request_id is not None:
+            seen[replay_key] = (now, decision)
+            expiry.append((now + IDEMPOTENCY_WINDOW, replay_key))
+        decisions.append(decision)
+    return decisions
+
+
+def benchmark_engine(num_keys: int, batch_size: int = 100_000, baseline_sample: int = 100_000) -> dict:
+    keys = [f"user:user_{i}|tier:standard" for i in range(num_keys)]
+    base = 1730812800
+
+    # Dict-per-key baseline, measured on a sample and scaled per key
+    sample = keys[:baseline_sample]
+    tracemalloc.start()
+    state = {key: {"tokens": 10, "last_refill": base, "capacity": 10, "refill_per_sec": 1} for key in sample}
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del state
+
+    tracemalloc.start()
+    engine = TokenBucketEngine(10, 1)
+    for start in range(0, num_keys, batch_size):
+        chunk = keys[start:start + batch_size]
+        engine.check_and_consume_many(chunk, [base] * len(chunk), [1] * len(chunk), sweep_budget=0)
+    engine_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    chunk = keys[::max(1, num_keys // batch_size)][:batch_size]
+    nows, costs = [base + 1] * len(chunk), [2] * len(chunk)
+    start = time.perf_counter()
+    engine.check_and_consume_many(chunk, nows, costs)
+    batch = time.perf_counter() - start
+    start = time.perf_counter()
+    for client_key in chunk:
+        engine.check_and_consume(client_key, base + 2, 2)
+    single = time.perf_counter() - start
+    return {
+        "keys": num_keys,
+        "dict_bytes_per_key": round(dict_bytes / len(sample)),
+        "engine_bytes_per_key": round(engine_bytes / num_keys),
+        "engine_state_bytes_per_key": round(engine.memory_bytes()["columns"] / num_keys),
+        "batch_ops_per_sec": round(len(chunk) / batch),
+        "single_ops_per_sec": round(len(chunk) / single)
+    }
+
+
+if __name__ == "__main__":
+    data = {
+      "events": [
+        {"client_key": "user:user_42|tier:premium", "timestamp": 1730812800, "cost": 2},
+        {"client_key": "user:user_42|tier:premium", "timestamp": 1730812801, "cost": 2},
+        {"client_key": "user:user_42|tier:premium", "timestamp": 1730812859, "cost": 5},
+        {"client_key": "user:user_42|tier:premium", "timestamp": 1730812860, "cost": 5},
+        {"client_key": "ip:198.51.100.9|ep:/v1/search", "timestamp": 1730812860, "cost": 2}
+      ],
+      "rate_config": {
+        "capacity": 10,
+        "refill_per_sec": 1,
+        "start_tokens": 10
+      }
+    }
+    print("=== Simulation ===")
+    for decision in simulate_requests(data["events"], data["rate_config"]):
+        print(decision)
+
+    print("\n=== Idempotent Replay ===")
+    events = [
+        {"client_key": "user:1", "timestamp": 1730812800, "cost": 6, "request_id": "r1"},
+        {"client_key": "user:1", "timestamp": 1730812800, "cost": 6, "request_id": "r1"},
+        {"client_key": "user:1", "timestamp": 1730812800, "cost": 6, "request_id": "r2"}
+    ]
+    for decision in simulate_requests(events, data["rate_config"]):
+        print(decision)
+    # -> r1 allowed, r1 replayed (no tokens consumed), r2 denied
+
+    print("\n=== Fractional Rate, Expiry Sweep ===")
+    engine = TokenBucketEngine(1000, 1000, per_seconds=3600, ttl=60)
+    print(engine.check_and_consume("user:user_007|tier:standard", 1730812890, 1000))
+    print(engine.check_and_consume("user:user_007|tier:standard", 1730812890 + 36, 10))
+    # -> 36s at 1000 per 3600s is 36000 units of 1/3600 token: 10 tokens, no rounding
+    print(engine.sweep(1730812890 + 200), "expired key(s) swept,", len(engine), "left")
+
+    print("\n=== Benchmark ===")
+    # Pass key counts to benchmark larger tables, e.g. 1000000 10000000
+    for num_keys in [int(arg) for arg in sys.argv[1:]] or [200_000]:
+        print(benchmark_engine(num_keys))
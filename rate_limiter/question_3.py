@@ -0,0 +1,134 @@
+"""
+Q3: Atomic Redis Check (simulate the Lua boundary)
+
+Background:
+-----------
+    atomic_check_and_consume(state, op) -> {allowed, remaining, reset_epoch, new_state}
+
+`state` stands in for Redis: one hash per client_key holding tokens,
+last_refill, capacity and refill_per_sec. `op` is
+{"client_key", "now", "cost", "ttl"}.
+
+Part A:
+    - Refill + decision + consume + TTL set happen in one function with no
+      reads outside it, mirroring a Lua script. Absent keys start full with
+      last_refill = now.
+
+Part B:
+    - Per-key `capacity` / `refill_per_sec` stored in the hash override the
+      op defaults.
+
+Part C:
+    - `op.endpoint_cost` overrides `cost`.
+
+reset_epoch is when the bucket is full again after an allowed call, or when
+it holds `cost` tokens again after a denied one. `state` is updated in place
+(as Redis would be) and returned as new_state. Every result also reports the
+bucket's effective capacity and refill_per_sec, so callers can see when a
+stored per-key value overrode what they sent. An op with `force` set debits
+whatever is available without denying; it is used to sync back usage that
+was admitted locally while the backend was down (question_5).
+atomic_check_and_consume_many runs a list of ops as one script call, the way
+a pipelined EVAL batch would; atomic_check_and_consume_all checks several
+keys together and consumes from all of them or none.
+"""
+
+import math
+
+
+def _refilled_bucket(state: dict, op: dict) -> dict:
+    client_key = op["client_key"]
+    now = op["now"]
+    bucket = state.get(client_key)
+    if bucket is None:
+        capacity = op.get("capacity", 10)
+        bucket = state[client_key] = {
+            "tokens": capacity,
+            "last_refill": now,
+            "capacity": capacity,
+            "refill_per_sec": op.get("refill_per_sec", 1)
+        }
+    elapsed = now - bucket["last_refill"]
+    if elapsed > 0:
+        bucket["tokens"] = min(bucket["capacity"], bucket["tokens"] + elapsed * bucket["refill_per_sec"])
+        bucket["last_refill"] = now
+    return bucket
+
+
+def _settle(bucket: dict, op: dict, cost, consume: bool) -> dict:
+    capacity = bucket["capacity"]
+    rate = bucket["refill_per_sec"]
+    tokens = bucket["tokens"]
+    if consume:
+        tokens = bucket["tokens"] = max(0, tokens - cost)
+        missing = capacity - tokens
+    else:
+        missing = max(0, cost - tokens)
+    if "ttl" in op:
+        bucket["ttl"] = op["ttl"]
+    return {
+        "allowed": consume,
+        "remaining": math.floor(tokens),
+        "capacity": capacity,
+        "refill_per_sec": rate,
+        # Rounded first so float rates such as 10/60 do not push an exact
+        # boundary up a whole second
+        "reset_epoch": op["now"] + (math.ceil(round(missing / rate, 9)) if rate else 0)
+    }
+
+
+def atomic_check_and_consume(state: dict, op: dict) -> dict:
+    cost = op.get("endpoint_cost", op.get("cost", 1))
+    bucket = _refilled_bucket(state, op)
+    result = _settle(bucket, op, cost, bool(op.get("force")) or bucket["tokens"] >= cost)
+    result["new_state"] = state
+    return result
+
+
+def atomic_check_and_consume_all(state: dict, ops: list) -> dict:
+    """
+    All-or-nothing across several keys (one multi-key script): every bucket
+    is refilled and checked first, and tokens are consumed from all of them
+    only if every check passes.
+    """
+    buckets = [_refilled_bucket(state, op) for op in ops]
+    costs = [op.get("endpoint_cost", op.get("cost", 1)) for op in ops]
+    checks = [bucket["tokens"] >= cost for bucket, cost in zip(buckets, costs)]
+    passes = all(checks)
+    results = []
+    for bucket, op, cost, allowed in zip(buckets, ops, costs, checks):
+        result = _settle(bucket, op, cost, passes)
+        # Per-key verdict, even when another key's denial kept this one unconsumed
+        result["allowed"] = allowed
+        results.append(result)
+    return {"passes": passes, "results": results}
+
+
+def atomic_check_and_consume_many(state: dict, ops: list) -> list:
+    results = []
+    for op in ops:
+        result = atomic_check_and_consume(state, op)
+        del result["new_state"]
+        results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    data = {
+      "state": {
+        "user:user_42|tier:premium": {"tokens": 7, "last_refill": 1730812850, "capacity": 10, "refill_per_sec": 1}
+      },
+      "op": {"client_key": "user:user_42|tier:premium", "now": 1730812860, "cost": 5, "ttl": 3600}
+    }
+    print("=== Check and Consume ===")
+    print(atomic_check_and_consume(data["state"], data["op"]))
+    # -> refilled to capacity (10), 5 consumed
+
+    print("\n=== Endpoint Cost Override, Absent Key ===")
+    print(atomic_check_and_consume(data["state"], dict(data["op"], endpoint_cost=8)))
+    # -> denied, 5 tokens left
+    print(atomic_check_and_consume(data["state"], {"client_key": "ip:198.51.100.9", "now": 1730812860, "cost": 2, "ttl": 60}))
+
+    print("\n=== Batch ===")
+    ops = [{"client_key": "user:1", "now": 1730812860 + i, "cost": 4} for i in range(4)]
+    print(atomic_check_and_consume_many({}, ops))
@@ -0,0 +1,404 @@
+"""
+Q4: Mixed-Limit Decision Composer (user AND ip AND endpoint)
+
+Background:
+-----------
+    final_decision(request, config, redis_state) -> {passes, headers, audit}
+
+Part A:
+    - Three independent token checks (user / ip / endpoint); deny if any denies.
+
+Part B:
+    - Headers reflect the most restrictive rule's limit / remaining / reset.
+
+Part C:
+    - A missing scope (e.g. anonymous caller, no user) is skipped cleanly.
+
+Checking the scopes one atomic_check_and_consume call at a time costs three
+backend round trips per request, and tokens taken from the user bucket are
+not given back when the ip check then denies. Here all checks of a request
+go to the backend as one group that atomic_check_and_consume_all (question_3)
+consumes all-or-nothing. PipelinedDecider also coalesces the groups of every
+request that arrives during the same event-loop tick into one frame, so many
+concurrent requests share a single round trip.
+
+RedisStandIn is a local asyncio TCP server speaking length-prefixed JSON
+frames, with an optional per-frame latency to model the network.
+SequentialDecider keeps the three-round-trip path for comparison.
+"""
+
+import asyncio
+import importlib.util
+import json
+import struct
+import time
+from pathlib import Path
+
+from question_1 import CompiledRules, resolve_identity, resolve_request_limits
+from question_3 import atomic_check_and_consume, atomic_check_and_consume_all
+
+# Latency percentiles come from the single helper in iam/stats.py. It is loaded
+# by path because iam/ has its own question_N modules that must not shadow ours.
+_stats_spec = importlib.util.spec_from_file_location("iam_stats", Path(__file__).resolve().parent.parent / "iam" / "stats.py")
+_stats = importlib.util.module_from_spec(_stats_spec)
+_stats_spec.loader.exec_module(_stats)
+_percentile = _stats.percentile
+
+SCOPES = ("user", "ip", "endpoint")
+_FRAME = struct.Struct(">I")
+
+
+def limit_ops(request: dict, config: dict, compiled: CompiledRules = None) -> list:
+    """
+    (scope, limit, op) for every scope that applies to the request, where
+    limit is (limit, per_seconds, rule_id). Each scope's limit is resolved by
+    RouteEntry.resolve, the same path resolve_request_limits (question_1)
+    takes, so rule conditions and limit multipliers apply here too.
+    """
+    compiled = CompiledRules(config) if compiled is None else compiled
+    entry = compiled.route(request["path"])
+    identity = resolve_identity(request, config, ("user_id",))
+    path = request["path"].split("?", 1)[0]
+    keys = {
+        "user": identity["client_key"] if identity["kind"] == "user_id" else None,
+        "ip": f"ip:{identity['ip']}|ep:{path}" if identity["ip"] else None,
+        "endpoint": f"ep:{path}"
+    }
+    ops = []
+    for scope in SCOPES:
+        if keys[scope] is None:
+            continue
+        _, best, _ = entry.resolve((scope,), identity["claims"])
+        if best is None:
+            continue
+        limit, per_seconds, _ = best
+        ops.append((scope, best, {
+            "client_key": keys[scope],
+            "now": request["now_epoch"],
+            "cost": entry.cost,
+            "capacity": limit,
+            "refill_per_sec": limit / per_seconds
+        }))
+    return ops
+
+
+def compose(request: dict, scoped: list, results: list, passes: bool) -> dict:
+    decisions = []
+    for (scope, (_, _, rule_id), _), result in zip(scoped, results):
+        decision = {"scope": scope, "rule": rule_id, "allowed": result["allowed"], "remaining": result["remaining"]}
+        if not result["allowed"]:
+            decision["reset_epoch"] = result["reset_epoch"]
+        decisions.append(decision)
+    if not decisions:
+        return {"passes": True, "headers": {}, "audit": {"decisions": [], "most_restrictive": None}}
+
+    # Denied scopes first, then the one with the smallest share of its limit left
+    index = min(range(len(decisions)), key=lambda i: (
+        results[i]["allowed"], results[i]["remaining"] / scoped[i][1][0]
+    ))
+    (limit, _, rule_id), result = scoped[index][1], results[index]
+    headers = {
+        "X-RateLimit-Limit": str(limit),
+        "X-RateLimit-Remaining": str(result["remaining"]),
+        "X-RateLimit-Reset": str(result["reset_epoch"])
+    }
+    if not passes:
+        headers["Retry-After"] = str(max(1, result["reset_epoch"] - request["now_epoch"]))
+    return {"passes": passes, "headers": headers, "audit": {"decisions": decisions, "most_restrictive": rule_id}}
+
+
+def final_decision(request: dict, config: dict, redis_state: dict, compiled: CompiledRules = None) -> dict:
+    scoped = limit_ops(request, config, compiled)
+    outcome = atomic_check_and_consume_all(redis_state, [op for _, _, op in scoped])
+    return compose(request, scoped, outcome["results"], outcome["passes"])
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> dict:
+    (length,) = _FRAME.unpack(await reader.readexactly(_FRAME.size))
+    return json.loads(await reader.readexactly(length))
+
+
+def _write_frame(writer: asyncio.StreamWriter, message: dict) -> None:
+    body = json.dumps(message, separators=(",", ":")).encode()
+    writer.write(_FRAME.pack(len(body)) + body)
+
+
+class RedisStandIn:
+    """
+    Local TCP backend. Frames are {"id", "cmd", ...}: CHECK runs one
+    atomic_check_and_consume, CHECK_ALL_MANY runs one all-or-nothing group
+    per entry of "groups". Each frame executes in one event-loop step, so a
+    script is atomic with respect to every other client.
+    """
+
+    def __init__(self, state: dict = None, latency_ms: float = 0.0):
+        self.state = {} if state is None else state
+        self.latency_ms = latency_ms
+        self.frames = 0
+        self._server = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        self._server = await asyncio.start_server(self._serve, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                message = await _read_frame(reader)
+                asyncio.ensure_future(self._reply(message, writer))
+        except asyncio.IncompleteReadError:
+            writer.close()
+
+    async def _reply(self, message: dict, writer: asyncio.StreamWriter) -> None:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        self.frames += 1
+        if message["cmd"] == "CHECK":
+            result = atomic_check_and_consume(self.state, message["op"])
+            del result["new_state"]
+        elif message["cmd"] == "CHECK_ALL_MANY":
+            result = [atomic_check_and_consume_all(self.state, ops) for ops in message["groups"]]
+        else:
+            result = {"error": f"Unknown command {message['cmd']}"}
+        _write_frame(writer, {"id": message["id"], "result": result})
+
+    async def close(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+
+class BackendConnection:
+    """One multiplexed connection: frames carry ids, so calls may overlap."""
+
+    def __init__(self):
+        self.round_trips = 0
+        self._next_id = 0
+        self._pending = {}
+        self._reader = self._writer = self._listener = None
+        self._closed = False
+
+    async def connect(self, host: str, port: int) -> "BackendConnection":
+        self._reader, self._writer = await asyncio.open_connection(host, port)
+        self._listener = asyncio.ensure_future(self._listen())
+        return self
+
+    async def _listen(self) -> None:
+        try:
+            while True:
+                message = await _read_frame(self._reader)
+                future = self._pending.pop(message["id"], None)
+                # The caller may have given up on this reply (cancelled / timed out)
+                if future is not None and not future.done():
+                    future.set_result(message["result"])
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            # Also runs when close() cancels the listener, so no caller is left waiting
+            self._closed = True
+            pending, self._pending = self._pending, {}
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("backend connection closed"))
+
+    def send(self, message: dict) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        if self._closed:
+            future.set_exception(ConnectionError("backend connection is closed"))
+            return future
+        self._next_id += 1
+        self._pending[self._next_id] = future
+        self.round_trips += 1
+        _write_frame(self._writer, dict(message, id=self._next_id))
+        return future
+
+    async def close(self) -> None:
+        self._closed = True
+        self._listener.cancel()
+        # Let the listener's cleanup fail the pending calls before returning
+        await asyncio.gather(self._listener, return_exceptions=True)
+        self._writer.close()
+        await self._writer.wait_closed()
+
+
+class SequentialDecider:
+    """One CHECK round trip per scope; an earlier scope's tokens stay consumed if a later one denies."""
+
+    def __init__(self, connection: BackendConnection, config: dict):
+        self.connection = connection
+        self.config = config
+        self.compiled = CompiledRules(config)
+
+    async def decide(self, request: dict) -> dict:
+        scoped = limit_ops(request, self.config, self.compiled)
+        results = []
+        for _, _, op in scoped:
+            results.append(await self.connection.send({"cmd": "CHECK", "op": op}))
+        return compose(request, scoped, results, all(result["allowed"] for result in results))
+
+
+class PipelinedDecider:
+    """
+    Queues each request's all-or-nothing group and flushes every group queued
+    during the current loop tick (up to max_batch) as one CHECK_ALL_MANY frame.
+    """
+
+    def __init__(self, connection: BackendConnection, config: dict, max_batch: int = 1000):
+        self.connection = connection
+        self.config = config
+        self.compiled = CompiledRules(config)
+        self.max_batch = max_batch
+        self._queued = []
+        self._flush_scheduled = False
+
+    async def decide(self, request: dict) -> dict:
+        scoped = limit_ops(request, self.config, self.compiled)
+        future = asyncio.get_running_loop().create_future()
+        self._queued.append(([op for _, _, op in scoped], future))
+        if len(self._queued) >= self.max_batch:
+            self._flush()
+        elif not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._flush)
+        outcome = await future
+        return compose(request, scoped, outcome["results"], outcome["passes"])
+
+    def _flush(self) -> None:
+        self._flush_scheduled = False
+        queued, self._queued = self._queued, []
+        if not queued:
+            return
+        reply = self.connection.send({"cmd": "CHECK_ALL_MANY", "groups": [ops for ops, _ in queued]})
+
+        def deliver(reply: asyncio.Future) -> None:
+            # Skip callers whose decide() was cancelled; the rest still get answers
+            if reply.exception() is not None:
+                for _, future in queued:
+                    if not future.done():
+                        future.set_exception(reply.exception())
+                return
+            for (_, future), outcome in zip(queued, reply.result()):
+                if not future.done():
+                    future.set_result(outcome)
+
+        reply.add_done_callback(deliver)
+
+
+async def benchmark_round_trips(clients: int = 200, requests_per_client: int = 10, latency_ms: float = 0.5) -> list:
+    config = {
+        "endpoint_costs": {"/v1/search": 2},
+        "rules": [
+            {"id": "user_hour", "applies_to": "user", "endpoints": ["*"], "limit": 10_000_000, "per_seconds": 3600},
+            {"id": "ip_min", "applies_to": "ip", "endpoints": ["/v1/search"], "limit": 10, "per_seconds": 60},
+            {"id": "endpoint_global", "applies_to": "endpoint", "endpoints": ["/v1/search"], "limit": 5_000_000, "per_seconds": 60}
+        ],
+        "jwt_claims": {"sub": "user_007", "tier": "standard"}
+    }
+    reports = []
+    for decider_class in (SequentialDecider, PipelinedDecider):
+        server = RedisStandIn(latency_ms=latency_ms)
+        port = await server.start()
+        connection = await BackendConnection().connect("127.0.0.1", port)
+        decider = decider_class(connection, config)
+        latencies = []
+
+        async def client(number: int) -> None:
+            for i in range(requests_per_client):
+                request = {
+                    "path": "/v1/search",
+                    "headers": {"Authorization": "Bearer eyJ...", "X-Forwarded-For": f"198.51.{number // 250}.{number % 250}"},
+                    "ip": "203.0.113.7",
+                    "now_epoch": 1730812900 + i
+                }
+                started = time.perf_counter()
+                await decider.decide(request)
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client(number) for number in range(clients)))
+        elapsed = time.perf_counter() - started
+        reports.append({
+            "path": decider_class.__name__,
+            "requests": len(latencies),
+            "round_trips": connection.round_trips,
+            "requests_per_sec": round(len(latencies) / elapsed),
+            "p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+            "p99_ms": round(_percentile(latencies, 99) * 1000, 3)
+        })
+        await connection.close()
+        await server.close()
+    return reports
+
+
+if __name__ == "__main__":
+    data = {
+      "request": {
+        "path": "/v1/search",
+        "headers": {"Authorization": "Bearer eyJ...", "X-Forwarded-For": "198.51.100.9"},
+        "ip": "203.0.113.7",
+        "now_epoch": 1730812900
+      },
+      "config": {
+        "endpoint_costs": {"/v1/search": 2},
+        "rules": [
+          {"id": "user_hour", "applies_to": "user", "endpoints": ["*"], "limit": 1000, "per_seconds": 3600},
+          {"id": "ip_min", "applies_to": "ip", "endpoints": ["/v1/search"], "limit": 10, "per_seconds": 60},
+          {"id": "endpoint_global", "applies_to": "endpoint", "endpoints": ["/v1/search"], "limit": 5000, "per_seconds": 60}
+        ],
+        "jwt_claims": {"sub": "user_007", "tier": "standard"}
+      },
+      "redis_state": {
+        "user:user_007|tier:standard": {"tokens": 10, "last_refill": 1730812890, "capacity": 1000, "refill_per_sec": 1000 / 3600},
+        "ip:198.51.100.9|ep:/v1/search": {"tokens": 1, "last_refill": 1730812898, "capacity": 10, "refill_per_sec": 10 / 60},
+        "ep:/v1/search": {"tokens": 3000, "last_refill": 1730812890, "capacity": 5000, "refill_per_sec": 5000 / 60}
+      }
+    }
+    print("=== Final Decision ===")
+    print(final_decision(data["request"], data["config"], data["redis_state"]))
+    # -> ip_min denies; user and endpoint buckets are left untouched
+    print("user tokens after the denied request (refilled, nothing consumed):",
+          round(data["redis_state"]["user:user_007|tier:standard"]["tokens"], 2))
+
+    print("\n=== Anonymous Caller ===")
+    anonymous = dict(data["request"], headers={"X-Forwarded-For": "198.51.100.10"})
+    print(final_decision(anonymous, data["config"], data["redis_state"]))
+    # -> user scope skipped
+
+    print("\n=== Conditional and Multiplier Rules ===")
+    tiered = {
+        "rules": [
+            {"id": "auth_user_hour", "applies_to": "user", "endpoints": ["*"], "limit": 1000, "per_seconds": 3600},
+            {"id": "premium_boost", "applies_to": "user", "endpoints": ["*"], "limit_multiplier": 10, "condition": "tier=='premium'"},
+            {"id": "free_only", "applies_to": "user", "endpoints": ["*"], "limit": 5, "per_seconds": 3600, "condition": "tier=='free'"}
+        ]
+    }
+    for tier, expected in (("premium", 10000), ("free", 5), ("standard", 1000)):
+        config = dict(tiered, jwt_claims={"sub": "user_9", "tier": tier})
+        (_, (limit, per_seconds, rule_id), op), = limit_ops(data["request"], config)
+        reference = resolve_request_limits(data["request"], config)
+        assert (limit, per_seconds) == (reference["effective_limit"], reference["effective_per_seconds"]) == (expected, 3600)
+        assert op["capacity"] == expected
+        print(tier, rule_id, f"{limit}/{per_seconds}s")
+    # -> premium 10000/3600s, free 5/3600s, standard 1000/3600s (same as question_1)
+
+    print("\n=== Closing With a Call In Flight ===")
+
+    async def close_with_pending() -> str:
+        server = RedisStandIn(latency_ms=200)
+        connection = await BackendConnection().connect("127.0.0.1", await server.start())
+        pending = asyncio.ensure_future(PipelinedDecider(connection, data["config"]).decide(data["request"]))
+        await asyncio.sleep(0.05)
+        await connection.close()
+        try:
+            await asyncio.wait_for(pending, 1)
+        except ConnectionError as error:
+            return f"decide() failed with ConnectionError: {error}"
+        finally:
+            await server.close()
+        raise AssertionError("decide() resolved although its connection was closed")
+
+    print(asyncio.run(close_with_pending()))
+    # -> fails right away instead of hanging
+
+    print("\n=== Sequential vs Pipelined (0.5ms simulated backend latency) ===")
+    for report in asyncio.run(benchmark_round_trips()):
+        print(report)
@@ -0,0 +1,304 @@
+"""
+Q5: Failure Modes & Circuit Breaker (fail-closed default)
+
+Background:
+-----------
+    guarded_check(op, mode, cb_config, redis_call) -> decision
+
+Part A:
+    - If the Redis call errors, follow `mode`: fail_closed denies (429),
+      fail_open allows.
+
+Part B:
+    - Circuit breaker: when the error ratio over the last `window_sec`
+      reaches `error_threshold`, trip to circuit_open for `cooldown_sec`
+      (treated as fail-closed).
+
+Part C:
+    - Emit structured events (rate-limiter.circuit_opened, counts, window) as
+      return metadata.
+
+Neither fail mode is good during a brownout: one drops all traffic, the
+other removes the limit. ResilientLimiterClient adds a third mode,
+"fallback". Every backend call runs under a deadline the client enforces
+itself. While the backend is failing or the circuit is open, each of the
+`num_nodes` limiter nodes enforces capacity/num_nodes (and refill/num_nodes)
+in local buckets, so the cluster as a whole stays close to the real limit.
+The client's rate_config only seeds keys the backend does not have yet;
+limits stored per key in the backend win (question_3 Part B), and the local
+buckets follow the limits last reported for each key. Once a call succeeds
+again, the usage admitted locally is replayed into the backend buckets at
+the timestamps it was admitted, so the refill that happened during the
+outage is credited, before normal operation resumes. After the cooldown the
+breaker lets one probe through (half-open) and closes on success.
+
+FakeRedis runs atomic_check_and_consume (question_3) in process and injects
+latency and failures for the demo.
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from question_2 import TokenBucketEngine, rate_pair
+from question_3 import atomic_check_and_consume, atomic_check_and_consume_many
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class SlidingWindowBreaker:
+    """Error-rate circuit breaker over the calls of the last `window_sec` seconds."""
+
+    def __init__(self, window_sec: float = 30, error_threshold: float = 0.25, cooldown_sec: float = 60, min_calls: int = 1):
+        self.window_sec = window_sec
+        self.error_threshold = error_threshold
+        self.cooldown_sec = cooldown_sec
+        self.min_calls = min_calls
+        self.state = CLOSED
+        self.opened_at = None
+        self._calls = deque()
+        self._errors = 0
+
+    @classmethod
+    def from_config(cls, cb_config: dict) -> "SlidingWindowBreaker":
+        return cls(cb_config["window_sec"], cb_config["error_threshold"], cb_config["cooldown_sec"],
+                   cb_config.get("min_calls", 1))
+
+    def _expire(self, now: float) -> None:
+        calls = self._calls
+        while calls and calls[0][0] <= now - self.window_sec:
+            if calls.popleft()[1]:
+                self._errors -= 1
+
+    def allow(self, now: float) -> bool:
+        """Whether a backend call may be attempted now; moves open -> half-open after the cooldown."""
+        if self.state == OPEN and now >= self.opened_at + self.cooldown_sec:
+            self.state = HALF_OPEN
+        return self.state != OPEN
+
+    def record(self, now: float, failed: bool) -> list:
+        """Record a call outcome and return the state-change events it caused."""
+        if self.state == HALF_OPEN:
+            if failed:
+                return self._open(now, "probe_failed")
+            self.state = CLOSED
+            self._calls.clear()
+            self._errors = 0
+            return [{"event": "rate-limiter.circuit_closed", "at": now}]
+        self._calls.append((now, failed))
+        self._errors += failed
+        self._expire(now)
+        calls = len(self._calls)
+        if failed and calls >= self.min_calls and self._errors / calls >= self.error_threshold:
+            return self._open(now, "error_threshold")
+        return []
+
+    def _open(self, now: float, reason: str) -> list:
+        self.state = OPEN
+        self.opened_at = now
+        return [{
+            "event": "rate-limiter.circuit_opened",
+            "reason": reason,
+            "errors": self._errors,
+            "calls": len(self._calls),
+            "window_sec": self.window_sec,
+            "cooldown_sec": self.cooldown_sec,
+            "at": now
+        }]
+
+
+def guarded_check(op: dict, mode: str, cb_config: dict, redis_call, breaker: SlidingWindowBreaker = None,
+                  fallback=None) -> dict:
+    """
+    Run one rate-limit check through the breaker. Pass the same `breaker`
+    across calls to keep its window; `fallback(op)` is required for
+    mode == "fallback" and decides locally when the backend cannot.
+    """
+    breaker = SlidingWindowBreaker.from_config(cb_config) if breaker is None else breaker
+    now = op["now"]
+    if not breaker.allow(now):
+        if mode == "fallback":
+            return dict(fallback(op), mode_used="fallback", events=[])
+        return {"allowed": False, "mode_used": "circuit_open", "events": []}
+    try:
+        result = redis_call(op)
+    except (ConnectionError, TimeoutError) as error:
+        events = breaker.record(now, True)
+        if mode == "fallback":
+            return dict(fallback(op), mode_used="fallback", error=type(error).__name__, events=events)
+        return {"allowed": mode == "fail_open", "mode_used": mode, "error": type(error).__name__, "events": events}
+    events = breaker.record(now, False)
+    return {"allowed": result["allowed"], "remaining": result["remaining"], "reset_epoch": result["reset_epoch"],
+            "mode_used": "normal", "events": events}
+
+
+class FakeRedis:
+    """
+    In-process Redis stand-in. `latency_ms` and `failure_rate` can be changed
+    at any time to simulate a brownout; `down` makes every call fail.
+    Scripts run one at a time, as on a single-threaded Redis.
+    """
+
+    def __init__(self, latency_ms: float = 0.2, failure_rate: float = 0.0, seed: int = 7):
+        self.state = {}
+        self.latency_ms = latency_ms
+        self.failure_rate = failure_rate
+        self.down = False
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _round_trip(self) -> None:
+        self.calls += 1
+        if self.down or self._random.random() < self.failure_rate:
+            raise ConnectionError("redis unavailable")
+        time.sleep(self.latency_ms / 1000)
+
+    def check_and_consume(self, op: dict) -> dict:
+        self._round_trip()
+        with self._lock:
+            result = atomic_check_and_consume(self.state, op)
+        del result["new_state"]
+        return result
+
+    def check_and_consume_many(self, ops: list) -> list:
+        self._round_trip()
+        with self._lock:
+            return atomic_check_and_consume_many(self.state, ops)
+
+
+class ResilientLimiterClient:
+
+    def __init__(self, redis: FakeRedis, rate_config: dict, cb_config: dict, mode: str = "fallback",
+                 num_nodes: int = 1, timeout_ms: float = 50):
+        self.redis = redis
+        self.rate_config = rate_config
+        self.mode = mode
+        self.num_nodes = num_nodes
+        self.timeout_ms = timeout_ms
+        self.breaker = SlidingWindowBreaker.from_config(cb_config)
+        self.local = self._local_buckets()
+        self._limits = {}
+        self._local_limits = set()
+        self._unsynced = {}
+        self.events = []
+        # Calls run on worker threads so the deadline holds however long the backend takes
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="limiter-backend")
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _local_buckets(self) -> TokenBucketEngine:
+        capacity = max(1, self.rate_config["capacity"] // self.num_nodes)
+        limit, per_seconds = rate_pair(self.rate_config["refill_per_sec"])
+        return TokenBucketEngine(capacity, limit, per_seconds * self.num_nodes)
+
+    def _call(self, method, argument):
+        future = self._executor.submit(method, argument)
+        try:
+            return future.result(timeout=self.timeout_ms / 1000)
+        except FutureTimeout:
+            # The script may still run late; its result is simply dropped
+            future.cancel()
+            raise TimeoutError(f"redis call exceeded {self.timeout_ms}ms") from None
+
+    def _remote(self, op: dict) -> dict:
+        if self._unsynced:
+            self.sync()
+        result = self._call(self.redis.check_and_consume, self._backend_op(op))
+        self._limits[op["client_key"]] = (result["capacity"], result["refill_per_sec"])
+        return result
+
+    def _backend_op(self, op: dict) -> dict:
+        # Defaults for keys the backend does not hold yet; stored per-key limits take precedence
+        return dict(op, capacity=self.rate_config["capacity"], refill_per_sec=self.rate_config["refill_per_sec"])
+
+    def _fallback(self, op: dict) -> dict:
+        client_key, now = op["client_key"], op["now"]
+        cost = op.get("endpoint_cost", op.get("cost", 1))
+        if client_key in self._limits and client_key not in self._local_limits:
+            capacity, refill_per_sec = self._limits[client_key]
+            limit, per_seconds = rate_pair(refill_per_sec)
+            self.local.override(client_key, now, max(1, capacity // self.num_nodes), limit, per_seconds * self.num_nodes)
+            self._local_limits.add(client_key)
+        decision = self.local.check_and_consume(client_key, now, cost)
+        if decision["allowed"]:
+            admitted = self._unsynced.setdefault(client_key, [])
+            if admitted and admitted[-1][0] == now:
+                admitted[-1][1] += cost
+            else:
+                admitted.append([now, cost])
+        return decision
+
+    def sync(self) -> int:
+        """
+        Replay usage admitted locally into the backend buckets, in one
+        pipelined call, at the timestamps it was admitted; then drop the
+        local buckets. Nothing is dropped if the call fails.
+        """
+        ops = [
+            self._backend_op({"client_key": client_key, "now": now, "cost": cost, "force": True})
+            for client_key, admitted in self._unsynced.items()
+            for now, cost in admitted
+        ]
+        self._call(self.redis.check_and_consume_many, ops)
+        synced = len(self._unsynced)
+        self._unsynced.clear()
+        self.local = self._local_buckets()
+        self._local_limits.clear()
+        return synced
+
+    def check(self, op: dict) -> dict:
+        decision = guarded_check(op, self.mode, None, self._remote, self.breaker, self._fallback)
+        self.events.extend(decision["events"])
+        return decision
+
+
+if __name__ == "__main__":
+    data = {
+      "ops": [
+        {"client_key": "user:1", "now": 1730813000, "cost": 1},
+        {"client_key": "user:1", "now": 1730813001, "cost": 1},
+        {"client_key": "user:1", "now": 1730813002, "cost": 1},
+        {"client_key": "user:1", "now": 1730813003, "cost": 1}
+      ],
+      "redis_error_pattern": [False, True, True, False],
+      "mode": "fail_closed",
+      "cb_config": {"window_sec": 30, "error_threshold": 0.5, "cooldown_sec": 10}
+    }
+    print("=== Fail Closed With Breaker ===")
+    state = {}
+    breaker = SlidingWindowBreaker.from_config(data["cb_config"])
+    for op, fails in zip(data["ops"], data["redis_error_pattern"]):
+        def redis_call(op, fails=fails):
+            if fails:
+                raise ConnectionError("redis unavailable")
+            return atomic_check_and_consume(state, op)
+        print(guarded_check(op, data["mode"], data["cb_config"], redis_call, breaker))
+    # -> normal, fail_closed (+ circuit_opened event), circuit_open, circuit_open
+
+    print("\n=== Brownout With Local Fallback (node 1 of 2) ===")
+    redis = FakeRedis()
+    client = ResilientLimiterClient(
+        redis, {"capacity": 10, "refill_per_sec": 1}, {"window_sec": 30, "error_threshold": 0.5, "cooldown_sec": 5, "min_calls": 2},
+        num_nodes=2, timeout_ms=20
+    )
+    timeline = []
+    for second in range(20):
+        if second == 3:
+            redis.latency_ms = 100
+            # -> every call now times out
+        if second == 12:
+            redis.latency_ms = 0.2
+        for _ in range(3):
+            decision = client.check({"client_key": "user:1", "now": 1730813000 + second, "cost": 1})
+            timeline.append((second, decision["mode_used"], decision["allowed"]))
+    for second in range(20):
+        row = [(mode, allowed) for s, mode, allowed in timeline if s == second]
+        print(second, row)
+    for event in client.events:
+        print(event)
+    print("backend bucket after sync:", redis.state["user:1"])
+    client.close()
@@ -0,0 +1,391 @@
+"""
+Q6: Shard Routing & Rebalance Impact (jump consistent hash)
+
+Background:
+-----------
+    assign_shards(keys, num_shards) -> mapping
+    rebalance_delta(before, after) -> moved keys
+
+Part A:
+    - Assign every client_key to a shard with jump consistent hash.
+
+Part B:
+    - Show the delta when a shard is added: only about 1/(n+1) of the keys
+      move, all of them to the new shard.
+
+Part C:
+    - Key tagging: when a key contains `{...}`, only the text inside the
+      braces is hashed, so related keys (rate:{user:user_1}:min,
+      rate:{user:user_1}:hour) land on the same shard.
+
+ShardedRateLimiter runs that routing for real: one worker process per shard,
+each owning a TokenBucketEngine (question_2) for the keys that hash to it.
+The router splits a batch by shard, writes one message per worker into a
+shared-memory ring buffer, and collects the answers from a reply ring, so all
+workers decide their part of the batch in parallel. resize() moves only the
+keys rebalance_delta reports as moved, carrying their bucket state along.
+A worker that dies mid-call raises RuntimeError in the router instead of
+leaving it blocked on the reply ring forever.
+"""
+
+import hashlib
+import os
+import struct
+import time
+from multiprocessing import Process, Semaphore
+from multiprocessing.shared_memory import SharedMemory
+
+from question_2 import TokenBucketEngine, rate_pair
+
+_HEADER = struct.Struct("<QQ")
+_LENGTH = struct.Struct("<I")
+_REQUEST = struct.Struct("<IH")
+_REPLY = struct.Struct("<Bqq")
+_ROW = struct.Struct("<qqqqqq")
+
+CHECK, KEYS, EXPORT, IMPORT, STOP = b"C", b"K", b"E", b"I", b"S"
+# How often a router waiting on a reply checks that the worker is still alive
+_LIVENESS_POLL_SEC = 0.1
+
+
+def jump_consistent_hash(key: int, num_buckets: int) -> int:
+    """Lamping & Veach jump consistent hash of a 64-bit key."""
+    bucket, jump = -1, 0
+    while jump < num_buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def hash_key(client_key: str) -> int:
+    start = client_key.find("{")
+    if start != -1:
+        end = client_key.find("}", start + 1)
+        if end > start + 1:
+            client_key = client_key[start + 1:end]
+    return int.from_bytes(hashlib.blake2b(client_key.encode(), digest_size=8).digest(), "little")
+
+
+def shard_of(client_key: str, num_shards: int) -> int:
+    return jump_consistent_hash(hash_key(client_key), num_shards)
+
+
+def assign_shards(keys: list, num_shards: int) -> dict:
+    mapping = {str(shard): [] for shard in range(num_shards)}
+    for key in keys:
+        mapping[str(shard_of(key, num_shards))].append(key)
+    return mapping
+
+
+def rebalance_delta(before: dict, after: dict) -> dict:
+    owner = {key: shard for shard, keys in before.items() for key in keys}
+    moved = [key for shard, keys in after.items() for key in keys if owner.get(key) != shard]
+    return {"count": len(moved), "which": moved}
+
+
+class ShmRing:
+    """
+    Single-producer / single-consumer byte ring in shared memory. The header
+    holds the total bytes read (head) and written (tail); each message is a
+    4-byte length plus payload and may wrap around the end of the buffer.
+    A semaphore counts published messages so the reader can block.
+    """
+
+    def __init__(self, size: int = 4 << 20):
+        self.shm = SharedMemory(create=True, size=size + _HEADER.size)
+        _HEADER.pack_into(self.shm.buf, 0, 0, 0)
+        self.capacity = size
+        self.items = Semaphore(0)
+
+    def __reduce__(self):
+        return ShmRing._attach, (self.shm.name, self.capacity, self.items)
+
+    @staticmethod
+    def _attach(name: str, capacity: int, items: Semaphore) -> "ShmRing":
+        ring = ShmRing.__new__(ShmRing)
+        ring.shm = SharedMemory(name=name)
+        ring.capacity = capacity
+        ring.items = items
+        return ring
+
+    def _copy_in(self, position: int, data: bytes) -> None:
+        offset = position % self.capacity
+        first = min(len(data), self.capacity - offset)
+        base = _HEADER.size
+        self.shm.buf[base + offset:base + offset + first] = data[:first]
+        if first < len(data):
+            self.shm.buf[base:base + len(data) - first] = data[first:]
+
+    def _copy_out(self, position: int, length: int) -> bytes:
+        offset = position % self.capacity
+        first = min(length, self.capacity - offset)
+        base = _HEADER.size
+        data = bytes(self.shm.buf[base + offset:base + offset + first])
+        if first < length:
+            data += bytes(self.shm.buf[base:base + length - first])
+        return data
+
+    def put(self, payload: bytes) -> None:
+        message = _LENGTH.pack(len(payload)) + payload
+        if len(message) > self.capacity:
+            raise ValueError(f"Message of {len(message)} bytes exceeds ring capacity {self.capacity}")
+        while True:
+            head, tail = _HEADER.unpack_from(self.shm.buf, 0)
+            if self.capacity - (tail - head) >= len(message):
+                break
+            time.sleep(0)
+        self._copy_in(tail, message)
+        struct.pack_into("<Q", self.shm.buf, 8, tail + len(message))
+        self.items.release()
+
+    def get(self, timeout: float = None) -> bytes:
+        if not self.items.acquire(timeout=timeout):
+            raise TimeoutError(f"No message within {timeout}s")
+        head, _ = _HEADER.unpack_from(self.shm.buf, 0)
+        (length,) = _LENGTH.unpack(self._copy_out(head, _LENGTH.size))
+        payload = self._copy_out(head + _LENGTH.size, length)
+        struct.pack_into("<Q", self.shm.buf, 0, head + _LENGTH.size + length)
+        return payload
+
+    def close(self, unlink: bool = False) -> None:
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _encode_keys(command: bytes, client_keys: list, costs: list = None, now: int = 0) -> bytes:
+    parts = [command, struct.pack("<qI", now, len(client_keys))]
+    for i, client_key in enumerate(client_keys):
+        encoded = client_key.encode()
+        parts.append(_REQUEST.pack(costs[i] if costs else 0, len(encoded)))
+        parts.append(encoded)
+    return b"".join(parts)
+
+
+def _decode_keys(payload: bytes) -> tuple:
+    now, count = struct.unpack_from("<qI", payload, 1)
+    position = 13
+    keys, costs = [], []
+    for _ in range(count):
+        cost, length = _REQUEST.unpack_from(payload, position)
+        position += _REQUEST.size
+        keys.append(payload[position:position + length].decode())
+        costs.append(cost)
+        position += length
+    return now, keys, costs
+
+
+def _encode_rows(rows: list) -> bytes:
+    return _encode_keys(IMPORT, [row[0] for row in rows]) + b"".join(_ROW.pack(*row[1:]) for row in rows)
+
+
+def _decode_rows(payload: bytes) -> list:
+    _, keys, _ = _decode_keys(payload)
+    position = len(payload) - _ROW.size * len(keys)
+    return [(key,) + _ROW.unpack_from(payload, position + i * _ROW.size) for i, key in enumerate(keys)]
+
+
+def _worker(requests: ShmRing, replies: ShmRing, capacity: int, refill_per_sec: float, ttl: int) -> None:
+    limit, per_seconds = rate_pair(refill_per_sec)
+    engine = TokenBucketEngine(capacity, limit, per_seconds, ttl=ttl)
+    while True:
+        payload = requests.get()
+        command = payload[:1]
+        if command == CHECK:
+            now, keys, costs = _decode_keys(payload)
+            allowed, remaining, reset_in = engine.check_and_consume_many(keys, [now] * len(keys), costs)
+            replies.put(b"".join(_REPLY.pack(*decision) for decision in zip(allowed, remaining, reset_in)))
+        elif command == KEYS:
+            replies.put(_encode_keys(KEYS, engine.keys()))
+        elif command == EXPORT:
+            replies.put(_encode_rows(engine.export_state(_decode_keys(payload)[1])))
+        elif command == IMPORT:
+            engine.load_state(_decode_rows(payload))
+            replies.put(b"")
+        else:
+            break
+    requests.close()
+    replies.close()
+
+
+class ShardedRateLimiter:
+
+    def __init__(self, num_shards: int, capacity: int, refill_per_sec: float, ttl: int = 3600, ring_bytes: int = 4 << 20,
+                 reply_timeout: float = 30.0):
+        self.capacity = capacity
+        self.refill_per_sec = refill_per_sec
+        self.ttl = ttl
+        self.ring_bytes = ring_bytes
+        self.reply_timeout = reply_timeout
+        self.workers = []
+        for _ in range(num_shards):
+            self._start_worker()
+
+    @property
+    def num_shards(self) -> int:
+        return len(self.workers)
+
+    def _start_worker(self) -> None:
+        requests, replies = ShmRing(self.ring_bytes), ShmRing(self.ring_bytes)
+        process = Process(target=_worker, args=(requests, replies, self.capacity, self.refill_per_sec, self.ttl), daemon=True)
+        process.start()
+        self.workers.append((process, requests, replies))
+
+    def _stop_worker(self) -> None:
+        process, requests, replies = self.workers.pop()
+        requests.put(STOP)
+        process.join()
+        requests.close(unlink=True)
+        replies.close(unlink=True)
+
+    def _reply(self, shard: int) -> bytes:
+        process, _, replies = self.workers[shard]
+        deadline = time.monotonic() + self.reply_timeout
+        while True:
+            try:
+                return replies.get(timeout=_LIVENESS_POLL_SEC)
+            except TimeoutError:
+                pass
+            if not process.is_alive():
+                # It may have replied just before exiting
+                try:
+                    return replies.get(timeout=0)
+                except TimeoutError:
+                    raise RuntimeError(f"Shard {shard} worker exited (code {process.exitcode}) without replying") from None
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Shard {shard} worker did not reply within {self.reply_timeout}s")
+
+    def check_many(self, client_keys: list, now: int, costs: list) -> list:
+        """Decide a batch; returns (allowed, remaining, reset_in) per key in input order."""
+        num_shards = self.num_shards
+        positions = [[] for _ in range(num_shards)]
+        for i, client_key in enumerate(client_keys):
+            positions[shard_of(client_key, num_shards)].append(i)
+        # Send every shard its part first, then collect, so workers run concurrently
+        for shard, indexes in enumerate(positions):
+            if indexes:
+                keys = [client_keys[i] for i in indexes]
+                self.workers[shard][1].put(_encode_keys(CHECK, keys, [costs[i] for i in indexes], now))
+        results = [None] * len(client_keys)
+        for shard, indexes in enumerate(positions):
+            if indexes:
+                reply = self._reply(shard)
+                for j, i in enumerate(indexes):
+                    allowed, remaining, reset_in = _REPLY.unpack_from(reply, j * _REPLY.size)
+                    results[i] = (bool(allowed), remaining, reset_in)
+        return results
+
+    def check(self, client_key: str, now: int, cost: int = 1) -> dict:
+        allowed, remaining, reset_in = self.check_many([client_key], now, [cost])[0]
+        return {"allowed": allowed, "remaining": remaining, "reset_in": reset_in}
+
+    def assignment(self) -> dict:
+        for _, requests, _ in self.workers:
+            requests.put(KEYS)
+        return {str(shard): _decode_keys(self._reply(shard))[1] for shard in range(self.num_shards)}
+
+    def resize(self, num_shards: int) -> dict:
+        """
+        Change the shard count, migrating only the keys whose jump-hash shard
+        changes. Workers for new shards are started before the move; workers
+        for removed shards are stopped after it.
+        """
+        before = self.assignment()
+        keys = [key for shard_keys in before.values() for key in shard_keys]
+        after = assign_shards(keys, num_shards)
+        delta = rebalance_delta(before, after)
+        while self.num_shards < num_shards:
+            self._start_worker()
+
+        owner = {key: int(shard) for shard, shard_keys in before.items() for key in shard_keys}
+        outgoing = {}
+        for key in delta["which"]:
+            outgoing.setdefault(owner[key], []).append(key)
+        incoming = {}
+        for shard, moved in outgoing.items():
+            self.workers[shard][1].put(_encode_keys(EXPORT, moved))
+            for row in _decode_rows(self._reply(shard)):
+                incoming.setdefault(shard_of(row[0], num_shards), []).append(row)
+        for shard, rows in incoming.items():
+            self.workers[shard][1].put(_encode_rows(rows))
+            self._reply(shard)
+
+        while self.num_shards > num_shards:
+            self._stop_worker()
+        return delta
+
+    def close(self) -> None:
+        while self.workers:
+            self._stop_worker()
+
+
+def benchmark_scaling(max_shards: int = None, num_keys: int = 100_000, batch_size: int = 20_000, batches: int = 10) -> list:
+    max_shards = max_shards or max(2, os.cpu_count() or 1)
+    keys = [f"user:user_{i}" for i in range(num_keys)]
+    results = []
+    for num_shards in range(1, max_shards + 1):
+        limiter = ShardedRateLimiter(num_shards, capacity=100, refill_per_sec=1)
+        try:
+            limiter.check_many(keys[:batch_size], 1730812800, [1] * batch_size)
+            start = time.perf_counter()
+            for batch in range(batches):
+                offset = batch * batch_size % num_keys
+                chunk = keys[offset:offset + batch_size]
+                limiter.check_many(chunk, 1730812801 + batch, [1] * len(chunk))
+            elapsed = time.perf_counter() - start
+        finally:
+            limiter.close()
+        results.append({"shards": num_shards, "checks_per_sec": round(batches * batch_size / elapsed)})
+    return results
+
+
+if __name__ == "__main__":
+    data = {
+      "keys": [
+        "user:user_1", "user:user_2", "user:user_3", "ip:198.51.100.9|ep:/v1/search",
+        "user:user_9999", "key:k_prod_XYZ", "user:user_hot"
+      ],
+      "num_shards_start": 4,
+      "num_shards_end": 5
+    }
+    print("=== Assign & Rebalance ===")
+    start = assign_shards(data["keys"], data["num_shards_start"])
+    end = assign_shards(data["keys"], data["num_shards_end"])
+    print({"start": start, "end": end, "moved_keys": rebalance_delta(start, end)})
+
+    print("\n=== Distribution (100k keys, 4 -> 5 shards) ===")
+    keys = [f"user:user_{i}" for i in range(100_000)]
+    start, end = assign_shards(keys, 4), assign_shards(keys, 5)
+    print({shard: len(shard_keys) for shard, shard_keys in end.items()}, "moved:", rebalance_delta(start, end)["count"])
+
+    print("\n=== Key Tagging ===")
+    print(assign_shards(["rate:{user:user_1}:min", "rate:{user:user_1}:hour", "user:user_1"], 8))
+
+    print("\n=== Sharded Limiter ===")
+    limiter = ShardedRateLimiter(2, capacity=10, refill_per_sec=1)
+    print(limiter.check_many(["user:user_1", "user:user_2", "user:user_1"], 1730812800, [6, 1, 6]))
+    # -> user_1 allowed then denied, whichever worker owns it
+    keys = [f"user:user_{i}" for i in range(3, 20)]
+    limiter.check_many(keys, 1730812800, [6] * len(keys))
+    moved = limiter.resize(3)
+    print("resized to 3 shards, moved:", moved)
+    print(limiter.check(moved["which"][0], 1730812800, 1))
+    # -> bucket state followed the moved key: 4 tokens left before this call
+    limiter.close()
+
+    print("\n=== Dead Worker ===")
+    limiter = ShardedRateLimiter(2, capacity=10, refill_per_sec=1, reply_timeout=5)
+    limiter.workers[shard_of("user:user_1", 2)][0].kill()
+    try:
+        limiter.check("user:user_1", 1730812800)
+        raise AssertionError("check() should fail when the shard's worker is gone")
+    except RuntimeError as error:
+        print(error)
+    # -> raised within _LIVENESS_POLL_SEC instead of blocking for good
+    limiter.close()
+
+    print("\n=== Scaling Benchmark ===")
+    print(f"{os.cpu_count()} CPU(s) available")
+    for result in benchmark_scaling():
+        print(result)